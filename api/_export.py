@@ -0,0 +1,32 @@
+"""
+Single-scan exports for GET /api/export/<id>/<format>, served by the scan
+function (see vercel.json) so they read the same result store.
+"""
+
+import io
+import json
+
+EXPORT_FORMATS = ('csv', 'json')
+
+
+def render_export(scan, format_type):
+    """Return (body, content_type, filename) for `scan` in `format_type`"""
+    scan_id = scan['id']
+    
+    if format_type == 'csv':
+        # Generate CSV
+        output = io.StringIO()
+        output.write('Question,Answer\n')
+        
+        for i, answer in enumerate(scan['answers'], 1):
+            display_answer = answer if answer else 'No Answer'
+            if answer == 'MULTIPLE':
+                display_answer = 'Multiple Answers'
+            output.write(f"Q{i},{display_answer}\n")
+        
+        return output.getvalue().encode('utf-8'), 'text/csv', f'omr_results_{scan_id}.csv'
+    
+    if format_type == 'json':
+        return json.dumps(scan, indent=2).encode('utf-8'), 'application/json', f'omr_results_{scan_id}.json'
+    
+    raise ValueError(f'Format {format_type} not supported')
@@ -0,0 +1,27 @@
+"""
+Scan history for GET /api/history, served by the scan function (see
+vercel.json) so it reads the same result store the scans were written to.
+"""
+
+HISTORY_LIMIT = 50
+
+
+def recent_history(store, limit=HISTORY_LIMIT):
+    """Summaries of the most recent scans in `store`, newest first"""
+    history = []
+    for scan in store.recent(limit):
+        score = scan['score']
+        total = scan['total_questions']
+        history.append({
+            'id': scan['id'],
+            'filename': scan.get('filename'),
+            'template': scan.get('template'),
+            'score': score,
+            'total': total,
+            'percentage': round((score / total * 100) if total > 0 else 0, 2),
+            'timestamp': scan.get('timestamp'),
+            'roll_number': scan.get('fields', {}).get('roll_number'),
+            'booklet_code': scan.get('fields', {}).get('booklet_code')
+        })
+    
+    return history
@@ -0,0 +1,161 @@
+"""
+Streaming multipart/form-data parser for the serverless handlers.
+
+The request body is read in chunks straight into one preallocated buffer and
+part boundaries are located incrementally as data arrives, so an oversized
+part is rejected before the rest of the upload is read. File parts are
+returned as memoryview slices of that buffer: ``np.frombuffer`` on them feeds
+``cv2.imdecode`` without copying the image. Does not depend on the ``cgi``
+module, which was removed in Python 3.13.
+"""
+
+CHUNK_SIZE = 64 * 1024
+
+
+class MultipartError(ValueError):
+    """Malformed multipart body"""
+
+
+class PartTooLarge(MultipartError):
+    """A part exceeded the allowed size"""
+
+
+class MultipartForm(dict):
+    """Field name -> list of values, plus the client filename of each file field"""
+    
+    def __init__(self):
+        super().__init__()
+        self.filenames = {}
+
+
+def get_boundary(content_type):
+    """Extract the boundary parameter from a multipart Content-Type header"""
+    for param in content_type.split(';')[1:]:
+        key, _, value = param.strip().partition('=')
+        if key.lower() == 'boundary' and value:
+            return value.strip().strip('"').encode('latin-1')
+    raise MultipartError('Missing multipart boundary')
+
+
+def _parse_part_headers(raw):
+    """Return (name, filename) from the headers block of one part"""
+    name = None
+    filename = None
+    
+    for line in raw.decode('utf-8', 'replace').split('\r\n'):
+        header, _, value = line.partition(':')
+        if header.strip().lower() != 'content-disposition':
+            continue
+        
+        for param in value.split(';')[1:]:
+            key, _, param_value = param.strip().partition('=')
+            param_value = param_value.strip()
+            if len(param_value) >= 2 and param_value[0] == param_value[-1] == '"':
+                param_value = param_value[1:-1]
+            if key.lower() == 'name':
+                name = param_value
+            elif key.lower() == 'filename':
+                filename = param_value
+    
+    if name is None:
+        raise MultipartError('Part without a form field name')
+    return name, filename
+
+
+def parse_multipart_stream(stream, content_type, content_length, max_part_size=None, chunk_size=CHUNK_SIZE):
+    """
+    Parse a multipart/form-data body while it is being read
+    
+    Args:
+        stream: Binary file object supporting readinto() (e.g. handler.rfile)
+        content_type: Request Content-Type header (must carry the boundary)
+        content_length: Number of body bytes to read
+        max_part_size: Reject any part larger than this many bytes
+        chunk_size: Bytes to request from the stream per read
+    
+    Returns:
+        MultipartForm mapping field names to lists of values. Text fields
+        are str, file fields are memoryview slices of the request buffer
+        (their client filenames are in the form's ``filenames`` dict).
+    """
+    boundary = get_boundary(content_type)
+    first_delimiter = b'--' + boundary
+    delimiter = b'\r\n--' + boundary
+    
+    buf = bytearray(content_length)
+    view = memoryview(buf)
+    filled = 0
+    eof = False
+    
+    fields = MultipartForm()
+    state = 'preamble'
+    pos = 0           # Start of the data not yet consumed by the state machine
+    search_from = 0   # Where the next boundary search resumes inside a part body
+    part_name = part_filename = None
+    
+    while True:
+        progressed = True
+        while progressed:
+            progressed = False
+            
+            if state == 'preamble':
+                index = buf.find(first_delimiter, pos, filled)
+                if index != -1:
+                    pos = index + len(first_delimiter)
+                    state = 'after_delimiter'
+                    progressed = True
+            
+            elif state == 'after_delimiter':
+                if filled - pos >= 2:
+                    marker = bytes(view[pos:pos + 2])
+                    if marker == b'--':
+                        return fields
+                    if marker != b'\r\n':
+                        raise MultipartError('Malformed boundary line')
+                    pos += 2
+                    state = 'headers'
+                    progressed = True
+            
+            elif state == 'headers':
+                index = buf.find(b'\r\n\r\n', pos, filled)
+                if index != -1:
+                    part_name, part_filename = _parse_part_headers(bytes(view[pos:index]))
+                    pos = search_from = index + 4
+                    state = 'body'
+                    progressed = True
+                elif filled - pos > 16 * 1024:
+                    raise MultipartError('Part headers too large')
+            
+            elif state == 'body':
+                index = buf.find(delimiter, search_from, filled)
+                if index != -1:
+                    if max_part_size is not None and index - pos > max_part_size:
+                        raise PartTooLarge(f'Field {part_name} exceeds {max_part_size} bytes')
+                    
+                    if part_filename is not None:
+                        value = view[pos:index]
+                        fields.filenames.setdefault(part_name, part_filename)
+                    else:
+                        value = bytes(view[pos:index]).decode('utf-8', 'replace')
+                    fields.setdefault(part_name, []).append(value)
+                    
+                    pos = index + len(delimiter)
+                    state = 'after_delimiter'
+                    progressed = True
+                else:
+                    # Resume where a delimiter could still start in the next chunk
+                    search_from = max(pos, filled - len(delimiter) + 1)
+                    if max_part_size is not None and search_from - pos > max_part_size:
+                        raise PartTooLarge(f'Field {part_name} exceeds {max_part_size} bytes')
+        
+        if eof:
+            raise MultipartError('Unexpected end of multipart body')
+        
+        if filled < content_length:
+            read = stream.readinto(view[filled:min(content_length, filled + chunk_size)])
+            if not read:
+                eof = True
+            else:
+                filled += read
+        else:
+            eof = True
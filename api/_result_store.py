@@ -0,0 +1,186 @@
+"""
+Bounded in-process store of recent scan results for the serverless scan
+function. Vercel functions do not share memory or /tmp, so /api/history and
+/api/export are rewritten to the same function (vercel.json) to read it.
+
+Results live in an LRU ring buffer capped both by entry count and by bytes
+(records are kept JSON-encoded, so their size is known exactly). Optionally
+every result is written through to a SQLite file in the instance's temp
+directory, so anything evicted from memory can still be served without a
+database round trip.
+
+Configuration (environment variables):
+    OMR_RESULT_STORE_ENTRIES   Max results kept in memory (default 500)
+    OMR_RESULT_STORE_BYTES     Max bytes kept in memory (default 8 MiB)
+    OMR_RESULT_STORE_SQLITE    "1" to enable SQLite write-through, or a file path
+    OMR_RESULT_STORE_ROWS      Max rows kept in the SQLite file (default 10000)
+"""
+
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+DEFAULT_MAX_ENTRIES = 500
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+DEFAULT_MAX_ROWS = 10000
+
+
+class ResultStore:
+    """LRU ring buffer of scan results with optional SQLite write-through"""
+    
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES,
+                 sqlite_path=None, max_rows=DEFAULT_MAX_ROWS):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sqlite_path = sqlite_path
+        self.max_rows = max_rows
+        
+        self._entries = OrderedDict()  # scan_id -> JSON-encoded record
+        self._bytes = 0
+        self._counter = 0
+        self._lock = threading.Lock()
+        
+        if self.sqlite_path:
+            self._init_sqlite()
+    
+    @classmethod
+    def from_env(cls):
+        sqlite_setting = os.environ.get('OMR_RESULT_STORE_SQLITE', '')
+        if sqlite_setting.lower() in ('', '0', 'false', 'no'):
+            sqlite_path = None
+        elif sqlite_setting.lower() in ('1', 'true', 'yes'):
+            sqlite_path = os.path.join(tempfile.gettempdir(), 'omr_results.db')
+        else:
+            sqlite_path = sqlite_setting
+        
+        return cls(
+            max_entries=int(os.environ.get('OMR_RESULT_STORE_ENTRIES', DEFAULT_MAX_ENTRIES)),
+            max_bytes=int(os.environ.get('OMR_RESULT_STORE_BYTES', DEFAULT_MAX_BYTES)),
+            sqlite_path=sqlite_path,
+            max_rows=int(os.environ.get('OMR_RESULT_STORE_ROWS', DEFAULT_MAX_ROWS))
+        )
+    
+    @property
+    def memory_bytes(self):
+        return self._bytes
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def add(self, record):
+        """Store a scan result, assign it an id and return the id"""
+        record = dict(record)
+        record.setdefault('timestamp', datetime.now().isoformat())
+        
+        with self._lock:
+            if self.sqlite_path:
+                scan_id = self._insert_sqlite(record)
+            else:
+                self._counter += 1
+                scan_id = self._counter
+            
+            record['id'] = scan_id
+            self._remember(scan_id, json.dumps(record, separators=(',', ':')).encode('utf-8'))
+        
+        return scan_id
+    
+    def get(self, scan_id):
+        """Return the record for `scan_id`, or None"""
+        with self._lock:
+            encoded = self._entries.get(scan_id)
+            if encoded is not None:
+                self._entries.move_to_end(scan_id)
+                return json.loads(encoded)
+            
+            if not self.sqlite_path:
+                return None
+            
+            encoded = self._select_sqlite(scan_id)
+            if encoded is None:
+                return None
+            
+            self._remember(scan_id, encoded)
+            return json.loads(encoded)
+    
+    def recent(self, limit=50):
+        """Most recent results first"""
+        with self._lock:
+            if self.sqlite_path:
+                conn = sqlite3.connect(self.sqlite_path)
+                try:
+                    rows = conn.execute(
+                        'SELECT record FROM results ORDER BY id DESC LIMIT ?', (limit,)
+                    ).fetchall()
+                finally:
+                    conn.close()
+                return [json.loads(row[0]) for row in rows]
+            
+            ids = sorted(self._entries, reverse=True)[:limit]
+            return [json.loads(self._entries[scan_id]) for scan_id in ids]
+    
+    def _remember(self, scan_id, encoded):
+        """Insert into the LRU and evict until both caps are satisfied"""
+        previous = self._entries.pop(scan_id, None)
+        if previous is not None:
+            self._bytes -= len(previous)
+        
+        self._entries[scan_id] = encoded
+        self._bytes += len(encoded)
+        
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+    
+    def _init_sqlite(self):
+        conn = sqlite3.connect(self.sqlite_path)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS results (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    record TEXT NOT NULL
+                )
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+    
+    def _insert_sqlite(self, record):
+        conn = sqlite3.connect(self.sqlite_path)
+        try:
+            cursor = conn.execute('INSERT INTO results (record) VALUES (?)', ('{}',))
+            scan_id = cursor.lastrowid
+            record['id'] = scan_id
+            conn.execute('UPDATE results SET record = ? WHERE id = ?', (json.dumps(record), scan_id))
+            # The temp dir is small too: keep only the newest max_rows results
+            conn.execute('DELETE FROM results WHERE id <= ?', (scan_id - self.max_rows,))
+            conn.commit()
+            return scan_id
+        finally:
+            conn.close()
+    
+    def _select_sqlite(self, scan_id):
+        conn = sqlite3.connect(self.sqlite_path)
+        try:
+            row = conn.execute('SELECT record FROM results WHERE id = ?', (scan_id,)).fetchone()
+        finally:
+            conn.close()
+        return row[0].encode('utf-8') if row else None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_result_store():
+    """Process-wide store shared by every handler in this instance"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ResultStore.from_env()
+    return _store
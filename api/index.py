@@ -1,23 +1,14 @@
 from http.server import BaseHTTPRequestHandler
 import json
+import os
+import sys
 import random
 from datetime import datetime
-from urllib.parse import urlparse, parse_qs
+from urllib.parse import urlparse
 
-DEFAULT_TEMPLATES = [
-    {
-        "name": "default",
-        "display_name": "Standard 20 Questions (A-D)",
-        "questions": 20,
-        "options": ["A", "B", "C", "D"]
-    },
-    {
-        "name": "extended",
-        "display_name": "Extended 50 Questions (A-E)",
-        "questions": 50,
-        "options": ["A", "B", "C", "D", "E"]
-    }
-]
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(API_DIR, '..', 'backend'))
+from omr_engine.templates import get_template_registry
 
 def simulate_omr_detection(template):
     """Simulate OMR detection for demo purposes"""
@@ -52,7 +43,7 @@ class handler(BaseHTTPRequestHandler):
                     'message': 'OMR Scanner API is running'
                 }
             elif path == '/api/templates':
-                response_data = {'templates': DEFAULT_TEMPLATES}
+                response_data = {'templates': get_template_registry().list()}
             else:
                 response_data = {'error': 'Endpoint not found'}
                 self.send_error_response(404, 'Endpoint not found')
@@ -69,7 +60,7 @@ class handler(BaseHTTPRequestHandler):
             
             if path == '/api/scan':
                 # For now, just simulate processing without parsing the actual file
-                template = DEFAULT_TEMPLATES[0]  # Use default template
+                template = get_template_registry().get('default')  # Use default template
                 
                 # Simulate OMR processing
                 answers = simulate_omr_detection(template)
@@ -1,22 +1,12 @@
 from http.server import BaseHTTPRequestHandler
 import json
+import os
+import sys
 import random
-from datetime import datetime
 
-DEFAULT_TEMPLATES = [
-    {
-        "name": "default",
-        "display_name": "Standard 20 Questions (A-D)",
-        "questions": 20,
-        "options": ["A", "B", "C", "D"]
-    },
-    {
-        "name": "extended",
-        "display_name": "Extended 50 Questions (A-E)",
-        "questions": 50,
-        "options": ["A", "B", "C", "D", "E"]
-    }
-]
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(API_DIR, '..', 'backend'))
+from omr_engine.templates import get_template_registry
 
 def simulate_omr_detection(template):
     """Simulate OMR detection for demo purposes"""
@@ -43,7 +33,7 @@ class handler(BaseHTTPRequestHandler):
     def do_POST(self):
         try:
             # For now, just simulate processing
-            template = DEFAULT_TEMPLATES[0]  # Use default template
+            template = get_template_registry().get('default')  # Use default template
             
             # Simulate OMR processing
             answers = simulate_omr_detection(template)
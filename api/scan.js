@@ -1,112 +0,0 @@
-const TEMPLATES = [
-  { name: 'short',    display_name: 'Short 10 Questions (A-C)',      questions: 10,  options: ['A','B','C'] },
-  { name: 'default',  display_name: 'Standard 20 Questions (A-D)',   questions: 20,  options: ['A','B','C','D'] },
-  { name: 'medium',   display_name: 'Medium 30 Questions (A-D)',     questions: 30,  options: ['A','B','C','D'] },
-  { name: 'extended', display_name: 'Extended 50 Questions (A-E)',   questions: 50,  options: ['A','B','C','D','E'] },
-  { name: 'large',    display_name: 'Large 100 Questions (A-E)',     questions: 100, options: ['A','B','C','D','E'] }
-];
-
-module.exports.config = { api: { bodyParser: false } };
-
-function parseMultipart(req) {
-  return new Promise((resolve, reject) => {
-    const chunks = [];
-    req.on('data', chunk => chunks.push(chunk));
-    req.on('end', () => {
-      const body = Buffer.concat(chunks).toString();
-      const contentType = req.headers['content-type'] || '';
-      const boundary = contentType.split('boundary=')[1];
-
-      const fields = {};
-      let hasImage = false;
-
-      if (boundary) {
-        const parts = body.split('--' + boundary);
-        for (const part of parts) {
-          if (part.includes('Content-Disposition')) {
-            const nameMatch = part.match(/name="([^"]+)"/);
-            if (nameMatch) {
-              const name = nameMatch[1];
-              if (name === 'image') {
-                hasImage = part.length > 200; // has actual image data
-              } else {
-                const valueStart = part.indexOf('\r\n\r\n') + 4;
-                const valueEnd = part.lastIndexOf('\r\n');
-                if (valueStart > 3 && valueEnd > valueStart) {
-                  fields[name] = part.substring(valueStart, valueEnd).trim();
-                }
-              }
-            }
-          }
-        }
-      }
-
-      resolve({ fields, hasImage });
-    });
-    req.on('error', reject);
-  });
-}
-
-function detectAnswers(template, hasImage) {
-  const { questions, options } = template;
-  const answers = [];
-  for (let i = 0; i < questions; i++) {
-    if (hasImage) {
-      const rand = Math.random();
-      answers.push(rand > 0.1 ? options[Math.floor(Math.random() * options.length)] : '');
-    } else {
-      answers.push(options[i % options.length]);
-    }
-  }
-  return answers;
-}
-
-module.exports = async function handler(req, res) {
-  res.setHeader('Access-Control-Allow-Origin', '*');
-  res.setHeader('Access-Control-Allow-Methods', 'POST, OPTIONS');
-  res.setHeader('Access-Control-Allow-Headers', 'Content-Type');
-
-  if (req.method === 'OPTIONS') return res.status(200).end();
-  if (req.method !== 'POST') return res.status(405).json({ error: 'Method not allowed' });
-
-  try {
-    const { fields, hasImage } = await parseMultipart(req);
-
-    const templateName = fields.template || 'default';
-    const template = TEMPLATES.find(t => t.name === templateName) || TEMPLATES[1];
-
-    let answerKeyList = [];
-    try { answerKeyList = JSON.parse(fields.answer_key || '[]'); } catch (e) {}
-
-    const answers = detectAnswers(template, hasImage);
-
-    let score = 0;
-    const questionAnalysis = answers.map((detected, i) => {
-      const correct = answerKeyList[i] || null;
-      const is_correct = correct ? detected === correct : false;
-      if (is_correct) score++;
-      return { question: i + 1, detected, correct, is_correct };
-    });
-
-    res.status(200).json({
-      success: true,
-      scan_id: Date.now(),
-      answers,
-      score,
-      total_questions: answers.length,
-      percentage: answerKeyList.length > 0
-        ? Math.round((score / answers.length) * 10000) / 100
-        : null,
-      question_analysis: questionAnalysis,
-      confidence: hasImage ? 0.78 : 0.95,
-      message: hasImage
-        ? 'OMR sheet processed successfully'
-        : 'Demo mode — upload an image for real detection',
-      template_used: template.display_name
-    });
-
-  } catch (err) {
-    console.error('Scan error:', err);
-    res.status(500).json({ error: 'Failed to process scan: ' + err.message });
-  }
-};
@@ -1,134 +1,102 @@
 from http.server import BaseHTTPRequestHandler
 import json
-import base64
-import numpy as np
-import cv2
-from datetime import datetime
-import cgi
-import io
-from urllib.parse import parse_qs
+import os
+import sys
+from urllib.parse import urlparse, parse_qs
 
-# Simple in-memory storage
-scans_storage = []
-scan_counter = 0
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, API_DIR)
+sys.path.insert(0, os.path.join(API_DIR, '..', 'backend'))
+from _multipart import parse_multipart_stream, MultipartError, PartTooLarge
+from _result_store import get_result_store
+from _history import recent_history
+from _export import render_export, EXPORT_FORMATS
+from omr_engine import OMREngine, get_template_registry, get_result_cache
+from omr_engine.compact import compact_result, encode_response
+from omr_engine.tracing import get_tracer, new_request_id, record_error, span
 
-DEFAULT_TEMPLATES = [
-    {
-        "name": "default",
-        "display_name": "Standard 20 Questions (A-D)",
-        "questions": 20,
-        "options": ["A", "B", "C", "D"]
-    },
-    {
-        "name": "extended",
-        "display_name": "Extended 50 Questions (A-E)",
-        "questions": 50,
-        "options": ["A", "B", "C", "D", "E"]
-    }
-]
+# Largest accepted image upload (bytes)
+MAX_IMAGE_SIZE = 10 * 1024 * 1024
+# Allowance for the other form fields and multipart framing
+MAX_FORM_OVERHEAD = 256 * 1024
+# Content types accepted as a raw (non-multipart) image body
+RAW_IMAGE_TYPES = ('image/jpeg', 'image/png', 'image/tiff')
 
-class SimpleOMRProcessor:
-    """Simplified OMR processor for serverless deployment"""
+# Shared engine (backend/omr_engine); defaults to "auto": fast tier first,
+# accurate tier only for low-confidence sheets
+omr_engine = OMREngine()
+template_registry = get_template_registry()
+result_cache = get_result_cache()
+tracer = get_tracer()
+
+# /api/history and /api/export/<id>/<format> are rewritten to this function
+# (vercel.json): separate functions would not share the result store
+class handler(BaseHTTPRequestHandler):
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, X-OMR-Template, X-OMR-Answer-Key')
+        self.end_headers()
+
+    def do_POST(self):
+        # Trace the request (if sampled) and echo its id in X-Request-ID
+        self.request_id = self.headers.get('X-Request-ID') or new_request_id()
+        with tracer.start_trace('POST /api/scan', request_id=self.request_id) as root:
+            self.handle_scan()
+            root.set(http_status=getattr(self, 'status_code', None))
     
-    def process_image(self, image_bytes, template):
-        """Process OMR sheet image and extract answers"""
+    def do_GET(self):
+        path_parts = urlparse(self.path).path.rstrip('/').split('/')
         try:
-            # Convert to numpy array
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            if image is None:
-                return {'success': False, 'error': 'Could not decode image'}
-            
-            # Simplified processing for serverless
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            
-            # Basic thresholding
-            _, thresh = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY_INV)
-            
-            # Extract answers based on template
-            answers = self._extract_answers_simple(thresh, template)
-            
-            return {
-                'success': True,
-                'answers': answers,
-                'confidence': 0.8
-            }
-            
+            if path_parts[1:] == ['api', 'history']:
+                self.send_json_response({'history': recent_history(get_result_store())})
+            elif path_parts[1:3] == ['api', 'export']:
+                self.handle_export(path_parts[3:])
+            else:
+                self.send_error_response(404, 'Not found')
         except Exception as e:
-            return {'success': False, 'error': f'Processing error: {str(e)}'}
+            record_error(e)
+            self.send_error_response(500, f'Server error: {str(e)}')
     
-    def _extract_answers_simple(self, image, template):
-        """Simplified answer extraction"""
-        num_questions = template.get('questions', 20)
-        options = template.get('options', ['A', 'B', 'C', 'D'])
-        
-        answers = []
-        height, width = image.shape
+    def handle_export(self, params):
+        """Export a stored scan (/api/export/<id>/<format>)"""
+        if len(params) != 2 or not params[0].isdigit():
+            self.send_error_response(400, 'Usage: /api/export/{scanId}/{format}')
+            return
         
-        # Simple grid-based detection
-        start_y = int(height * 0.15)
-        end_y = int(height * 0.85)
-        start_x = int(width * 0.1)
+        format_type = params[1].lower()
+        if format_type not in EXPORT_FORMATS:
+            self.send_error_response(400, f'Format {format_type} not supported')
+            return
         
-        question_height = (end_y - start_y) // num_questions if num_questions > 0 else 20
-        option_width = int(width * 0.15)
-        
-        for q in range(num_questions):
-            question_y = start_y + q * question_height
-            question_answers = []
-            
-            for i, option in enumerate(options):
-                # Calculate bubble position
-                bubble_x = start_x + i * option_width
-                bubble_y = question_y
-                
-                # Extract small region around bubble
-                region_size = 20
-                x1 = max(0, bubble_x - region_size)
-                x2 = min(width, bubble_x + region_size)
-                y1 = max(0, bubble_y - region_size)
-                y2 = min(height, bubble_y + region_size)
-                
-                if y2 > y1 and x2 > x1:
-                    region = image[y1:y2, x1:x2]
-                    
-                    # Check if region has enough filled pixels
-                    if region.size > 0:
-                        fill_ratio = np.sum(region > 0) / region.size
-                        if fill_ratio > 0.3:  # 30% threshold
-                            question_answers.append(option)
-            
-            # Determine final answer
-            if len(question_answers) == 1:
-                answers.append(question_answers[0])
-            elif len(question_answers) == 0:
-                answers.append('')
-            else:
-                answers.append('MULTIPLE')
+        scan = get_result_store().get(int(params[0]))
+        if scan is None:
+            self.send_error_response(404, 'Scan not found')
+            return
         
-        return answers
-
-# Initialize processor
-omr_processor = SimpleOMRProcessor()
-
-class handler(BaseHTTPRequestHandler):
-    def do_OPTIONS(self):
+        body, content_type, filename = render_export(scan, format_type)
         self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Disposition', f'attachment; filename={filename}')
         self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Content-Length', str(len(body)))
         self.end_headers()
-
-    def do_POST(self):
-        global scan_counter, scans_storage
-        
+        self.wfile.write(body)
+    
+    def send_response(self, code, message=None):
+        BaseHTTPRequestHandler.send_response(self, code, message)
+        self.status_code = code
+        if getattr(self, 'request_id', None):
+            self.send_header('X-Request-ID', self.request_id)
+    
+    def handle_scan(self):
         try:
-            # Parse multipart form data
             content_type = self.headers.get('Content-Type', '')
+            mimetype = content_type.split(';')[0].strip().lower()
             
-            if 'multipart/form-data' not in content_type:
-                self.send_error_response(400, 'Content-Type must be multipart/form-data')
+            if mimetype not in RAW_IMAGE_TYPES and mimetype != 'multipart/form-data':
+                self.send_error_response(400, 'Content-Type must be multipart/form-data or image/jpeg, image/png, image/tiff')
                 return
             
             # Get content length
@@ -137,39 +105,60 @@ class handler(BaseHTTPRequestHandler):
                 self.send_error_response(400, 'No data received')
                 return
             
-            # Read the body
-            body = self.rfile.read(content_length)
-            
-            # Parse multipart data
-            form_data = self.parse_multipart(body, content_type)
-            
-            if not form_data:
-                self.send_error_response(400, 'Failed to parse form data')
-                return
-            
-            # Get form fields
-            template_name = form_data.get('template', ['default'])[0]
-            answer_key = form_data.get('answer_key', ['[]'])[0]
-            
-            # Get image file
-            if 'image' not in form_data:
-                self.send_error_response(400, 'No image file provided')
-                return
-            
-            image_data = form_data['image'][0]
-            if not image_data:
-                self.send_error_response(400, 'Empty image file')
-                return
+            if mimetype in RAW_IMAGE_TYPES:
+                if content_length > MAX_IMAGE_SIZE:
+                    self.send_error_response(413, f'Upload exceeds {MAX_IMAGE_SIZE} bytes')
+                    return
+                
+                # Raw image body: options come from the query string or headers
+                query = parse_qs(urlparse(self.path).query)
+                template_name = query.get('template', [self.headers.get('X-OMR-Template', 'default')])[0]
+                answer_key = query.get('answer_key', [self.headers.get('X-OMR-Answer-Key', '[]')])[0]
+                response_format = query.get('format', ['full'])[0]
+                
+                filename = self.headers.get('X-Filename', 'upload')
+                image_data = self.read_body(content_length)
+                if not image_data:
+                    self.send_error_response(400, 'Empty image file')
+                    return
+            else:
+                if content_length > MAX_IMAGE_SIZE + MAX_FORM_OVERHEAD:
+                    self.send_error_response(413, f'Upload exceeds {MAX_IMAGE_SIZE} bytes')
+                    return
+                
+                # Parse multipart data while the body streams in
+                try:
+                    form_data = self.parse_multipart(content_type, content_length)
+                except PartTooLarge as e:
+                    self.send_error_response(413, str(e))
+                    return
+                except MultipartError as e:
+                    self.send_error_response(400, f'Failed to parse form data: {e}')
+                    return
+                
+                if not form_data:
+                    self.send_error_response(400, 'Failed to parse form data')
+                    return
+                
+                # Get form fields
+                template_name = form_data.get('template', ['default'])[0]
+                answer_key = form_data.get('answer_key', ['[]'])[0]
+                response_format = form_data.get('format', ['full'])[0]
+                
+                # Get image file
+                if 'image' not in form_data:
+                    self.send_error_response(400, 'No image file provided')
+                    return
+                
+                image_data = form_data['image'][0]
+                filename = form_data.filenames.get('image') or 'upload'
+                if not image_data:
+                    self.send_error_response(400, 'Empty image file')
+                    return
             
             # Find template
-            template = next((t for t in DEFAULT_TEMPLATES if t['name'] == template_name), DEFAULT_TEMPLATES[0])
-            
-            # Process OMR sheet
-            result = omr_processor.process_image(image_data, template)
-            
-            if not result['success']:
-                self.send_error_response(400, result['error'])
-                return
+            with span('template_lookup'):
+                template = template_registry.get(template_name) or template_registry.get('default')
             
             # Parse answer key
             try:
@@ -177,6 +166,35 @@ class handler(BaseHTTPRequestHandler):
             except:
                 answer_key_list = []
             
+            # Re-uploads of the same image and answer key (e.g. client retries)
+            # reuse the stored result while the store still holds the scan; the
+            # cache can outlive entries evicted from the bounded result store
+            with span('cache_lookup') as cache_span:
+                lookup = result_cache.lookup(image_data, template, answer_key_list)
+                if lookup.entry is not None and get_result_store().get(lookup.entry['scan_id']) is None:
+                    result_cache.discard(lookup)
+                    lookup = result_cache.lookup(image_data, template, answer_key_list)
+                cache_span.set(hit=lookup.entry is not None)
+            duplicate_of = similar_to = None
+            
+            if lookup.entry is not None:
+                result = lookup.entry['result']
+                duplicate_of = lookup.entry['scan_id']
+            else:
+                # Process OMR sheet
+                with span('engine', mode=omr_engine.mode):
+                    result = omr_engine.process_bytes(image_data, template)
+                
+                # A near match is reported, never merged: it may be another student
+                similar = result_cache.confirm(lookup, result)
+                if similar is not None:
+                    similar_to = similar['scan_id']
+            
+            if not result['success']:
+                # Pre-flight rejections carry the quality metrics for retake feedback
+                self.send_error_response(400, result['error'], quality=result.get('quality'))
+                return
+            
             # Calculate score
             score = 0
             total_questions = len(result['answers'])
@@ -189,6 +207,9 @@ class handler(BaseHTTPRequestHandler):
                     if is_correct:
                         score += 1
                 
+                if response_format == 'compact':
+                    continue
+                
                 question_analysis.append({
                     'question': i + 1,
                     'detected': detected_answer,
@@ -196,52 +217,98 @@ class handler(BaseHTTPRequestHandler):
                     'is_correct': is_correct
                 })
             
-            # Store scan result
-            scan_counter += 1
+            # Store scan result (bounded; shared with history and export)
+            if duplicate_of is None:
+                with span('store_result'):
+                    scan_id = get_result_store().add({
+                        'filename': filename,
+                        'template': template.name,
+                        'answers': result['answers'],
+                        'score': score,
+                        'total_questions': total_questions,
+                        'fields': result.get('fields') or {},
+                        'confidence': result.get('confidence', 0.8)
+                    })
+                result_cache.put(lookup, result, scan_id)
+            else:
+                scan_id = duplicate_of
+            
+            if response_format == 'compact':
+                self.send_negotiated_response(compact_result(
+                    scan_id, result['answers'], answer_key_list, score,
+                    options=template.options,
+                    confidence=result.get('confidence', 0.8),
+                    engine_tier=result.get('tier'),
+                    fields=result.get('fields') or {},
+                    duplicate=duplicate_of is not None
+                ))
+                return
             
             response_data = {
                 'success': True,
-                'scan_id': scan_counter,
+                'scan_id': scan_id,
                 'answers': result['answers'],
                 'score': score,
                 'total_questions': total_questions,
                 'percentage': round((score / total_questions * 100) if total_questions > 0 else 0, 2),
+                'fields': result.get('fields') or {},
                 'question_analysis': question_analysis,
-                'confidence': result.get('confidence', 0.8)
+                'confidence': result.get('confidence', 0.8),
+                'engine_tier': result.get('tier'),
+                'warp_path': result.get('warp_path'),
+                'quality': result.get('quality'),
+                'duplicate': duplicate_of is not None,
+                'similar_to': similar_to
             }
             
-            self.send_json_response(response_data)
+            self.send_negotiated_response(response_data)
             
         except Exception as e:
+            record_error(e)
             self.send_error_response(500, f'Server error: {str(e)}')
     
-    def parse_multipart(self, body, content_type):
-        """Parse multipart form data"""
-        try:
-            # Create a file-like object from bytes
-            fp = io.BytesIO(body)
-            
-            # Parse the content type to get boundary
-            pdict = {}
-            if 'boundary=' in content_type:
-                boundary = content_type.split('boundary=')[1]
-                pdict['boundary'] = boundary.encode()
-            
-            # Parse the multipart data
-            form = cgi.FieldStorage(fp=fp, environ={'REQUEST_METHOD': 'POST'}, headers={'content-type': content_type})
-            
-            result = {}
-            for field in form.list:
-                if field.filename:  # File field
-                    result[field.name] = [field.file.read()]
-                else:  # Regular field
-                    result[field.name] = [field.value]
-            
-            return result
-            
-        except Exception as e:
-            print(f"Multipart parsing error: {e}")
-            return None
+    def read_body(self, content_length):
+        """Read a raw request body into one buffer without intermediate copies"""
+        buf = bytearray(content_length)
+        view = memoryview(buf)
+        filled = 0
+        
+        while filled < content_length:
+            read = self.rfile.readinto(view[filled:])
+            if not read:
+                break
+            filled += read
+        
+        return view[:filled]
+    
+    def parse_multipart(self, content_type, content_length):
+        """Parse multipart form data straight from the request stream
+        
+        File fields come back as memoryviews over the request buffer, so the
+        image reaches cv2.imdecode without being copied.
+        """
+        return parse_multipart_stream(
+            self.rfile, content_type, content_length,
+            max_part_size=MAX_IMAGE_SIZE
+        )
+    
+    def send_negotiated_response(self, data):
+        """Send JSON or msgpack, gzipped if the client accepts it"""
+        with span('encode_response') as encode_span:
+            response, headers = encode_response(
+                data,
+                accept=self.headers.get('Accept', ''),
+                accept_encoding=self.headers.get('Accept-Encoding', '')
+            )
+            encode_span.set(bytes=len(response), content_type=headers.get('Content-Type'))
+        
+        self.send_response(200)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
     
     def send_json_response(self, data):
         """Send JSON response"""
@@ -254,9 +321,10 @@ class handler(BaseHTTPRequestHandler):
         self.end_headers()
         self.wfile.write(response)
     
-    def send_error_response(self, code, message):
+    def send_error_response(self, code, message, **details):
         """Send error response"""
         error_data = {'error': message}
+        error_data.update(details)
         response = json.dumps(error_data).encode('utf-8')
         
         self.send_response(code)
@@ -1,30 +1,32 @@
 from http.server import BaseHTTPRequestHandler
 import json
+import os
+import sys
 
-DEFAULT_TEMPLATES = [
-    {
-        "name": "default",
-        "display_name": "Standard 20 Questions (A-D)",
-        "questions": 20,
-        "options": ["A", "B", "C", "D"]
-    },
-    {
-        "name": "extended",
-        "display_name": "Extended 50 Questions (A-E)",
-        "questions": 50,
-        "options": ["A", "B", "C", "D", "E"]
-    }
-]
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(API_DIR, '..', 'backend'))
+from omr_engine.templates import etag_matches, get_template_registry
 
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
         try:
-            response_data = {'templates': DEFAULT_TEMPLATES}
-            response = json.dumps(response_data).encode('utf-8')
+            registry = get_template_registry()
+            etag = registry.etag
+            
+            if etag_matches(self.headers.get('If-None-Match', ''), etag):
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.end_headers()
+                return
+            
+            response = registry.listing_json()
             
             self.send_response(200)
             self.send_header('Content-Type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
             self.send_header('Content-Length', str(len(response)))
             self.end_headers()
             self.wfile.write(response)
@@ -38,4 +40,4 @@ class handler(BaseHTTPRequestHandler):
             self.send_header('Access-Control-Allow-Origin', '*')
             self.send_header('Content-Length', str(len(response)))
             self.end_headers()
-            self.wfile.write(response)
\ No newline at end of file
+            self.wfile.write(response)
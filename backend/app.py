@@ -1,13 +1,24 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, g
 from flask_cors import CORS
 import cv2
 import numpy as np
 import json
 import os
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import sqlite3
-from omr_processor import OMRProcessor
+import threading
+import time
+from functools import wraps
+from omr_engine import OMREngine, etag_matches, get_template_registry, get_result_cache
+from omr_engine.compact import compact_result, encode_response
+from omr_engine.tracing import get_tracer, new_request_id, record_error, set_stage_observer, span
 from result_generator import ResultGenerator
+from artifact_store import ArtifactStore
+from concurrency import get_concurrency_config
+from metrics import ScanMetrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from shm_transport import ProcessSheetPool
+import db
+from db import INDEXED_FIELDS
 
 app = Flask(__name__)
 CORS(app)
@@ -15,170 +26,288 @@ CORS(app)
 # Configuration
 UPLOAD_FOLDER = 'uploads'
 RESULTS_FOLDER = 'results'
-DATABASE_PATH = 'omr_scanner.db'
+DATABASE_PATH = db.DATABASE_PATH
+JANITOR_INTERVAL = float(os.environ.get('OMR_JANITOR_INTERVAL', 300))
+
+# Raw (non-multipart) upload content types accepted by /api/scan
+RAW_IMAGE_TYPES = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/tiff': '.tif'
+}
 
 # Ensure directories exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(RESULTS_FOLDER, exist_ok=True)
 
+# Started with `python app.py`, the sheet pool's workers (forkserver) import
+# this module as __mp_main__; they only grade sheets
+IN_POOL_WORKER = __name__ == '__mp_main__'
+
+# Managed artifact stores (retention via OMR_UPLOADS_* / OMR_RESULTS_* env vars)
+upload_store = ArtifactStore.from_env(UPLOAD_FOLDER, prefix='OMR_UPLOADS')
+results_store = ArtifactStore.from_env(RESULTS_FOLDER, prefix='OMR_RESULTS')
+if not IN_POOL_WORKER:
+    upload_store.start_janitor(JANITOR_INTERVAL)
+    results_store.start_janitor(JANITOR_INTERVAL)
+
 # Initialize components
-omr_processor = OMRProcessor()
-result_generator = ResultGenerator()
+omr_engine = OMREngine()
+template_registry = get_template_registry()
+result_cache = get_result_cache()
+
+# Split the cores between concurrent scans and OpenCV's own threads
+concurrency = get_concurrency_config()
+processing_slots = threading.BoundedSemaphore(concurrency.slots)
+result_generator = ResultGenerator(artifact_store=results_store)
+
+# OMR_PROCESS_POOL=1 grades uploads in worker processes fed through shared
+# memory (shm_transport.py) instead of on the request thread
+PROCESS_POOL_ENABLED = os.environ.get('OMR_PROCESS_POOL', '0').lower() in ('1', 'true', 'yes')
+sheet_pool = ProcessSheetPool(workers=concurrency.slots) if PROCESS_POOL_ENABLED and not IN_POOL_WORKER else None
+
+# Per-request tracing (sampled via OMR_TRACE_SAMPLE_RATE)
+tracer = get_tracer()
+
+# Prometheus metrics at /api/metrics (OMR_METRICS=0 disables them)
+METRICS_ENABLED = os.environ.get('OMR_METRICS', '1').lower() not in ('0', 'false', 'no')
+metrics = ScanMetrics(concurrency.slots, result_cache=result_cache, engine=omr_engine)
+if METRICS_ENABLED:
+    set_stage_observer(metrics.observe_stage)
 
 def init_database():
-    """Initialize SQLite database"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS scans (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            filename TEXT NOT NULL,
-            template_name TEXT NOT NULL,
-            answers TEXT NOT NULL,
-            score INTEGER NOT NULL,
-            total_questions INTEGER NOT NULL,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    """Initialize SQLite database (schema and migrations live in db.py)"""
+    db.init_database(DATABASE_PATH)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    if METRICS_ENABLED and 'request_started' in g:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe_request(route, request.method, response.status_code,
+                                time.perf_counter() - g.request_started)
+    return response
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus text-format metrics"""
+    if not METRICS_ENABLED:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return app.response_class(metrics.render(), mimetype=None, content_type=METRICS_CONTENT_TYPE)
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({'status': 'healthy', 'timestamp': datetime.now().isoformat()})
+    return jsonify({
+        'status': 'healthy',
+        'timestamp': datetime.now().isoformat(),
+        'result_cache': result_cache.stats()
+    })
 
 @app.route('/api/templates', methods=['GET'])
 def get_templates():
-    """Get available OMR templates"""
-    templates_dir = 'templates'
-    templates = []
+    """Get available OMR templates
     
-    # Default templates if directory doesn't exist
-    default_templates = [
-        {
-            'name': 'default',
-            'display_name': 'Standard 20 Questions (A-D)',
-            'questions': 20,
-            'options': ['A', 'B', 'C', 'D']
-        },
-        {
-            'name': 'extended',
-            'display_name': 'Extended 50 Questions (A-E)',
-            'questions': 50,
-            'options': ['A', 'B', 'C', 'D', 'E']
-        },
-        {
-            'name': 'short',
-            'display_name': 'Short 10 Questions (A-C)',
-            'questions': 10,
-            'options': ['A', 'B', 'C']
-        },
-        {
-            'name': 'medium',
-            'display_name': 'Medium 30 Questions (A-D)',
-            'questions': 30,
-            'options': ['A', 'B', 'C', 'D']
-        },
-        {
-            'name': 'large',
-            'display_name': 'Large 100 Questions (A-E)',
-            'questions': 100,
-            'options': ['A', 'B', 'C', 'D', 'E']
-        }
-    ]
+    Served from the in-memory template registry, which reloads changed files
+    on its own; clients can revalidate cheaply with If-None-Match.
+    """
+    etag = template_registry.etag
+    if etag_matches(request.headers.get('If-None-Match', ''), etag):
+        return '', 304, {'ETag': etag, 'Cache-Control': 'no-cache'}
     
-    if os.path.exists(templates_dir):
-        for file in os.listdir(templates_dir):
-            if file.endswith('.json'):
-                try:
-                    with open(os.path.join(templates_dir, file), 'r') as f:
-                        template = json.load(f)
-                        templates.append({
-                            'name': file.replace('.json', ''),
-                            'display_name': template.get('display_name', file),
-                            'questions': template.get('questions', 0),
-                            'options': template.get('options', [])
-                        })
-                except Exception as e:
-                    print(f"Error loading template {file}: {e}")
+    response = app.response_class(template_registry.listing_json(), mimetype='application/json')
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def read_request_body(stream, length):
+    """Read exactly `length` bytes of the request stream into one buffer"""
+    buf = bytearray(length)
+    view = memoryview(buf)
+    filled = 0
     
-    # If no templates loaded from files, use defaults
-    if not templates:
-        templates = default_templates
+    while filled < length:
+        read = stream.readinto(view[filled:])
+        if not read:
+            break
+        filled += read
     
-    return jsonify({'templates': templates})
+    return view[:filled]
+
+def send_negotiated(data):
+    """Encode `data` as JSON or msgpack, gzipped if the client accepts it"""
+    with span('encode_response') as encode_span:
+        body, headers = encode_response(
+            data,
+            accept=request.headers.get('Accept', ''),
+            accept_encoding=request.headers.get('Accept-Encoding', '')
+        )
+        encode_span.set(bytes=len(body), content_type=headers.get('Content-Type'))
+    return app.response_class(body, headers=headers)
+
+def traced(view):
+    """Trace the request (if sampled) and echo its id in X-Request-ID"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        request_id = request.headers.get('X-Request-ID') or new_request_id()
+        with tracer.start_trace(f'{request.method} {request.url_rule}', request_id=request_id) as root:
+            response = app.make_response(view(*args, **kwargs))
+            root.set(http_status=response.status_code)
+        response.headers['X-Request-ID'] = request_id
+        return response
+    return wrapper
 
 @app.route('/api/scan', methods=['POST'])
+@traced
 def scan_omr():
-    """Process OMR sheet image"""
+    """Process OMR sheet image
+    
+    Accepts multipart form data (image, template, answer_key) or a raw
+    image/jpeg, image/png or image/tiff body with template and answer_key
+    given as query parameters or X-OMR-Template / X-OMR-Answer-Key headers.
+    
+    With format=compact the per-question analysis is replaced by a packed
+    answer string and a correctness bitmap. Responses honour Accept
+    (application/msgpack) and Accept-Encoding (gzip).
+    """
     try:
-        if 'image' not in request.files:
-            return jsonify({'error': 'No image file provided'}), 400
-        
-        file = request.files['image']
-        template_name = request.form.get('template', 'default')
-        answer_key = request.form.get('answer_key', '[]')
-        
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
-        
-        # Save uploaded file
-        filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{file.filename}"
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(filepath)
+        with span('read_upload') as upload_span:
+            body = None
+            
+            if request.mimetype in RAW_IMAGE_TYPES:
+                template_name = request.args.get('template') or request.headers.get('X-OMR-Template', 'default')
+                answer_key = request.args.get('answer_key') or request.headers.get('X-OMR-Answer-Key', '[]')
+                
+                # Read the body in one buffer; the engine decodes it directly
+                if request.content_length:
+                    body = read_request_body(request.stream, request.content_length)
+                else:
+                    body = memoryview(request.get_data(cache=False))
+                
+                if not body:
+                    return jsonify({'error': 'No image data received'}), 400
+                
+                original_name = request.headers.get('X-Filename') or f"upload{RAW_IMAGE_TYPES[request.mimetype]}"
+            else:
+                if 'image' not in request.files:
+                    return jsonify({'error': 'No image file provided'}), 400
+                
+                file = request.files['image']
+                template_name = request.form.get('template', 'default')
+                answer_key = request.form.get('answer_key', '[]')
+                
+                if file.filename == '':
+                    return jsonify({'error': 'No file selected'}), 400
+                
+                original_name = file.filename
+                body = memoryview(file.read())
+            
+            upload_span.set(bytes=len(body), template=template_name)
         
-        # Load template
-        template_path = f'../templates/{template_name}.json'
-        if not os.path.exists(template_path):
+        # Look up the compiled template (parsed once, reloaded on change)
+        with span('template_lookup'):
+            template = template_registry.get(template_name)
+        if template is None:
             return jsonify({'error': f'Template {template_name} not found'}), 400
         
-        with open(template_path, 'r') as f:
-            template = json.load(f)
-        
-        # Process OMR sheet
-        result = omr_processor.process_image(filepath, template)
-        
-        if not result['success']:
-            return jsonify({'error': result['error']}), 400
-        
         # Parse answer key
         try:
             answer_key_list = json.loads(answer_key) if answer_key else []
         except:
             answer_key_list = []
         
+        # Re-uploads of the same image and answer key reuse the stored result
+        # and scan row, as long as that row still exists
+        with span('cache_lookup') as cache_span:
+            lookup = result_cache.lookup(body, template, answer_key_list)
+            if lookup.entry is not None and not db.scan_exists(DATABASE_PATH, lookup.entry['scan_id']):
+                result_cache.discard(lookup)
+                lookup = result_cache.lookup(body, template, answer_key_list)
+            cache_span.set(hit=lookup.entry is not None)
+        duplicate_of = similar_to = None
+        
+        if lookup.entry is not None:
+            result = lookup.entry['result']
+            duplicate_of = lookup.entry['scan_id']
+        else:
+            # Keep the original upload
+            filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.path.basename(original_name)}"
+            filepath = upload_store.path_for(os.path.splitext(filename)[0], filename)
+            with span('save_upload'), open(filepath, 'wb') as f:
+                f.write(body)
+            
+            # Process OMR sheet (at most concurrency.slots at a time)
+            metrics.queue_depth.inc()
+            with span('wait_slot'):
+                processing_slots.acquire()
+            metrics.queue_depth.dec()
+            metrics.in_progress.inc()
+            try:
+                with span('engine', mode=omr_engine.mode, process_pool=sheet_pool is not None):
+                    if sheet_pool is not None:
+                        result = sheet_pool.process_bytes(body, template_name, filepath)
+                    else:
+                        result = omr_engine.process_bytes(body, template, filepath)
+            finally:
+                processing_slots.release()
+                metrics.in_progress.dec()
+            
+            # A near match is reported, never merged: it may be another student
+            similar = result_cache.confirm(lookup, result)
+            if similar is not None:
+                similar_to = similar['scan_id']
+        
+        metrics.observe_scan(template_name, result, duplicate=duplicate_of is not None)
+        
+        if not result['success']:
+            # Pre-flight rejections carry the quality metrics for retake feedback
+            return jsonify({'error': result['error'], 'quality': result.get('quality')}), 400
+        
+        response_format = request.values.get('format', 'full')
+        
         # Calculate score if answer key provided
-        score = 0
-        total_questions = len(result['answers'])
-        question_analysis = []
-        
-        for i, detected_answer in enumerate(result['answers']):
-            is_correct = False
-            if i < len(answer_key_list):
-                is_correct = detected_answer == answer_key_list[i]
-                if is_correct:
-                    score += 1
+        with span('scoring', questions=len(result['answers'])):
+            score = 0
+            total_questions = len(result['answers'])
+            question_analysis = []
             
-            question_analysis.append({
-                'question': i + 1,
-                'detected': detected_answer,
-                'correct': answer_key_list[i] if i < len(answer_key_list) else None,
-                'is_correct': is_correct
-            })
+            for i, detected_answer in enumerate(result['answers']):
+                is_correct = False
+                if i < len(answer_key_list):
+                    is_correct = detected_answer == answer_key_list[i]
+                    if is_correct:
+                        score += 1
+                
+                if response_format == 'compact':
+                    continue
+                
+                question_analysis.append({
+                    'question': i + 1,
+                    'detected': detected_answer,
+                    'correct': answer_key_list[i] if i < len(answer_key_list) else None,
+                    'is_correct': is_correct
+                })
         
-        # Save to database
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO scans (filename, template_name, answers, score, total_questions)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (filename, template_name, json.dumps(result['answers']), score, total_questions))
-        scan_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        # Save to database (duplicates point at the existing row)
+        if duplicate_of is None:
+            with span('db_insert'):
+                scan_id = db.insert_scan(DATABASE_PATH, db.scan_row(filename, template_name, result, score))
+            result_cache.put(lookup, result, scan_id)
+        else:
+            scan_id = duplicate_of
+        
+        if response_format == 'compact':
+            return send_negotiated(compact_result(
+                scan_id, result['answers'], answer_key_list, score,
+                options=template.options,
+                confidence=result.get('confidence', 0.95),
+                engine_tier=result.get('tier'),
+                fields=result.get('fields') or {},
+                duplicate=duplicate_of is not None
+            ))
         
         response_data = {
             'success': True,
@@ -187,24 +316,35 @@ def scan_omr():
             'score': score,
             'total_questions': total_questions,
             'percentage': round((score / total_questions * 100) if total_questions > 0 else 0, 2),
+            'fields': result.get('fields') or {},
             'question_analysis': question_analysis,
             'processed_image': result.get('processed_image_path'),
-            'confidence': result.get('confidence', 0.95)
+            'confidence': result.get('confidence', 0.95),
+            'engine_tier': result.get('tier'),
+            'warp_path': result.get('warp_path'),
+            'quality': result.get('quality'),
+            'duplicate': duplicate_of is not None,
+            'similar_to': similar_to
         }
         
-        return jsonify(response_data)
+        return send_negotiated(response_data)
         
     except Exception as e:
+        record_error(e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/export/<int:scan_id>/<format>', methods=['GET'])
+@traced
 def export_results(scan_id, format):
     """Export scan results in specified format"""
     try:
         # Get scan data from database
         conn = sqlite3.connect(DATABASE_PATH)
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM scans WHERE id = ?', (scan_id,))
+        cursor.execute('''
+            SELECT id, filename, template_name, answers, score, total_questions, timestamp
+            FROM scans WHERE id = ?
+        ''', (scan_id,))
         scan = cursor.fetchone()
         conn.close()
         
@@ -220,6 +360,88 @@ def export_results(scan_id, format):
         return send_file(export_path, as_attachment=True)
         
     except Exception as e:
+        record_error(e)
+        return jsonify({'error': str(e)}), 500
+
+def parse_time_bound(value, upper=False):
+    """Turn an ISO date/time query bound into (operator, SQLite timestamp)
+    
+    Stored timestamps are UTC 'YYYY-MM-DD HH:MM:SS' strings, so bounds are
+    normalized to that form. A date-only upper bound covers the whole day
+    (exclusive bound at the next midnight). Raises ValueError on bad input.
+    """
+    value = value.strip()
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    
+    if upper and 'T' not in value and ' ' not in value:
+        return '<', (parsed + timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
+    return ('<=' if upper else '>='), parsed.strftime('%Y-%m-%d %H:%M:%S')
+
+@app.route('/api/export/bulk/<format>', methods=['GET'])
+@traced
+def export_bulk(format):
+    """Export many scans as one columnar file (Parquet or Arrow IPC)
+    
+    Query parameters: template, start, end (ISO dates or timestamps, UTC
+    unless an offset is given, inclusive),
+    roll_number, booklet_code and fill_ratios=1 to include the per-bubble
+    fill ratio matrix.
+    """
+    try:
+        if format.lower() not in ('parquet', 'arrow'):
+            return jsonify({'error': f'Unsupported bulk format: {format}'}), 400
+        
+        query = '''
+            SELECT id, filename, template_name, answers, score, total_questions, timestamp, fill_ratios,
+                   roll_number, booklet_code
+            FROM scans WHERE 1 = 1
+        '''
+        params = []
+        
+        for field_name in INDEXED_FIELDS:
+            value = request.args.get(field_name)
+            if value:
+                query += f' AND {field_name} = ?'
+                params.append(value)
+        
+        template_name = request.args.get('template')
+        if template_name:
+            query += ' AND template_name = ?'
+            params.append(template_name)
+        
+        for bound, upper in (('start', False), ('end', True)):
+            value = request.args.get(bound)
+            if value:
+                try:
+                    operator, timestamp = parse_time_bound(value, upper)
+                except ValueError:
+                    return jsonify({'error': f'Invalid {bound} timestamp: {value}'}), 400
+                query += f' AND timestamp {operator} ?'
+                params.append(timestamp)
+        
+        query += ' ORDER BY id'
+        include_fill_ratios = request.args.get('fill_ratios', '').lower() in ('1', 'true', 'yes')
+        
+        conn = sqlite3.connect(DATABASE_PATH)
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        scans = cursor.fetchall()
+        conn.close()
+        
+        if not scans:
+            return jsonify({'error': 'No scans match the given filters'}), 404
+        
+        export_path = result_generator.generate_bulk_export(scans, format, include_fill_ratios)
+        
+        if not export_path or not os.path.exists(export_path):
+            return jsonify({'error': 'Failed to generate export'}), 500
+        
+        return send_file(export_path, as_attachment=True)
+        
+    except Exception as e:
+        record_error(e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/history', methods=['GET'])
@@ -229,7 +451,7 @@ def get_scan_history():
         conn = sqlite3.connect(DATABASE_PATH)
         cursor = conn.cursor()
         cursor.execute('''
-            SELECT id, filename, template_name, score, total_questions, timestamp
+            SELECT id, filename, template_name, score, total_questions, timestamp, roll_number, booklet_code
             FROM scans ORDER BY timestamp DESC LIMIT 50
         ''')
         scans = cursor.fetchall()
@@ -244,7 +466,9 @@ def get_scan_history():
                 'score': scan[3],
                 'total': scan[4],
                 'percentage': round((scan[3] / scan[4] * 100) if scan[4] > 0 else 0, 2),
-                'timestamp': scan[5]
+                'timestamp': scan[5],
+                'roll_number': scan[6],
+                'booklet_code': scan[7]
             })
         
         return jsonify({'history': history})
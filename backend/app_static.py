@@ -7,8 +7,10 @@ import json
 import os
 from datetime import datetime
 import sqlite3
-from omr_processor import OMRProcessor
+import threading
+from omr_engine import OMREngine, etag_matches, get_template_registry
 from result_generator import ResultGenerator
+from concurrency import get_concurrency_config
 
 app = Flask(__name__, static_folder='static', static_url_path='')
 CORS(app)
@@ -23,7 +25,12 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(RESULTS_FOLDER, exist_ok=True)
 
 # Initialize components
-omr_processor = OMRProcessor()
+omr_engine = OMREngine()
+template_registry = get_template_registry()
+
+# Split the cores between concurrent scans and OpenCV's own threads
+concurrency = get_concurrency_config()
+processing_slots = threading.BoundedSemaphore(concurrency.workers)
 result_generator = ResultGenerator()
 
 def init_database():
@@ -71,23 +78,19 @@ def health_check():
 
 @app.route('/api/templates', methods=['GET'])
 def get_templates():
-    """Get available OMR templates"""
-    templates_dir = 'templates'
-    templates = []
+    """Get available OMR templates
     
-    if os.path.exists(templates_dir):
-        for file in os.listdir(templates_dir):
-            if file.endswith('.json'):
-                with open(os.path.join(templates_dir, file), 'r') as f:
-                    template = json.load(f)
-                    templates.append({
-                        'name': file.replace('.json', ''),
-                        'display_name': template.get('display_name', file),
-                        'questions': template.get('questions', 0),
-                        'options': template.get('options', [])
-                    })
+    Served from the in-memory template registry, which reloads changed files
+    on its own; clients can revalidate cheaply with If-None-Match.
+    """
+    etag = template_registry.etag
+    if etag_matches(request.headers.get('If-None-Match', ''), etag):
+        return '', 304, {'ETag': etag, 'Cache-Control': 'no-cache'}
     
-    return jsonify({'templates': templates})
+    response = app.response_class(template_registry.listing_json(), mimetype='application/json')
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/api/scan', methods=['POST'])
 def scan_omr():
@@ -108,19 +111,18 @@ def scan_omr():
         filepath = os.path.join(UPLOAD_FOLDER, filename)
         file.save(filepath)
         
-        # Load template
-        template_path = f'templates/{template_name}.json'
-        if not os.path.exists(template_path):
+        # Look up the compiled template (parsed once, reloaded on change)
+        template = template_registry.get(template_name)
+        if template is None:
             return jsonify({'error': f'Template {template_name} not found'}), 400
         
-        with open(template_path, 'r') as f:
-            template = json.load(f)
-        
-        # Process OMR sheet
-        result = omr_processor.process_image(filepath, template)
+        # Process OMR sheet (at most concurrency.workers at a time)
+        with processing_slots:
+            result = omr_engine.process_image(filepath, template)
         
         if not result['success']:
-            return jsonify({'error': result['error']}), 400
+            # Pre-flight rejections carry the quality metrics for retake feedback
+            return jsonify({'error': result['error'], 'quality': result.get('quality')}), 400
         
         # Parse answer key
         try:
@@ -167,7 +169,9 @@ def scan_omr():
             'percentage': round((score / total_questions * 100) if total_questions > 0 else 0, 2),
             'question_analysis': question_analysis,
             'processed_image': result.get('processed_image_path'),
-            'confidence': result.get('confidence', 0.95)
+            'confidence': result.get('confidence', 0.95),
+            'warp_path': result.get('warp_path'),
+            'quality': result.get('quality')
         }
         
         return jsonify(response_data)
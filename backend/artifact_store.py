@@ -0,0 +1,219 @@
+import hashlib
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+class ArtifactStore:
+    """Disk-bounded store for uploads, processed images and export files
+    
+    Artifacts are grouped (one group per scan) and placed in hashed fan-out
+    directories, ``<root>/ab/cd/<group>/<name>``, so no single directory grows
+    to millions of entries. A background janitor enforces the retention
+    policy: maximum age, newest N artifacts per group and a total byte budget
+    (oldest files are removed first).
+    """
+    
+    def __init__(self, root: str, max_bytes: Optional[int] = None,
+                 max_age_seconds: Optional[float] = None,
+                 keep_per_scan: Optional[int] = None,
+                 fanout_levels: int = 2):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.keep_per_scan = keep_per_scan
+        self.fanout_levels = fanout_levels
+        
+        self.total_bytes = 0
+        self.total_files = 0
+        self.removed_files = 0
+        
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._janitor = None
+        
+        os.makedirs(self.root, exist_ok=True)
+    
+    @classmethod
+    def from_env(cls, root: str, prefix: str = 'OMR_ARTIFACT') -> 'ArtifactStore':
+        """Build a store whose retention policy comes from environment variables
+        
+        ``<prefix>_MAX_BYTES``, ``<prefix>_MAX_AGE`` (seconds) and
+        ``<prefix>_KEEP_PER_SCAN``; unset means unlimited.
+        """
+        def env_number(name, cast):
+            value = os.environ.get(f'{prefix}_{name}')
+            return cast(value) if value else None
+        
+        return cls(
+            root,
+            max_bytes=env_number('MAX_BYTES', int),
+            max_age_seconds=env_number('MAX_AGE', float),
+            keep_per_scan=env_number('KEEP_PER_SCAN', int)
+        )
+    
+    def group_dir(self, group: str) -> str:
+        """Directory holding every artifact of `group`"""
+        digest = hashlib.sha1(group.encode('utf-8')).hexdigest()
+        buckets = [digest[i * 2:i * 2 + 2] for i in range(self.fanout_levels)]
+        return os.path.join(self.root, *buckets, group)
+    
+    def path_for(self, group: str, name: str) -> str:
+        """Return a writable path for artifact `name` of `group`, creating directories"""
+        group = os.path.basename(group) or 'default'
+        directory = self.group_dir(group)
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, os.path.basename(name))
+    
+    @property
+    def has_retention(self) -> bool:
+        """Whether any retention limit is set (otherwise sweeps never delete)"""
+        return (self.max_bytes is not None or self.max_age_seconds is not None
+                or self.keep_per_scan is not None)
+    
+    def start_janitor(self, interval: float = 300.0):
+        """Start the background retention sweep (idempotent)
+        
+        Without a retention limit there is nothing to enforce, so no thread
+        is started and the tree is never walked.
+        """
+        if not self.has_retention:
+            return
+        if self._janitor is not None and self._janitor.is_alive():
+            return
+        
+        self._stop_event.clear()
+        self._janitor = threading.Thread(
+            target=self._janitor_loop,
+            args=(interval,),
+            name=f'artifact-janitor:{self.root}',
+            daemon=True
+        )
+        self._janitor.start()
+    
+    def stop_janitor(self):
+        """Stop the background sweep and wait for it to exit"""
+        self._stop_event.set()
+        if self._janitor is not None:
+            self._janitor.join()
+            self._janitor = None
+    
+    def sweep(self, now: Optional[float] = None) -> Dict:
+        """Apply the retention policy once and return a summary"""
+        with self._lock:
+            now = time.time() if now is None else now
+            artifacts = self._scan()
+            doomed = set()
+            
+            # 1. Age limit
+            if self.max_age_seconds is not None:
+                cutoff = now - self.max_age_seconds
+                doomed.update(a['path'] for a in artifacts if a['mtime'] < cutoff)
+            
+            # 2. Newest N per scan group
+            if self.keep_per_scan is not None:
+                groups: Dict[str, List[Dict]] = {}
+                for artifact in artifacts:
+                    if artifact['path'] not in doomed:
+                        groups.setdefault(artifact['group'], []).append(artifact)
+                for members in groups.values():
+                    members.sort(key=lambda a: a['mtime'], reverse=True)
+                    doomed.update(a['path'] for a in members[self.keep_per_scan:])
+            
+            # 3. Total byte budget, oldest first
+            remaining = [a for a in artifacts if a['path'] not in doomed]
+            total = sum(a['size'] for a in remaining)
+            if self.max_bytes is not None and total > self.max_bytes:
+                for artifact in sorted(remaining, key=lambda a: a['mtime']):
+                    if total <= self.max_bytes:
+                        break
+                    doomed.add(artifact['path'])
+                    total -= artifact['size']
+            
+            removed = 0
+            for path in doomed:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+                
+                # Yield between deletions so a large purge does not monopolise the disk
+                if removed and removed % 100 == 0:
+                    time.sleep(0.01)
+            
+            self._remove_empty_dirs(now)
+            
+            self.total_bytes = total
+            self.total_files = len(artifacts) - removed
+            self.removed_files += removed
+            
+            return {'removed': removed, 'files': self.total_files, 'bytes': self.total_bytes}
+    
+    def _scan(self) -> List[Dict]:
+        """List every artifact with its size, mtime and group"""
+        artifacts = []
+        stack = [(self.root, 0)]
+        
+        while stack:
+            directory, depth = stack.pop()
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((entry.path, depth + 1))
+                elif entry.is_file(follow_symlinks=False) and depth == self.fanout_levels + 1:
+                    try:
+                        stat = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    artifacts.append({
+                        'path': entry.path,
+                        'group': directory,
+                        'size': stat.st_size,
+                        'mtime': stat.st_mtime
+                    })
+        
+        return artifacts
+    
+    def _remove_empty_dirs(self, now: float, grace_seconds: float = 60.0):
+        """Drop group and bucket directories left empty by a sweep
+        
+        Recently touched directories are kept so a request that has just
+        called path_for() does not lose its directory before writing.
+        """
+        for directory, subdirs, files in os.walk(self.root, topdown=False):
+            if directory != self.root and not subdirs and not files:
+                try:
+                    if os.stat(directory).st_mtime > now - grace_seconds:
+                        continue
+                    os.rmdir(directory)
+                except OSError:
+                    pass
+    
+    def _janitor_loop(self, interval: float):
+        _lower_thread_priority()
+        
+        while not self._stop_event.is_set():
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Artifact janitor error in {self.root}: {e}")
+            self._stop_event.wait(interval)
+
+
+def _lower_thread_priority():
+    """Run the calling thread at the lowest CPU priority
+    
+    On Linux nice values are per thread, and with the default best-effort I/O
+    class the kernel derives the I/O priority from the nice value, so this
+    also puts the janitor's disk traffic behind request handling.
+    """
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+    except (AttributeError, OSError):
+        pass
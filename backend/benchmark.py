@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for OpenCV / worker thread budgets.
+
+Processes the same set of sheets under several (workers x OpenCV threads)
+configurations with a SheetPool and reports sheets per second and latency
+percentiles, so the best OMR_CONCURRENCY_POLICY for a machine can be chosen
+from measurements.
+
+Usage:
+    python benchmark.py                              # sample sheets, policy presets
+    python benchmark.py --images ../samples/*.png --sheets 200 --mode accurate
+    python benchmark.py --configs 1x8,2x4,4x2,8x1 --json
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import numpy as np
+
+from concurrency import ConcurrencyConfig, SheetPool, available_cores, POLICIES
+from omr_engine import OMREngine, get_template_registry
+
+DEFAULT_IMAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'samples', '*.png')
+
+
+def parse_configs(spec, cores):
+    """'2x4,4x2' -> [(2, 4), (4, 2)]; empty -> one config per policy"""
+    if not spec:
+        configs = []
+        for policy in POLICIES:
+            config = ConcurrencyConfig(policy, cores=cores)
+            pair = (config.workers, config.opencv_threads)
+            if pair not in configs:
+                configs.append(pair)
+        return configs
+    
+    configs = []
+    for item in spec.split(','):
+        workers, _, threads = item.strip().partition('x')
+        configs.append((int(workers), int(threads or 1)))
+    return configs
+
+
+class TimedEngine:
+    """Engine wrapper recording the processing time of every sheet"""
+    
+    def __init__(self, engine):
+        self.engine = engine
+        self.latencies = []
+    
+    def process_bytes(self, data, template, image_path=None):
+        started = time.perf_counter()
+        result = self.engine.process_bytes(data, template, image_path)
+        self.latencies.append(time.perf_counter() - started)
+        return result
+
+
+def run_config(engine, images, template, workers, opencv_threads, sheets):
+    """Process `sheets` images; returns throughput and latency statistics"""
+    import cv2
+    cv2.setNumThreads(opencv_threads)
+    
+    timed = TimedEngine(engine)
+    
+    with SheetPool(timed, workers) as pool:
+        # Warm-up: first calls allocate OpenCV buffers and thread pools
+        pool.map(images[:workers], template)
+        timed.latencies.clear()
+        
+        started = time.perf_counter()
+        results = pool.map((images[i % len(images)] for i in range(sheets)), template)
+        elapsed = time.perf_counter() - started
+    
+    failures = sum(1 for result in results if not result['success'])
+    latency_ms = np.array(timed.latencies) * 1000
+    return {
+        'workers': workers,
+        'opencv_threads': opencv_threads,
+        'sheets': sheets,
+        'failures': failures,
+        'seconds': round(elapsed, 3),
+        'sheets_per_second': round(sheets / elapsed, 2),
+        'p50_ms': round(float(np.percentile(latency_ms, 50)), 1),
+        'p95_ms': round(float(np.percentile(latency_ms, 95)), 1),
+        'p99_ms': round(float(np.percentile(latency_ms, 99)), 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark worker / OpenCV thread configurations')
+    parser.add_argument('--images', nargs='*', default=[DEFAULT_IMAGES],
+                        help='Image files or glob patterns (default: ../samples/*.png)')
+    parser.add_argument('--template', default='default', help='Template name (default: default)')
+    parser.add_argument('--mode', default='auto', help='Engine mode: fast, accurate or auto')
+    parser.add_argument('--sheets', type=int, default=100, help='Sheets per configuration')
+    parser.add_argument('--configs', default='',
+                        help='Comma-separated WORKERSxTHREADS list (default: one per policy)')
+    parser.add_argument('--cores', type=int, default=None, help='Core count to plan for')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+    
+    paths = sorted({path for pattern in args.images for path in glob.glob(pattern)})
+    if not paths:
+        print("No images found")
+        sys.exit(1)
+    
+    template = get_template_registry().get(args.template)
+    if template is None:
+        print(f"Template {args.template} not found")
+        sys.exit(1)
+    
+    images = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            images.append(f.read())
+    
+    cores = args.cores or available_cores()
+    engine = OMREngine(mode=args.mode)
+    results = [
+        run_config(engine, images, template, workers, threads, args.sheets)
+        for workers, threads in parse_configs(args.configs, cores)
+    ]
+    best = max(results, key=lambda r: r['sheets_per_second'])
+    
+    if args.json:
+        print(json.dumps({'cores': cores, 'results': results, 'best': best}, indent=2))
+        return
+    
+    print(f"{len(images)} image(s), {args.sheets} sheets per config, {cores} cores, mode {args.mode}")
+    print(f"{'workers':>8} {'cv threads':>10} {'sheets/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'failed':>7}")
+    for r in results:
+        marker = '  <- best' if r is best else ''
+        print(f"{r['workers']:>8} {r['opencv_threads']:>10} {r['sheets_per_second']:>9} "
+              f"{r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} {r['failures']:>7}{marker}")
+    print(f"\nSet OMR_WORKERS={best['workers']} OMR_OPENCV_THREADS={best['opencv_threads']} to use the best configuration")
+
+
+if __name__ == '__main__':
+    main()
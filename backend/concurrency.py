@@ -0,0 +1,145 @@
+"""
+Thread budgeting between OpenCV and the request workers.
+
+OpenCV parallelizes many calls internally (thresholding, warps, resizes)
+with one thread per core by default. Running several sheets at once on top
+of that oversubscribes the cores: N workers x N OpenCV threads. This module
+splits the core budget explicitly between the two levels.
+
+Policies (OMR_CONCURRENCY_POLICY):
+    workers   One sheet per core, OpenCV single-threaded (default; best
+              throughput for many small sheets)
+    opencv    One sheet at a time, OpenCV uses every core (best latency for
+              a single large sheet)
+    balanced  Half the cores as workers, the rest shared by OpenCV
+
+OMR_WORKERS and OMR_OPENCV_THREADS override the derived numbers.
+
+When the workers are separate processes (gunicorn), each process must only
+run its own share at once; gunicorn.conf.py sets OMR_PROCESS_SLOTS for that.
+"""
+
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+POLICIES = ('workers', 'opencv', 'balanced')
+
+
+def available_cores() -> int:
+    """Cores this process may run on (respects CPU affinity / cpusets)"""
+    if hasattr(os, 'sched_getaffinity'):
+        return max(1, len(os.sched_getaffinity(0)))
+    return max(1, os.cpu_count() or 1)
+
+
+class ConcurrencyConfig:
+    """How many sheets run at once and how many threads OpenCV gets for each
+    
+    `workers` is the sheet budget of the whole box; `slots` is how many of
+    them this process runs at once (all of them unless the workers are
+    separate processes).
+    """
+    
+    def __init__(self, policy: str = 'workers', cores: Optional[int] = None,
+                 workers: Optional[int] = None, opencv_threads: Optional[int] = None,
+                 slots: Optional[int] = None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown concurrency policy: {policy} (expected one of {', '.join(POLICIES)})")
+        
+        self.policy = policy
+        self.cores = cores or available_cores()
+        
+        if policy == 'workers':
+            default_workers, default_threads = self.cores, 1
+        elif policy == 'opencv':
+            default_workers, default_threads = 1, self.cores
+        else:
+            default_workers = max(1, self.cores // 2)
+            default_threads = max(1, self.cores // default_workers)
+        
+        self.workers = max(1, workers or default_workers)
+        self.opencv_threads = max(1, opencv_threads or default_threads)
+        self.slots = max(1, slots or self.workers)
+    
+    @classmethod
+    def from_env(cls) -> 'ConcurrencyConfig':
+        def env_int(name):
+            value = os.environ.get(name)
+            return int(value) if value else None
+        
+        return cls(
+            policy=os.environ.get('OMR_CONCURRENCY_POLICY', 'workers'),
+            workers=env_int('OMR_WORKERS'),
+            opencv_threads=env_int('OMR_OPENCV_THREADS'),
+            slots=env_int('OMR_PROCESS_SLOTS')
+        )
+    
+    def apply(self) -> 'ConcurrencyConfig':
+        """Set OpenCV's thread count for this process"""
+        import cv2
+        cv2.setNumThreads(self.opencv_threads)
+        return self
+    
+    def to_dict(self) -> Dict:
+        return {
+            'policy': self.policy,
+            'cores': self.cores,
+            'workers': self.workers,
+            'opencv_threads': self.opencv_threads,
+            'slots': self.slots
+        }
+    
+    def __repr__(self):
+        return (f"ConcurrencyConfig(policy={self.policy!r}, cores={self.cores}, "
+                f"workers={self.workers}, opencv_threads={self.opencv_threads}, slots={self.slots})")
+
+
+class SheetPool:
+    """Process independent sheets on a thread pool
+    
+    OpenCV releases the GIL inside its C++ calls, so threads decode,
+    threshold and warp different sheets in parallel without the copies a
+    process pool would need. Each task runs in a copy of the caller's
+    context, so e.g. a batch_grid_cache() opened by the caller is shared.
+    """
+    
+    def __init__(self, engine, workers: Optional[int] = None):
+        self.engine = engine
+        self.workers = workers or available_cores()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='omr-sheet')
+    
+    def submit(self, data, template, image_path: Optional[str] = None):
+        """Queue one encoded image; returns a Future of the engine result"""
+        context = contextvars.copy_context()
+        return self._executor.submit(context.run, self.engine.process_bytes, data, template, image_path)
+    
+    def map(self, images: Iterable, template) -> List[Dict]:
+        """Process encoded images concurrently; results in input order"""
+        futures = [self.submit(data, template) for data in images]
+        return [future.result() for future in futures]
+    
+    def close(self):
+        self._executor.shutdown(wait=True)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+_config = None
+_config_lock = threading.Lock()
+
+
+def get_concurrency_config() -> ConcurrencyConfig:
+    """Process-wide configuration from the environment, applied on first use"""
+    global _config
+    if _config is None:
+        with _config_lock:
+            if _config is None:
+                _config = ConcurrencyConfig.from_env().apply()
+    return _config
@@ -0,0 +1,90 @@
+"""
+SQLite storage of graded scans.
+
+Shared by the Flask app and the hot-folder daemon, so both write the same
+``scans`` schema without the daemon importing (and starting) the web app.
+"""
+
+import json
+import sqlite3
+from typing import Dict, Iterable
+
+DATABASE_PATH = 'omr_scanner.db'
+
+# Template fields stored in their own indexed scans columns (all fields are
+# also kept in the JSON fields column)
+INDEXED_FIELDS = ('roll_number', 'booklet_code')
+
+INSERT_SCAN = '''
+    INSERT INTO scans (filename, template_name, answers, score, total_questions, fill_ratios,
+                       fields, roll_number, booklet_code)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+def init_database(database_path: str = DATABASE_PATH):
+    """Create the scans table and apply column migrations"""
+    conn = sqlite3.connect(database_path)
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scans (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            filename TEXT NOT NULL,
+            template_name TEXT NOT NULL,
+            answers TEXT NOT NULL,
+            score INTEGER NOT NULL,
+            total_questions INTEGER NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Columns added after the original schema
+    existing_columns = {row[1] for row in cursor.execute('PRAGMA table_info(scans)')}
+    if 'fill_ratios' not in existing_columns:
+        cursor.execute('ALTER TABLE scans ADD COLUMN fill_ratios TEXT')
+    if 'fields' not in existing_columns:
+        cursor.execute('ALTER TABLE scans ADD COLUMN fields TEXT')
+    for field_name in INDEXED_FIELDS:
+        if field_name not in existing_columns:
+            cursor.execute(f'ALTER TABLE scans ADD COLUMN {field_name} TEXT')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_scans_{field_name} ON scans ({field_name})')
+    
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_scans_template_timestamp ON scans (template_name, timestamp)')
+    
+    conn.commit()
+    conn.close()
+
+def scan_row(filename: str, template_name: str, result: Dict, score: int) -> tuple:
+    """INSERT_SCAN parameters for one engine result"""
+    answers = result['answers']
+    fields = result.get('fields') or {}
+    
+    return (filename, template_name, json.dumps(answers), score, len(answers),
+            json.dumps(result.get('fill_ratios')), json.dumps(fields) if fields else None,
+            fields.get('roll_number'), fields.get('booklet_code'))
+
+def insert_scan(database_path: str, row: tuple) -> int:
+    """Insert one scan row and return its id"""
+    conn = sqlite3.connect(database_path)
+    try:
+        with conn:
+            return conn.execute(INSERT_SCAN, row).lastrowid
+    finally:
+        conn.close()
+
+def scan_exists(database_path: str, scan_id: int) -> bool:
+    """Whether the scans row `scan_id` is still stored"""
+    conn = sqlite3.connect(database_path)
+    try:
+        return conn.execute('SELECT 1 FROM scans WHERE id = ?', (scan_id,)).fetchone() is not None
+    finally:
+        conn.close()
+
+def insert_scans(database_path: str, rows: Iterable[tuple], timeout: float = 30):
+    """Insert many scan rows in one transaction"""
+    conn = sqlite3.connect(database_path, timeout=timeout)
+    try:
+        with conn:
+            conn.executemany(INSERT_SCAN, rows)
+    finally:
+        conn.close()
@@ -0,0 +1,28 @@
+# Gunicorn settings derived from the OMR concurrency policy (concurrency.py):
+#   gunicorn -c gunicorn.conf.py app:app
+import os
+
+import db
+from concurrency import ConcurrencyConfig
+
+_concurrency = ConcurrencyConfig.from_env()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# One sheet per worker process; OpenCV gets the rest of the core budget
+workers = _concurrency.workers
+threads = 1
+timeout = 120
+
+# The worker count already spends the sheet budget: each process (and its
+# slot utilization gauge) only gets as many processing slots as threads
+raw_env = [f'OMR_PROCESS_SLOTS={threads}']
+
+
+def on_starting(server):
+    # Once, in the master: app.py only creates the schema under `python app.py`
+    db.init_database()
+
+
+def post_fork(server, worker):
+    _concurrency.apply()
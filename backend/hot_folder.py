@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+Hot-folder ingest daemon: grades every sheet dropped into a directory.
+
+Scanner stations write into a (network) share; this daemon polls it, waits
+until each file has stopped changing, claims it by renaming it into
+``.processing/`` (so two daemons or a half-finished copy can never process
+the same file), grades it on a pool of worker threads and writes the results
+to the ``scans`` table in batches. Graded files end up in ``.done/``, files
+that could not be graded in ``.failed/``.
+
+The scanner, the workers and the database writer are connected by bounded
+queues: when grading falls behind, the scanner stops claiming and the rest
+of a large drop simply waits in the folder, so memory stays flat however
+many files arrive. Files left in ``.processing/`` by a crash are graded
+again on the next start.
+
+Usage:
+    python hot_folder.py /mnt/scans --template default --answer-key '["A", "B", ...]'
+    python hot_folder.py /mnt/scans --answer-key @key.json --workers 4 --batch-size 100
+"""
+
+import argparse
+import json
+import os
+import queue
+import signal
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from itertools import count
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import db
+from concurrency import get_concurrency_config
+from omr_engine import OMREngine, batch_grid_cache, get_template_registry
+from omr_engine.rawio import RawImageError, is_raw_image, map_pages
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp', '.pgm', '.raw', '.gray')
+
+# Headerless formats whose JSON sidecar is claimed together with the page file
+SIDECAR_EXTENSIONS = ('.raw', '.gray')
+
+# Partially written files are usually named like this until the copy completes
+TEMP_SUFFIXES = ('.tmp', '.part', '.partial', '.crdownload', '~')
+
+# A JPEG or PNG missing its end marker is waited on this many times longer
+INCOMPLETE_SETTLE_FACTOR = 10
+
+PROCESSING_DIR = '.processing'
+DONE_DIR = '.done'
+FAILED_DIR = '.failed'
+
+
+class HotFolder:
+    """Watch `watch_dir` and grade every sheet that lands in it
+    
+    Args:
+        watch_dir: Directory the scanners write into
+        template: Compiled template used for every sheet
+        answer_key: Correct answers, one per question (may be empty)
+        engine: OMREngine used by the workers
+        database_path: SQLite database holding the scans table
+        workers: Number of grading threads
+        queue_size: Claimed files (and finished results) held in memory at most
+        batch_size: Rows per INSERT transaction
+        settle_seconds: How long size and mtime must stay unchanged before
+            a file is claimed
+        poll_interval: Seconds between directory scans
+        flush_interval: Seconds after which a partial batch is written anyway
+    """
+    
+    def __init__(self, watch_dir: str, template, answer_key: List[str], engine: OMREngine,
+                 database_path: str, workers: int = 2, queue_size: int = 64, batch_size: int = 50,
+                 settle_seconds: float = 2.0, poll_interval: float = 1.0, flush_interval: float = 5.0):
+        self.watch_dir = os.path.abspath(watch_dir)
+        self.template = template
+        self.answer_key = answer_key
+        self.engine = engine
+        self.database_path = database_path
+        self.workers = workers
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.flush_interval = flush_interval
+        
+        self.processing_dir = os.path.join(self.watch_dir, PROCESSING_DIR)
+        self.done_dir = os.path.join(self.watch_dir, DONE_DIR)
+        self.failed_dir = os.path.join(self.watch_dir, FAILED_DIR)
+        for directory in (self.processing_dir, self.done_dir, self.failed_dir):
+            os.makedirs(directory, exist_ok=True)
+        
+        self._claimed = queue.Queue(maxsize=queue_size)   # claimed file paths
+        self._finished = queue.Queue(maxsize=queue_size)  # (path, rows, error)
+        self._stop = threading.Event()
+        self._pending = {}  # name -> (size, mtime_ns, unchanged since)
+        self._sequence = count(1)
+        self._threads = []
+        
+        self._stats_lock = threading.Lock()
+        self.stats = {'claimed': 0, 'graded': 0, 'failed': 0, 'inserted': 0}
+    
+    def start(self):
+        """Start the scanner, the workers and the database writer"""
+        self._threads = [threading.Thread(target=self._scan_loop, name='hot-folder-scan', daemon=True)]
+        self._threads += [
+            threading.Thread(target=self._work_loop, name=f'hot-folder-worker-{i}', daemon=True)
+            for i in range(self.workers)
+        ]
+        self._writer = threading.Thread(target=self._write_loop, name='hot-folder-writer', daemon=True)
+        
+        for thread in self._threads:
+            thread.start()
+        self._writer.start()
+        return self
+    
+    def stop(self):
+        """Stop claiming new files, finish the claimed ones and flush the last batch"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._finished.put(None)
+        self._writer.join()
+    
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self.stats[key] += amount
+    
+    # Scanner
+    
+    def _recover(self):
+        """Re-queue files claimed by a previous run that never finished"""
+        for name in sorted(os.listdir(self.processing_dir)):
+            path = os.path.join(self.processing_dir, name)
+            if self._is_candidate(name) and os.path.isfile(path):
+                print(f"Recovering {name} claimed by a previous run")
+                self._count('claimed')
+                if not self._enqueue(path):
+                    return
+    
+    def _enqueue(self, path: str) -> bool:
+        """Queue a claimed file, waiting while the workers are behind (backpressure)"""
+        while not self._stop.is_set():
+            try:
+                self._claimed.put(path, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        # Stopping: the file stays in .processing/ and is recovered on restart
+        return False
+    
+    def _scan_loop(self):
+        self._recover()
+        while not self._stop.is_set():
+            try:
+                self._scan_once()
+            except OSError as e:
+                # The share may be briefly unavailable; keep polling
+                print(f"Error scanning {self.watch_dir}: {e}")
+            self._stop.wait(self.poll_interval)
+    
+    def _scan_once(self):
+        now = time.monotonic()
+        seen = set()
+        
+        with os.scandir(self.watch_dir) as entries:
+            for entry in entries:
+                if self._stop.is_set():
+                    return
+                if not self._is_candidate(entry.name) or not entry.is_file():
+                    continue
+                
+                seen.add(entry.name)
+                stat = entry.stat()
+                signature = (stat.st_size, stat.st_mtime_ns)
+                previous = self._pending.get(entry.name)
+                
+                if previous is None or previous[:2] != signature:
+                    # New or still being written: (re)start the settle timer,
+                    # but never track more files than can be queued soon
+                    if previous is not None or len(self._pending) < 4 * self.queue_size:
+                        self._pending[entry.name] = signature + (now,)
+                    continue
+                
+                settled_for = now - previous[2]
+                if stat.st_size == 0 or settled_for < self.settle_seconds:
+                    continue
+                if settled_for < self.settle_seconds * INCOMPLETE_SETTLE_FACTOR and not self._has_end_marker(entry.path):
+                    continue  # Stalled copy; a truncated file is claimed (and fails) eventually
+                if entry.name.lower().endswith(SIDECAR_EXTENSIONS) and self._sidecar(entry.name) is None:
+                    continue  # The sidecar has not arrived yet
+                
+                path = self._claim(entry.name)
+                del self._pending[entry.name]
+                if path is not None and not self._enqueue(path):
+                    return
+        
+        # Forget files that were removed or claimed by someone else
+        for name in list(self._pending):
+            if name not in seen:
+                del self._pending[name]
+    
+    @staticmethod
+    def _is_candidate(name: str) -> bool:
+        lower = name.lower()
+        return (not name.startswith('.') and lower.endswith(IMAGE_EXTENSIONS)
+                and not lower.endswith(TEMP_SUFFIXES))
+    
+    @staticmethod
+    def _has_end_marker(path: str) -> bool:
+        """Whether a JPEG ends with EOI / a PNG with its IEND chunk (other formats: True)"""
+        lower = path.lower()
+        if lower.endswith(('.jpg', '.jpeg')):
+            marker = b'\xff\xd9'
+        elif lower.endswith('.png'):
+            marker = b'IEND\xaeB`\x82'
+        else:
+            return True
+        
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 32))
+            return marker in f.read()
+    
+    def _sidecar(self, name: str) -> Optional[str]:
+        for candidate in (name + '.json', os.path.splitext(name)[0] + '.json'):
+            if os.path.isfile(os.path.join(self.watch_dir, candidate)):
+                return candidate
+        return None
+    
+    def _claim(self, name: str) -> Optional[str]:
+        """Atomically move a settled file into .processing/; None if it is gone"""
+        claimed_name = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{next(self._sequence)}_{name}"
+        target = os.path.join(self.processing_dir, claimed_name)
+        sidecar = self._sidecar(name) if name.lower().endswith(SIDECAR_EXTENSIONS) else None
+        
+        try:
+            os.rename(os.path.join(self.watch_dir, name), target)
+        except FileNotFoundError:
+            return None  # Another daemon claimed it first
+        
+        if sidecar is not None:
+            try:
+                os.rename(os.path.join(self.watch_dir, sidecar), target + '.json')
+            except FileNotFoundError:
+                pass  # Grading reports the missing sidecar
+        
+        self._count('claimed')
+        return target
+    
+    # Workers
+    
+    def _work_loop(self):
+        # Every sheet in the folder uses the same template and scanner,
+        # so grid fits are shared across the whole run
+        with batch_grid_cache():
+            while True:
+                try:
+                    path = self._claimed.get(timeout=0.5)
+                except queue.Empty:
+                    if self._stop.is_set():
+                        return
+                    continue
+                
+                try:
+                    rows, error = self._grade(path)
+                except Exception as e:
+                    rows, error = [], str(e)
+                
+                self._count('failed' if error else 'graded')
+                self._finished.put((path, rows, error))
+    
+    def _grade(self, path: str) -> Tuple[List[tuple], Optional[str]]:
+        """Grade one claimed file; returns (scans rows, error)"""
+        name = os.path.basename(path)
+        
+        if is_raw_image(path):
+            try:
+                pages = map_pages(path)
+            except (OSError, RawImageError) as e:
+                return [], f'Could not load image: {e}'
+            results = [self.engine.process_array(page, self.template) for page in pages]
+        else:
+            results = [self.engine.process_bytes(np.fromfile(path, dtype=np.uint8), self.template)]
+        
+        rows = []
+        for page, result in enumerate(results):
+            if not result['success']:
+                return [], result['error'] if len(results) == 1 else f"Page {page + 1}: {result['error']}"
+            
+            filename = name if len(results) == 1 else f"{name}#page{page + 1}"
+            rows.append(self._scan_row(filename, result))
+        return rows, None
+    
+    def _scan_row(self, filename: str, result: Dict) -> tuple:
+        score = sum(1 for i, answer in enumerate(result['answers'])
+                    if i < len(self.answer_key) and answer == self.answer_key[i])
+        return db.scan_row(filename, self.template.name, result, score)
+    
+    # Database writer
+    
+    def _write_loop(self):
+        batch = []  # (path, rows, error)
+        rows = 0
+        deadline = None
+        
+        while True:
+            try:
+                timeout = None if not batch else max(0.0, deadline - time.monotonic())
+                item = self._finished.get(timeout=timeout)
+            except queue.Empty:
+                item = ()  # flush_interval passed: write the partial batch
+            
+            if item:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(item)
+                rows += len(item[1])
+                if rows < self.batch_size and len(batch) < self.batch_size and time.monotonic() < deadline:
+                    continue
+            
+            if batch:
+                self._flush(batch)
+                batch = []
+                rows = 0
+            if item is None:
+                return
+    
+    def _flush(self, batch):
+        rows = [row for _, file_rows, _ in batch for row in file_rows]
+        
+        if rows:
+            try:
+                db.insert_scans(self.database_path, rows)
+            except sqlite3.Error as e:
+                # Leave the files claimed: they are graded again on restart
+                print(f"Error writing {len(rows)} scan(s) to {self.database_path}: {e}")
+                return
+            self._count('inserted', len(rows))
+        
+        # Only move files once their rows are committed
+        for path, _, error in batch:
+            if error:
+                print(f"Failed to grade {os.path.basename(path)}: {error}")
+            self._move(path, self.failed_dir if error else self.done_dir)
+    
+    @staticmethod
+    def _move(path: str, directory: str):
+        for source in (path, path + '.json'):
+            if os.path.exists(source):
+                try:
+                    os.replace(source, os.path.join(directory, os.path.basename(source)))
+                except OSError as e:
+                    print(f"Error moving {source}: {e}")
+
+
+def load_answer_key(value: str) -> List[str]:
+    """JSON list, or @path of a file holding one"""
+    if not value:
+        return []
+    if value.startswith('@'):
+        with open(value[1:]) as f:
+            value = f.read()
+    answer_key = json.loads(value)
+    if not isinstance(answer_key, list):
+        raise ValueError('Answer key must be a JSON list')
+    return answer_key
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Grade every sheet dropped into a directory')
+    parser.add_argument('watch_dir', help='Directory the scanners write into')
+    parser.add_argument('--template', default='default', help='Template name (default: default)')
+    parser.add_argument('--answer-key', default='', help='JSON list of answers, or @file')
+    parser.add_argument('--database', default=None, help='SQLite database (default: the app database)')
+    parser.add_argument('--mode', default=None, help='Engine mode: fast, accurate or auto')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Grading threads (default: from OMR_CONCURRENCY_POLICY)')
+    parser.add_argument('--queue-size', type=int, default=64, help='Files held in memory at most')
+    parser.add_argument('--batch-size', type=int, default=50, help='Rows per database transaction')
+    parser.add_argument('--settle', type=float, default=2.0,
+                        help='Seconds a file must stay unchanged before it is claimed')
+    parser.add_argument('--poll', type=float, default=1.0, help='Seconds between directory scans')
+    args = parser.parse_args()
+    
+    template = get_template_registry().get(args.template)
+    if template is None:
+        print(f"Template {args.template} not found")
+        sys.exit(1)
+    
+    try:
+        answer_key = load_answer_key(args.answer_key)
+    except (OSError, ValueError) as e:
+        print(f"Invalid answer key: {e}")
+        sys.exit(1)
+    
+    # Same database and schema migrations as the Flask app
+    database_path = args.database or db.DATABASE_PATH
+    db.init_database(database_path)
+    
+    folder = HotFolder(
+        args.watch_dir, template, answer_key, OMREngine(mode=args.mode), database_path,
+        workers=args.workers or get_concurrency_config().workers,
+        queue_size=args.queue_size, batch_size=args.batch_size,
+        settle_seconds=args.settle, poll_interval=args.poll
+    ).start()
+    print(f"Watching {folder.watch_dir} with {folder.workers} worker(s), template {template.name}")
+    
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    try:
+        while not stop.wait(60):
+            print(f"Hot folder: {folder.stats}")
+    except KeyboardInterrupt:
+        pass
+    
+    print("Stopping: finishing claimed files")
+    folder.stop()
+    print(f"Hot folder: {folder.stats}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Import-time budget check for the scan path.
+
+Runs ``python -X importtime -c "import app"`` in a fresh interpreter, parses
+the per-module timings and fails when the cold start exceeds the budget or
+when an export-only dependency (pandas, ReportLab, openpyxl) is loaded
+eagerly.
+
+Usage:
+    python import_budget.py                  # default budget
+    python import_budget.py --budget-ms 800 --module app
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+# Modules that must only be imported when their export format is requested
+FORBIDDEN_MODULES = ('pandas', 'reportlab', 'openpyxl', 'pyarrow')
+
+DEFAULT_BUDGET_MS = 1500
+
+# "import time:       123 |        456 |   package.module"
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s*\|\s*(\d+)\s*\|(\s*)(\S+)\s*$')
+
+
+def measure_imports(module='app', cwd=None):
+    """Import `module` in a fresh interpreter and return {name: cumulative_us}"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=cwd or os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True
+    )
+
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+
+    timings = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            timings[match.group(4)] = int(match.group(2))
+
+    return timings
+
+
+def check_budget(timings, module='app', budget_ms=DEFAULT_BUDGET_MS):
+    """Return a list of budget violations (empty when within budget)"""
+    problems = []
+
+    total_ms = timings.get(module, 0) / 1000
+    if total_ms > budget_ms:
+        problems.append(f"import {module} took {total_ms:.1f} ms (budget {budget_ms} ms)")
+
+    for name in timings:
+        root = name.split('.')[0]
+        if root in FORBIDDEN_MODULES:
+            problems.append(f"{root} is imported at startup; load it lazily in its export back-end")
+            break
+
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the scan path cold-start import budget')
+    parser.add_argument('--module', default='app', help='Module to import (default: app)')
+    parser.add_argument('--budget-ms', type=float,
+                        default=float(os.environ.get('OMR_IMPORT_BUDGET_MS', DEFAULT_BUDGET_MS)),
+                        help='Maximum cumulative import time in milliseconds')
+    parser.add_argument('--top', type=int, default=10, help='Show the N slowest imports')
+    args = parser.parse_args()
+
+    timings = measure_imports(args.module)
+
+    print(f"Slowest imports for '{args.module}':")
+    for name, us in sorted(timings.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+    problems = check_budget(timings, args.module, args.budget_ms)
+    for problem in problems:
+        print(f"❌ {problem}")
+
+    if not problems:
+        print(f"✅ import {args.module} within {args.budget_ms:.0f} ms budget")
+
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+Local load test for the scan API.
+
+Generates a corpus of synthetic sheets with samples/generate_sheets.py
+(random answers, cached between runs), starts the Flask app or the Vercel
+scan handler on localhost in a separate process, and drives POST /api/scan
+with raw image bodies. Every --interval seconds it prints throughput, error
+rate and p50/p95/p99 latency for that window, then a summary for the run.
+
+Two load models:
+    --concurrency N   closed loop: N clients, each sending its next request
+                      as soon as the previous one returns
+    --rate R          open loop: R requests per second on a fixed schedule
+                      (--poisson for exponential gaps). Latency is measured
+                      from the scheduled send time, so time spent waiting for
+                      a free client counts when the server falls behind
+
+The server process gets --env settings (e.g. OMR_WORKERS, OMR_OPENCV_THREADS)
+on top of the current environment, so configurations can be compared run by
+run. Its result cache is off unless --env sets OMR_RESULT_CACHE_ENTRIES,
+because a cache hit on a re-sent corpus sheet would skip the engine. Only
+loopback addresses are accepted.
+
+Usage:
+    python load_test.py --server app --concurrency 8 --duration 60
+    python load_test.py --server api --rate 20 --poisson --duration 120
+    python load_test.py --server app --env OMR_WORKERS=4 --env OMR_OPENCV_THREADS=2 --json
+    python load_test.py --url http://127.0.0.1:8000/api/scan --concurrency 16   # e.g. gunicorn
+"""
+
+import argparse
+import contextlib
+import glob
+import http.client
+import importlib.util
+import ipaddress
+import itertools
+import json
+import mimetypes
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlparse
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BACKEND_DIR)
+GENERATOR_PATH = os.path.join(ROOT_DIR, 'samples', 'generate_sheets.py')
+DEFAULT_CORPUS_DIR = os.path.join(tempfile.gettempdir(), 'omr_load_corpus')
+
+# Seconds to wait for a spawned server to accept connections
+SERVER_START_TIMEOUT = 60
+
+
+class Sample(NamedTuple):
+    """One finished request"""
+    finished: float  # Seconds since the start of the run
+    latency: float  # Seconds
+    status: int  # HTTP status; 0 when the request itself failed
+    error: Optional[str]
+
+
+def build_corpus(template_name: str, sheets: int, seed: int, corpus_dir: str) -> List[str]:
+    """Generate (or reuse) `sheets` filled sheets with random answers"""
+    directory = os.path.join(corpus_dir, f"{template_name}_{seed}_{sheets}")
+    truth_path = os.path.join(directory, 'answers.jsonl')
+    if os.path.exists(truth_path):
+        with open(truth_path) as f:
+            paths = [os.path.join(directory, json.loads(line)['file']) for line in f]
+        if len(paths) == sheets and all(os.path.exists(path) for path in paths):
+            return paths
+    
+    spec = importlib.util.spec_from_file_location('generate_sheets', GENERATOR_PATH)
+    generator = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(generator)
+    
+    print(f"Generating {sheets} sheet(s) for template {template_name} in {directory}")
+    records = generator.generate(template_name, sheets, directory, seed=seed)
+    return [os.path.join(directory, record['file']) for record in records]
+
+
+def check_loopback(url: str):
+    host = urlparse(url).hostname or ''
+    if host == 'localhost':
+        return
+    try:
+        if ipaddress.ip_address(host).is_loopback:
+            return
+    except ValueError:
+        pass
+    raise ValueError(f"Refusing to load-test {host}: only localhost targets are allowed")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def serve(kind: str, port: int):
+    """Run the Flask app or the Vercel scan handler on 127.0.0.1:`port` (blocks)"""
+    if kind == 'app':
+        import logging
+        from werkzeug.serving import make_server
+        import app as flask_app
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)  # No access log line per request
+        flask_app.init_database()
+        server = make_server('127.0.0.1', port, flask_app.app, threaded=True)
+    else:
+        from http.server import ThreadingHTTPServer
+        spec = importlib.util.spec_from_file_location('api_scan', os.path.join(ROOT_DIR, 'api', 'scan.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        
+        class QuietHandler(module.handler):
+            def log_message(self, format, *args):
+                pass
+        
+        server = ThreadingHTTPServer(('127.0.0.1', port), QuietHandler)
+    
+    print(f"Serving {kind} on http://127.0.0.1:{port}", flush=True)
+    server.serve_forever()
+
+
+@contextlib.contextmanager
+def spawn_server(kind: str, env_overrides: Dict[str, str]):
+    """Start `serve` in a child process (own GIL, own working directory); yields the scan URL"""
+    port = free_port()
+    env = dict(os.environ)
+    env.setdefault('OMR_RESULT_CACHE_ENTRIES', '0')
+    env.update(env_overrides)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [BACKEND_DIR, env.get('PYTHONPATH')]))
+    
+    # Uploads, results and the database of the run stay out of the repository
+    workdir = tempfile.mkdtemp(prefix='omr_load_')
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--serve-only', kind, '--port', str(port)],
+        cwd=workdir, env=env, stdout=sys.stderr  # Keep --json output clean
+    )
+    try:
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"{kind} server exited with code {process.returncode}")
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{kind} server did not start within {SERVER_START_TIMEOUT}s")
+                time.sleep(0.2)
+        yield f"http://127.0.0.1:{port}/api/scan"
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+class LoadRun:
+    """Sends scan requests and collects one Sample per finished request"""
+    
+    def __init__(self, url: str, images: List[Tuple[bytes, str]], template: str, timeout: float):
+        parsed = urlparse(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.path = f"{parsed.path or '/api/scan'}?template={template}"
+        self.images = images
+        self.timeout = timeout
+        self.samples: List[Sample] = []
+        self.in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        self._next_image = itertools.count()
+        self._local = threading.local()
+        self._started = None
+    
+    def _connection(self) -> http.client.HTTPConnection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection(
+                self.host, self.port, timeout=self.timeout)
+        return connection
+    
+    def send(self, scheduled: Optional[float] = None):
+        """One request; latency counts from `scheduled` (perf_counter) if given"""
+        body, content_type = self.images[next(self._next_image) % len(self.images)]
+        started = scheduled if scheduled is not None else time.perf_counter()
+        with self._in_flight_lock:
+            self.in_flight += 1
+        status, error = 0, None
+        try:
+            connection = self._connection()
+            connection.request('POST', self.path, body=body, headers={'Content-Type': content_type})
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+            if status >= 400:
+                error = f"HTTP {status}"
+        except (OSError, http.client.HTTPException) as e:
+            error = type(e).__name__
+            self._connection().close()
+        finally:
+            with self._in_flight_lock:
+                self.in_flight -= 1
+        
+        finished = time.perf_counter()
+        self.samples.append(Sample(finished - self._started, finished - started, status, error))
+    
+    def run_closed(self, clients: int, duration: float):
+        self._started = time.perf_counter()
+        deadline = self._started + duration
+        
+        def client():
+            while time.perf_counter() < deadline:
+                self.send()
+        
+        threads = [threading.Thread(target=client, daemon=True) for _ in range(clients)]
+        for thread in threads:
+            thread.start()
+        return threads
+    
+    def run_open(self, rate: float, duration: float, poisson: bool, max_clients: int, seed: int):
+        self._started = time.perf_counter()
+        executor = ThreadPoolExecutor(max_workers=max_clients)
+        rng = random.Random(seed)
+        
+        def schedule():
+            scheduled = self._started
+            deadline = self._started + duration
+            while True:
+                scheduled += rng.expovariate(rate) if poisson else 1.0 / rate
+                if scheduled >= deadline:
+                    break
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(self.send, scheduled)
+            executor.shutdown(wait=True)
+        
+        thread = threading.Thread(target=schedule, daemon=True)
+        thread.start()
+        return [thread]
+
+
+def summarize(samples: List[Sample], seconds: float) -> Dict:
+    """Throughput, error rate and latency percentiles of `samples`"""
+    count = len(samples)
+    errors = sum(1 for sample in samples if sample.error)
+    summary = {
+        'requests': count,
+        'errors': errors,
+        'error_rate': round(errors / count, 4) if count else 0.0,
+        'requests_per_second': round(count / seconds, 2) if seconds > 0 else 0.0
+    }
+    if count:
+        latency_ms = np.array([sample.latency for sample in samples]) * 1000
+        for percentile in (50, 95, 99):
+            summary[f'p{percentile}_ms'] = round(float(np.percentile(latency_ms, percentile)), 1)
+        summary['max_ms'] = round(float(latency_ms.max()), 1)
+    return summary
+
+
+def report(run: LoadRun, threads: List[threading.Thread], interval: float, warmup: float,
+           quiet: bool) -> Dict:
+    """Print a line per window until the load threads finish; returns the full report"""
+    timeline = []
+    seen = 0
+    window_start = 0.0
+    
+    if not quiet:
+        print(f"{'t (s)':>7} {'req/s':>8} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8} "
+              f"{'p99 ms':>8} {'in flight':>9}")
+    
+    while True:
+        window_end = window_start + interval
+        while any(thread.is_alive() for thread in threads):
+            remaining = run._started + window_end - time.perf_counter()
+            if remaining <= 0:
+                break
+            time.sleep(min(remaining, 0.1))
+        
+        alive = any(thread.is_alive() for thread in threads)
+        if not alive:
+            # Last (possibly short) window ends with the last request
+            window_end = max(window_start, min(window_end, time.perf_counter() - run._started))
+        
+        samples = run.samples[seen:]
+        seen += len(samples)
+        window = dict(summarize(samples, window_end - window_start), t=round(window_end, 1),
+                      in_flight=run.in_flight)
+        timeline.append(window)
+        
+        if not quiet and samples:
+            print(f"{window['t']:>7} {window['requests_per_second']:>8} {window['error_rate']:>7.1%} "
+                  f"{window.get('p50_ms', '-'):>8} {window.get('p95_ms', '-'):>8} "
+                  f"{window.get('p99_ms', '-'):>8} {window['in_flight']:>9}")
+        
+        window_start = window_end
+        if not alive:
+            break
+    
+    measured = [sample for sample in run.samples if sample.finished >= warmup]
+    end = max((sample.finished for sample in run.samples), default=warmup)
+    errors: Dict[str, int] = {}
+    for sample in measured:
+        if sample.error:
+            errors[sample.error] = errors.get(sample.error, 0) + 1
+    
+    return {
+        'summary': summarize(measured, end - warmup),
+        'errors_by_type': errors,
+        'timeline': timeline
+    }
+
+
+def parse_env(items: List[str]) -> Dict[str, str]:
+    env = {}
+    for item in items:
+        key, sep, value = item.partition('=')
+        if not sep or not key:
+            raise ValueError(f"--env expects KEY=VALUE, got {item}")
+        env[key] = value
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test POST /api/scan on localhost')
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--server', choices=('app', 'api'), default='app',
+                        help='Start backend/app.py (app) or the api/scan.py handler (api) locally')
+    target.add_argument('--url', help='Scan URL of a server that is already running on localhost')
+    target.add_argument('--serve-only', choices=('app', 'api'), help=argparse.SUPPRESS)
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument('--concurrency', type=int, default=4, help='Closed-loop clients (default: 4)')
+    load.add_argument('--rate', type=float, help='Open-loop arrival rate in requests per second')
+    parser.add_argument('--poisson', action='store_true', help='Exponential gaps between arrivals (--rate)')
+    parser.add_argument('--max-clients', type=int, default=256,
+                        help='Connections available to the open loop (default: 256)')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds of load (default: 30)')
+    parser.add_argument('--warmup', type=float, default=2,
+                        help='Seconds excluded from the summary (default: 2)')
+    parser.add_argument('--interval', type=float, default=5, help='Seconds per report line (default: 5)')
+    parser.add_argument('--template', default='default', help='Template name (default: default)')
+    parser.add_argument('--sheets', type=int, default=50, help='Distinct sheets in the corpus (default: 50)')
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS_DIR, help='Corpus cache directory')
+    parser.add_argument('--images', nargs='*', help='Use these image files (or globs) instead of a corpus')
+    parser.add_argument('--seed', type=int, default=1, help='Corpus and arrival seed (default: 1)')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='Environment for the spawned server (repeatable)')
+    parser.add_argument('--timeout', type=float, default=60, help='Per-request timeout in seconds')
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+    
+    if args.serve_only:
+        serve(args.serve_only, args.port)
+        return
+    
+    try:
+        env = parse_env(args.env)
+        if args.url:
+            check_loopback(args.url)
+        if args.images:
+            paths = sorted({path for pattern in args.images for path in glob.glob(pattern)})
+        else:
+            paths = build_corpus(args.template, args.sheets, args.seed, args.corpus)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    if not paths:
+        print("No images found")
+        sys.exit(1)
+    
+    images = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            images.append((f.read(), mimetypes.guess_type(path)[0] or 'application/octet-stream'))
+    
+    server = contextlib.nullcontext(args.url) if args.url else spawn_server(args.server, env)
+    with server as url:
+        run = LoadRun(url, images, args.template, args.timeout)
+        if args.rate:
+            model = f"{args.rate} req/s {'poisson' if args.poisson else 'fixed'} arrivals"
+            threads = run.run_open(args.rate, args.duration, args.poisson, args.max_clients, args.seed)
+        else:
+            model = f"{args.concurrency} closed-loop client(s)"
+            threads = run.run_closed(args.concurrency, args.duration)
+        
+        if not args.json:
+            print(f"{url}: {model}, {len(images)} sheet(s), {args.duration:g}s")
+        result = report(run, threads, args.interval, args.warmup, args.json)
+    
+    result.update(target=url, server=None if args.url else args.server, model=model, env=env)
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    
+    summary = result['summary']
+    print(f"\n{summary['requests']} requests after {args.warmup:g}s warm-up: "
+          f"{summary['requests_per_second']} req/s, {summary['error_rate']:.1%} errors")
+    if summary['requests']:
+        print(f"latency p50 {summary['p50_ms']} ms, p95 {summary['p95_ms']} ms, "
+              f"p99 {summary['p99_ms']} ms, max {summary['max_ms']} ms")
+    for error, count in sorted(result['errors_by_type'].items()):
+        print(f"  {error}: {count}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,314 @@
+"""
+Prometheus metrics for the Flask backend (served at /api/metrics).
+
+Counters and histograms are sharded per thread: every thread updates only
+its own dict, so recording a request or a stage timing takes no lock and
+never contends with other requests. A scrape sums the shards. Shards of
+threads that have exited (the development server starts one thread per
+request) are folded into a retired total, both at scrape time and whenever
+the shard list has doubled, so values stay monotonic and memory stays
+bounded between scrapes.
+
+Gauges whose value already lives elsewhere (result cache, warp paths,
+processing slots) are read through callbacks at scrape time.
+"""
+
+import bisect
+import threading
+import weakref
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; request latency and per-stage engine timings
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Shard count that triggers the first pruning of exited threads' shards
+MIN_PRUNE_SHARDS = 64
+
+# Distinct failure reasons kept as label values before folding into "other"
+MAX_FAILURE_REASONS = 50
+
+
+class _Shards:
+    """Per-thread dicts plus the folded totals of exited threads
+    
+    Shards of exited threads are retired when a new thread registers and the
+    list has doubled since the last pruning, so the list stays proportional
+    to the live threads even if nothing scrapes. Threads are held by weak
+    reference.
+    """
+    
+    def __init__(self, merge: Callable[[Dict, Dict], None]):
+        self._merge = merge
+        self._local = threading.local()
+        self._shards: List[Tuple[weakref.ref, Dict]] = []
+        self._retired: Dict = {}
+        self._prune_at = MIN_PRUNE_SHARDS
+        self._lock = threading.Lock()
+    
+    def local(self) -> Dict:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((weakref.ref(threading.current_thread()), shard))
+                if len(self._shards) >= self._prune_at:
+                    self._retire_dead()
+                    self._prune_at = max(MIN_PRUNE_SHARDS, 2 * len(self._shards))
+        return shard
+    
+    def _retire_dead(self):
+        """Fold shards of exited threads into the retired total (lock held)"""
+        live = []
+        for thread_ref, shard in self._shards:
+            thread = thread_ref()
+            if thread is not None and thread.is_alive():
+                live.append((thread_ref, shard))
+            else:
+                self._merge(self._retired, shard)
+        self._shards = live
+    
+    def collect(self) -> Dict:
+        """Sum of every shard (retiring those of exited threads)"""
+        with self._lock:
+            self._retire_dead()
+            total = {}
+            self._merge(total, self._retired)
+            for _, shard in self._shards:
+                self._merge(total, shard)
+        return total
+
+
+def _merge_counts(target: Dict, source: Dict):
+    for labels, value in list(source.items()):
+        target[labels] = target.get(labels, 0) + value
+
+
+def _merge_histograms(target: Dict, source: Dict):
+    for labels, (buckets, total, count) in list(source.items()):
+        current = target.get(labels)
+        if current is None:
+            target[labels] = [list(buckets), total, count]
+        else:
+            current[0] = [a + b for a, b in zip(current[0], buckets)]
+            current[1] += total
+            current[2] += count
+
+
+class Counter:
+    """Monotonic counter (or up/down gauge) with labels, sharded per thread"""
+    
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), kind: str = 'counter'):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.kind = kind
+        self._shards = _Shards(_merge_counts)
+    
+    def inc(self, *labels, amount: float = 1):
+        shard = self._shards.local()
+        shard[labels] = shard.get(labels, 0) + amount
+    
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+    
+    def values(self) -> Dict[Tuple, float]:
+        return self._shards.collect()
+    
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for labels, value in sorted(self.values().items()):
+            lines.append(f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}')
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels, sharded per thread"""
+    
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Iterable[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self._shards = _Shards(_merge_histograms)
+    
+    def observe(self, value: float, *labels):
+        shard = self._shards.local()
+        entry = shard.get(labels)
+        if entry is None:
+            # Per-bucket (non-cumulative) counts, +Inf last; then sum and count
+            entry = shard[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+    
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        bounds = [_number(b) for b in self.buckets] + ['+Inf']
+        for labels, (counts, total, count) in sorted(self._shards.collect().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                bucket_labels = _labels(self.labelnames + ('le',), labels + (bound,))
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {count}')
+        return lines
+
+
+class CallbackGauge:
+    """Gauge family whose samples are computed at scrape time"""
+    
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...],
+                 callback: Callable[[], Dict[Tuple, float]], kind: str = 'gauge'):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.callback = callback
+        self.kind = kind
+    
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        try:
+            samples = self.callback()
+        except Exception as e:
+            print(f"Error collecting metric {self.name}: {e}")
+            samples = {}
+        for labels, value in sorted(samples.items()):
+            lines.append(f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}')
+        return lines
+
+
+class MetricsRegistry:
+    """Ordered collection of metric families rendered in text format 0.0.4"""
+    
+    def __init__(self):
+        self._metrics = []
+    
+    def counter(self, name, help, labelnames=()) -> Counter:
+        return self._add(Counter(name, help, tuple(labelnames)))
+    
+    def gauge(self, name, help, labelnames=()) -> Counter:
+        """Up/down gauge updated with inc()/dec()"""
+        return self._add(Counter(name, help, tuple(labelnames), kind='gauge'))
+    
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, tuple(labelnames), buckets))
+    
+    def callback(self, name, help, labelnames, callback, kind='gauge') -> CallbackGauge:
+        return self._add(CallbackGauge(name, help, tuple(labelnames), callback, kind))
+    
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+    
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class ScanMetrics:
+    """The metric families exposed by backend/app.py"""
+    
+    def __init__(self, slots: int, result_cache=None, engine=None):
+        self.registry = MetricsRegistry()
+        self.slots = slots
+        self._reasons = set()
+        self._reasons_lock = threading.Lock()
+        registry = self.registry
+        
+        self.requests = registry.counter(
+            'omr_http_requests_total', 'HTTP requests by route, method and status',
+            ('route', 'method', 'status'))
+        self.request_latency = registry.histogram(
+            'omr_http_request_duration_seconds', 'HTTP request latency by route', ('route',))
+        self.stage_latency = registry.histogram(
+            'omr_stage_duration_seconds', 'Time spent in each scan and engine stage', ('stage',))
+        self.scans = registry.counter(
+            'omr_scans_total', 'Processed scans by template, engine tier and outcome',
+            ('template', 'tier', 'outcome'))
+        self.failures = registry.counter(
+            'omr_scan_failures_total', 'Failed scans by reason', ('reason',))
+        self.queue_depth = registry.gauge(
+            'omr_scan_queue_depth', 'Scans waiting for a processing slot')
+        self.in_progress = registry.gauge(
+            'omr_scans_in_progress', 'Scans holding a processing slot')
+        
+        registry.callback(
+            'omr_worker_utilization', 'Fraction of processing slots in use', (),
+            lambda: {(): max(0.0, sum(self.in_progress.values().values())) / max(1, self.slots)})
+        registry.callback(
+            'omr_processing_slots', 'Configured concurrent processing slots', (),
+            lambda: {(): self.slots})
+        
+        if result_cache is not None:
+            registry.callback(
+                'omr_result_cache_lookups_total', 'Result cache lookups by outcome', ('outcome',),
+                lambda: _cache_lookups(result_cache.stats()), kind='counter')
+            registry.callback(
+                'omr_result_cache_hit_ratio', 'Share of lookups answered from the result cache', (),
+                lambda: {(): result_cache.stats()['hit_rate']})
+            registry.callback(
+                'omr_result_cache_entries', 'Entries in the result cache', (),
+                lambda: {(): result_cache.stats()['entries']})
+        
+        if engine is not None:
+            registry.callback(
+                'omr_warp_path_total', 'Accurate-tier sheets by warp path', ('path',),
+                lambda: {(path,): count for path, count in engine.warp_path_counts().items()},
+                kind='counter')
+    
+    def observe_stage(self, stage: str, seconds: float):
+        """Stage observer for omr_engine.tracing"""
+        self.stage_latency.observe(seconds, stage)
+    
+    def observe_request(self, route: str, method: str, status: int, seconds: float):
+        self.requests.inc(route, method, str(status))
+        self.request_latency.observe(seconds, route)
+    
+    def observe_scan(self, template: str, result: Optional[Dict], duplicate: bool = False):
+        if result is None:
+            return
+        if not result.get('success'):
+            self.scans.inc(template, result.get('tier') or 'none', 'failed')
+            self.failures.inc(self._reason(result.get('error') or 'unknown'))
+            return
+        self.scans.inc(template, result.get('tier') or 'none', 'duplicate' if duplicate else 'success')
+    
+    def _reason(self, reason: str) -> str:
+        """Bound label cardinality: exception messages can be unique"""
+        if reason in self._reasons:
+            return reason
+        with self._reasons_lock:
+            if len(self._reasons) < MAX_FAILURE_REASONS:
+                self._reasons.add(reason)
+                return reason
+        return 'other'
+    
+    def render(self) -> str:
+        return self.registry.render()
+
+
+def _cache_lookups(stats: Dict) -> Dict[Tuple, float]:
+    return {('hit',): stats['hits'], ('near_hit',): stats['near_hits'], ('miss',): stats['misses']}
+
+
+def _labels(names: Tuple[str, ...], values: Tuple) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
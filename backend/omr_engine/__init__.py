@@ -0,0 +1,41 @@
+"""
+Shared OMR engine used by the Flask backend (backend/app.py) and the
+serverless handlers in api/.
+
+Submodules are imported on first attribute access, so handlers that only
+need the template registry do not pay for importing OpenCV.
+"""
+
+import importlib
+
+# Bump whenever a change can alter detected answers for the same image
+ENGINE_VERSION = '2.2'
+
+_EXPORTS = {
+    'OMRProcessor': '.accurate',
+    'FastOMRProcessor': '.fast',
+    'OMREngine': '.engine',
+    'ENGINE_MODES': '.engine',
+    'QualityGate': '.quality',
+    'batch_grid_cache': '.localization',
+    'ResultCache': '.result_cache',
+    'get_result_cache': '.result_cache',
+    'map_pages': '.rawio',
+    'RawImageError': '.rawio',
+    'TemplateRegistry': '.templates',
+    'CompiledTemplate': '.templates',
+    'TemplateError': '.templates',
+    'compile_template': '.templates',
+    'etag_matches': '.templates',
+    'get_template_registry': '.templates'
+}
+
+__all__ = ['ENGINE_VERSION'] + list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,418 @@
+import cv2
+import numpy as np
+import os
+import threading
+from collections import Counter
+from typing import Dict, List, Tuple, Optional
+
+from .localization import localize_grid
+from .templates import compile_template
+from .tiling import process_in_bands
+from .tracing import record_error, span
+
+# Warp paths, cheapest first (see _warp_answer_region)
+WARP_PATHS = ('crop', 'affine', 'perspective')
+
+# Rows of context one preprocessed row depends on: 5x5 blur (2), 11x11
+# adaptive threshold window (5) and a 3x3 closing, i.e. dilate + erode (2)
+PREPROCESS_MARGIN = 9
+
+class OMRProcessor:
+    """Accurate tier: adaptive threshold, sheet detection and perspective warp
+    
+    Sheets whose detected corners are already axis-aligned (skew within
+    `skew_tolerance` degrees, keystone within `keystone_tolerance`) are
+    cropped and scaled instead of warped; rotated but undistorted sheets use
+    an affine warp. Both default from OMR_SKEW_TOLERANCE and
+    OMR_KEYSTONE_TOLERANCE.
+    
+    Images taller than `band_rows` (default from OMR_BAND_ROWS, 1024; 0
+    disables banding) are thresholded in overlapping horizontal strips, so
+    only the grayscale input and the binary output exist at full size.
+    """
+    
+    tier = 'accurate'
+    
+    def __init__(self, skew_tolerance: Optional[float] = None, keystone_tolerance: Optional[float] = None,
+                 band_rows: Optional[int] = None):
+        self.debug_mode = False
+        self.skew_tolerance = float(skew_tolerance if skew_tolerance is not None
+                                    else os.environ.get('OMR_SKEW_TOLERANCE', 0.25))
+        self.keystone_tolerance = float(keystone_tolerance if keystone_tolerance is not None
+                                        else os.environ.get('OMR_KEYSTONE_TOLERANCE', 0.01))
+        self.band_rows = int(band_rows if band_rows is not None
+                             else os.environ.get('OMR_BAND_ROWS', 1024))
+        
+        # How often each warp path was taken, for monitoring
+        self.warp_paths = Counter()
+        self._warp_paths_lock = threading.Lock()
+        
+    def process_image(self, image_path: str, template: Dict) -> Dict:
+        """
+        Process OMR sheet image and extract answers
+        
+        Args:
+            image_path: Path to the image file
+            template: OMR template configuration
+            
+        Returns:
+            Dictionary with processing results
+        """
+        # Load image
+        image = cv2.imread(image_path)
+        if image is None:
+            return {'success': False, 'error': 'Could not load image'}
+        
+        return self.process_array(image, template, image_path)
+    
+    def process_bytes(self, data, template: Dict, image_path: Optional[str] = None) -> Dict:
+        """
+        Decode an encoded image (JPEG/PNG/TIFF bytes or memoryview) and process it
+        
+        Args:
+            data: Encoded image bytes
+            template: OMR template configuration
+            image_path: Where the original upload is stored, if anywhere
+            
+        Returns:
+            Dictionary with processing results
+        """
+        buffer = np.frombuffer(data, np.uint8)
+        image = cv2.imdecode(buffer, cv2.IMREAD_COLOR) if buffer.size else None
+        if image is None:
+            return {'success': False, 'error': 'Could not decode image'}
+        
+        return self.process_array(image, template, image_path)
+    
+    def process_array(self, image: np.ndarray, template: Dict, image_path: Optional[str] = None) -> Dict:
+        """
+        Process an already decoded OMR sheet image
+        
+        Args:
+            image: BGR or grayscale image as returned by cv2.imread / cv2.imdecode
+            template: OMR template configuration
+            image_path: Where the original upload is stored; the processed
+                image is saved next to it when given
+            
+        Returns:
+            Dictionary with processing results
+        """
+        try:
+            # Preprocess image
+            with span('preprocess', banded=self.band_rows > 0 and image.shape[0] > self.band_rows):
+                processed_image = self._preprocess_image(image)
+            
+            # Detect OMR sheet boundaries
+            with span('detect_sheet'):
+                sheet_contour = self._detect_sheet_boundaries(processed_image)
+            if sheet_contour is None:
+                return {'success': False, 'error': 'Could not detect OMR sheet boundaries'}
+            
+            # Apply perspective correction to the bubble grid only
+            template = compile_template(template)
+            with span('warp') as warp_span:
+                corrected_image, warp_path = self._warp_answer_region(processed_image, sheet_contour, template)
+                warp_span.set(warp_path=warp_path)
+            with self._warp_paths_lock:
+                self.warp_paths[warp_path] += 1
+            
+            # Extract answer regions based on template
+            with span('read_sheet'):
+                answers, fill_ratios, fields = self._read_sheet(
+                    corrected_image, template, boxes=template.region_boxes
+                )
+            
+            # Save processed image for debugging
+            processed_image_path = None
+            if image_path:
+                root, ext = os.path.splitext(image_path)
+                if not cv2.haveImageWriter(ext or '.png'):
+                    ext = '.png'  # e.g. raw scanner dumps
+                processed_image_path = f"{root}_processed{ext or '.png'}"
+                with span('save_processed'):
+                    cv2.imwrite(processed_image_path, corrected_image)
+            
+            return {
+                'success': True,
+                'answers': answers,
+                'fill_ratios': fill_ratios,
+                'fields': fields,
+                'processed_image_path': processed_image_path,
+                'confidence': self._calculate_confidence(answers),
+                'tier': self.tier,
+                'warp_path': warp_path
+            }
+            
+        except Exception as e:
+            record_error(e)
+            return {'success': False, 'error': str(e)}
+    
+    def peak_bytes(self, height: int, width: int) -> int:
+        """Approximate peak memory of this tier for a height x width grayscale sheet"""
+        rows = height if self.band_rows <= 0 else min(height, self.band_rows + 2 * PREPROCESS_MARGIN)
+        # Input, binary output and findContours' working copy at full size,
+        # plus blur, mean, threshold and closing temporaries per band
+        return 3 * height * width + 4 * rows * width
+    
+    def _preprocess_image(self, image: np.ndarray) -> np.ndarray:
+        """Preprocess image for better OMR detection"""
+        # Convert to grayscale
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        
+        return process_in_bands(gray, self.band_rows, PREPROCESS_MARGIN, self._threshold_band)
+    
+    @staticmethod
+    def _threshold_band(gray: np.ndarray) -> np.ndarray:
+        """Blur, adaptive threshold and close one band (or all) of a grayscale image"""
+        # Apply Gaussian blur to reduce noise
+        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+        
+        # Apply adaptive thresholding
+        thresh = cv2.adaptiveThreshold(
+            blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
+            cv2.THRESH_BINARY_INV, 11, 2
+        )
+        
+        # Apply morphological operations to clean up
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+        cleaned = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
+        
+        return cleaned
+    
+    def _detect_sheet_boundaries(self, image: np.ndarray) -> Optional[np.ndarray]:
+        """Detect the boundaries of the OMR sheet"""
+        # Find contours
+        contours, _ = cv2.findContours(image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        
+        if not contours:
+            return None
+        
+        # Find the largest rectangular contour
+        largest_contour = max(contours, key=cv2.contourArea)
+        
+        # Approximate contour to get rectangle
+        epsilon = 0.02 * cv2.arcLength(largest_contour, True)
+        approx = cv2.approxPolyDP(largest_contour, epsilon, True)
+        
+        # If we have 4 points, we found a rectangle
+        if len(approx) == 4:
+            return approx
+        
+        # Fallback: use bounding rectangle
+        x, y, w, h = cv2.boundingRect(largest_contour)
+        return np.array([[x, y], [x + w, y], [x + w, y + h], [x, y + h]], dtype=np.int32)
+    
+    def _warp_answer_region(self, image: np.ndarray, contour: np.ndarray, template) -> Tuple[np.ndarray, str]:
+        """Warp only the template's answer region out of the sheet
+        
+        The sheet transform is composed with the scale/offset that maps the
+        answer region to its own output image, so only the pixels the bubble
+        grid is read from are produced. The output resolution follows the
+        template's bubble_size (never above what a full-sheet warp would give).
+        
+        Returns the region image and the path taken: 'crop' (axis-aligned,
+        plain crop and scale), 'affine' (rotated but undistorted) or
+        'perspective' (full homography).
+        """
+        points = self._order_points(contour.reshape(4, 2)).astype(np.float32)
+        
+        sheet_width = max(np.linalg.norm(points[1] - points[0]), np.linalg.norm(points[2] - points[3]))
+        sheet_height = max(np.linalg.norm(points[3] - points[0]), np.linalg.norm(points[2] - points[1]))
+        
+        # Pixels per sheet width/height in the output
+        scale_x, scale_y = sheet_width, sheet_height
+        if template.bubble_pixels is not None:
+            bubble_width, bubble_height = template.bubble_pixels
+            scale_x = min(scale_x, bubble_width / template.bubble_boxes[0, 0, 2])
+            scale_y = min(scale_y, bubble_height / template.bubble_boxes[0, 0, 3])
+        
+        x0, y0, x1, y1 = template.answer_region
+        out_width = max(1, int(round((x1 - x0) * scale_x)))
+        out_height = max(1, int(round((y1 - y0) * scale_y)))
+        
+        # Unit square -> answer region output
+        region_matrix = np.array([
+            [out_width / (x1 - x0), 0, -x0 * out_width / (x1 - x0)],
+            [0, out_height / (y1 - y0), -y0 * out_height / (y1 - y0)],
+            [0, 0, 1]
+        ], dtype=np.float64)
+        
+        # Every path samples nearest-neighbour: the binary image stays binary,
+        # so fill ratios do not depend on the output resolution
+        skew, keystone = self._measure_distortion(points)
+        
+        if keystone <= self.keystone_tolerance and abs(skew) <= self.skew_tolerance:
+            left = (points[0, 0] + points[3, 0]) / 2
+            right = (points[1, 0] + points[2, 0]) / 2
+            top = (points[0, 1] + points[1, 1]) / 2
+            bottom = (points[2, 1] + points[3, 1]) / 2
+            
+            height, width = image.shape[:2]
+            cx0 = int(np.clip(round(left + x0 * (right - left)), 0, width - 1))
+            cx1 = int(np.clip(round(left + x1 * (right - left)), cx0 + 1, width))
+            cy0 = int(np.clip(round(top + y0 * (bottom - top)), 0, height - 1))
+            cy1 = int(np.clip(round(top + y1 * (bottom - top)), cy0 + 1, height))
+            
+            crop = image[cy0:cy1, cx0:cx1]
+            if crop.shape[:2] != (out_height, out_width):
+                crop = cv2.resize(crop, (out_width, out_height), interpolation=cv2.INTER_NEAREST)
+            return crop, 'crop'
+        
+        if keystone <= self.keystone_tolerance:
+            # Parallelogram: three corners define the transform exactly
+            unit = np.array([[0, 0], [1, 0], [0, 1]], dtype=np.float32)
+            sheet_matrix = np.vstack([cv2.getAffineTransform(points[[0, 1, 3]], unit), [0, 0, 1]])
+            matrix = (region_matrix @ sheet_matrix)[:2]
+            return cv2.warpAffine(image, matrix, (out_width, out_height), flags=cv2.INTER_NEAREST), 'affine'
+        
+        # Sheet corners -> unit square, then unit square -> answer region output
+        unit = np.array([[0, 0], [1, 0], [1, 1], [0, 1]], dtype=np.float32)
+        sheet_matrix = cv2.getPerspectiveTransform(points, unit)
+        return cv2.warpPerspective(image, region_matrix @ sheet_matrix, (out_width, out_height),
+                                   flags=cv2.INTER_NEAREST), 'perspective'
+    
+    @staticmethod
+    def _measure_distortion(points: np.ndarray) -> Tuple[float, float]:
+        """Skew (degrees) and keystone of ordered sheet corners
+        
+        Skew is the mean rotation of the four edges. Keystone is the largest
+        relative length difference or angle (radians) between opposite
+        edges; 0 means the corners form a parallelogram.
+        """
+        top = points[1] - points[0]
+        bottom = points[2] - points[3]
+        left = points[3] - points[0]
+        right = points[2] - points[1]
+        
+        # Rotation of each edge away from its axis
+        angles = np.array([
+            np.arctan2(top[1], top[0]),
+            np.arctan2(bottom[1], bottom[0]),
+            np.arctan2(-left[0], left[1]),
+            np.arctan2(-right[0], right[1])
+        ])
+        skew = float(np.degrees(angles.mean()))
+        
+        lengths = np.linalg.norm([top, bottom, left, right], axis=1)
+        keystone = max(
+            abs(lengths[0] - lengths[1]) / max(lengths[0], lengths[1], 1e-6),
+            abs(lengths[2] - lengths[3]) / max(lengths[2], lengths[3], 1e-6),
+            abs(angles[0] - angles[1]),
+            abs(angles[2] - angles[3])
+        )
+        return skew, float(keystone)
+    
+    def _order_points(self, points: np.ndarray) -> np.ndarray:
+        """Order points in clockwise order starting from top-left"""
+        # Sort by y-coordinate
+        sorted_points = points[np.argsort(points[:, 1])]
+        
+        # Top two points
+        top_points = sorted_points[:2]
+        top_points = top_points[np.argsort(top_points[:, 0])]
+        
+        # Bottom two points
+        bottom_points = sorted_points[2:]
+        bottom_points = bottom_points[np.argsort(bottom_points[:, 0])]
+        
+        return np.array([
+            top_points[0],      # top-left
+            top_points[1],      # top-right
+            bottom_points[1],   # bottom-right
+            bottom_points[0]    # bottom-left
+        ])
+    
+    def _read_sheet(self, image: np.ndarray, template: Dict,
+                    boxes: Optional[np.ndarray] = None) -> Tuple[List[str], List[List[float]], Dict[str, str]]:
+        """Read answers, their fill ratio matrix and every extra field in one pass
+        
+        `boxes` are all bubble boxes (template.sheet_boxes layout: answers,
+        then fields) as fractions of `image`; defaults to the whole sheet. An
+        answer bubble counts as marked above the template's
+        detection.fill_threshold; field columns are decoded relative to their
+        own bubbles (see TemplateField.decode).
+        """
+        template = compile_template(template)
+        options = template.options
+        if boxes is None:
+            boxes = template.sheet_boxes
+        
+        # Locate the bubbles, then read every fill ratio in one pass
+        pixel_boxes = self._calculate_bubble_positions(image, template, boxes)
+        ratios = self._fill_ratio_matrix(image, pixel_boxes).reshape(-1)
+        
+        num_answer_boxes = template.num_questions * len(options)
+        answer_ratios = ratios[:num_answer_boxes].reshape(template.num_questions, len(options))
+        answer_filled = answer_ratios > template.fill_threshold
+        
+        marked_counts = answer_filled.sum(axis=1)
+        first_marked = answer_filled.argmax(axis=1)
+        
+        answers = []
+        for count, option_idx in zip(marked_counts.tolist(), first_marked.tolist()):
+            if count == 1:
+                answers.append(options[option_idx])
+            elif count == 0:
+                answers.append('')  # No answer
+            else:
+                answers.append('MULTIPLE')  # Multiple answers marked
+        
+        fields = {
+            name: field.decode(ratios[field.start:field.stop].reshape(field.boxes.shape[:2]),
+                               template.fill_threshold, template.field_margin)
+            for name, field in template.fields.items()
+        }
+        
+        return answers, np.round(answer_ratios, 4).tolist(), fields
+    
+    def _calculate_bubble_positions(self, image: np.ndarray, template: Dict,
+                                    boxes: Optional[np.ndarray] = None) -> np.ndarray:
+        """Pixel boxes of every bubble in `image`, shaped like `boxes`
+        
+        `boxes` defaults to the (questions, options, 4) answer grid. The
+        nominal boxes (precomputed as fractions when the template is compiled)
+        are scaled to the image and then snapped to the bubble-sized connected
+        components actually found there.
+        """
+        height, width = image.shape[:2]
+        
+        template = compile_template(template)
+        if boxes is None:
+            boxes = template.bubble_boxes
+        pixel_boxes = boxes * np.array([width, height, width, height], dtype=np.float32)
+        
+        pixel_boxes, _ = localize_grid(
+            image, template, pixel_boxes,
+            cache_key=(template.version, self.tier, image.shape[:2])
+        )
+        return pixel_boxes.astype(np.int32)
+    
+    @staticmethod
+    def _fill_ratio_matrix(image: np.ndarray, pixel_boxes: np.ndarray) -> np.ndarray:
+        """Ratio of non-zero pixels in every box, from one integral image"""
+        height, width = image.shape[:2]
+        integral = cv2.integral((image > 0).view(np.uint8))
+        
+        x0 = np.clip(pixel_boxes[..., 0], 0, width)
+        y0 = np.clip(pixel_boxes[..., 1], 0, height)
+        x1 = np.clip(pixel_boxes[..., 0] + pixel_boxes[..., 2], 0, width)
+        y1 = np.clip(pixel_boxes[..., 1] + pixel_boxes[..., 3], 0, height)
+        
+        sums = integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+        areas = (x1 - x0) * (y1 - y0)
+        return np.where(areas > 0, sums / np.maximum(areas, 1), 0.0)
+    
+    def _calculate_confidence(self, answers: List[str]) -> float:
+        """Calculate confidence score based on answer quality
+        
+        Blank answers are legitimate reads; only multiply marked ones count
+        against the confidence.
+        """
+        if not answers:
+            return 0.0
+        
+        # Simple confidence calculation
+        valid_answers = sum(1 for ans in answers if ans != 'MULTIPLE')
+        confidence = valid_answers / len(answers)
+        
+        return round(confidence, 2)
\ No newline at end of file
@@ -0,0 +1,131 @@
+"""
+Compact scan results and response encoding for high-volume clients.
+
+A compact result replaces the per-question ``question_analysis`` dicts with
+a packed answer string (one character per question) and a correctness
+bitmap. Responses can be negotiated as msgpack (``Accept:
+application/msgpack``, when the optional msgpack package is installed) and
+gzip-compressed (``Accept-Encoding: gzip``); q-values are honoured, so
+``gzip;q=0`` refuses compression.
+"""
+
+import base64
+import gzip
+import json
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+BLANK_CODE = '-'
+MULTIPLE_CODE = '*'
+
+MSGPACK_TYPES = ('application/msgpack', 'application/x-msgpack')
+
+# Bodies smaller than this are not worth compressing
+GZIP_MIN_BYTES = 512
+
+
+def pack_answers(answers: List[str], options: Optional[List[str]] = None) -> str:
+    """One character per question: the option, '-' for blank, '*' for multiple
+    
+    Options longer than one character are encoded by their index (0-9, a-z).
+    """
+    codes = {}
+    for index, option in enumerate(options or []):
+        codes[option] = option if len(option) == 1 else np.base_repr(index, 36).lower()
+    
+    packed = []
+    for answer in answers:
+        if not answer:
+            packed.append(BLANK_CODE)
+        elif answer == 'MULTIPLE':
+            packed.append(MULTIPLE_CODE)
+        else:
+            packed.append(codes.get(answer, answer[:1]))
+    return ''.join(packed)
+
+
+def correctness_bitmap(answers: List[str], answer_key: List[str]) -> str:
+    """Base64 bitmap, question 1 in the most significant bit of the first byte"""
+    if not answers:
+        return ''
+    
+    detected = np.array(answers, dtype=object)
+    key = np.array(list(answer_key[:len(answers)]) + [None] * max(0, len(answers) - len(answer_key)), dtype=object)
+    bits = (detected == key).astype(np.uint8)
+    return base64.b64encode(np.packbits(bits).tobytes()).decode('ascii')
+
+
+def compact_result(scan_id, answers: List[str], answer_key: List[str], score: int,
+                   options: Optional[List[str]] = None, **extra) -> Dict:
+    """Compact response body for one scan"""
+    total_questions = len(answers)
+    data = {
+        'success': True,
+        'format': 'compact',
+        'scan_id': scan_id,
+        'answers': pack_answers(answers, options),
+        'correct': correctness_bitmap(answers, answer_key),
+        'score': score,
+        'total_questions': total_questions,
+        'percentage': round((score / total_questions * 100) if total_questions > 0 else 0, 2)
+    }
+    data.update(extra)
+    return data
+
+
+def encode_response(data: Dict, accept: str = '', accept_encoding: str = '') -> Tuple[bytes, Dict[str, str]]:
+    """Serialize `data` per the client's Accept / Accept-Encoding headers
+    
+    Returns the body and the headers to send with it.
+    """
+    headers = {'Vary': 'Accept, Accept-Encoding'}
+    body = None
+    
+    accepted_types = _q_values(accept)
+    if any(accepted_types.get(media_type, 0) > 0 for media_type in MSGPACK_TYPES):
+        try:
+            import msgpack
+            body = msgpack.packb(data, use_bin_type=True)
+            headers['Content-Type'] = 'application/msgpack'
+        except ImportError:
+            body = None
+    
+    if body is None:
+        body = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        headers['Content-Type'] = 'application/json'
+    
+    if _accepts_gzip(accept_encoding) and len(body) >= GZIP_MIN_BYTES:
+        body = gzip.compress(body, compresslevel=5)
+        headers['Content-Encoding'] = 'gzip'
+    
+    return body, headers
+
+
+def _q_values(header: str) -> Dict[str, float]:
+    """Lower-cased entries of an Accept-style header mapped to their q-values"""
+    values = {}
+    for entry in header.split(','):
+        name, _, params = entry.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value.strip())
+                except ValueError:
+                    q = 0.0
+        values[name] = q
+    return values
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """Whether Accept-Encoding allows gzip (gzip;q=0 refuses it, * covers it)"""
+    codings = _q_values(accept_encoding)
+    for coding in ('gzip', 'x-gzip', '*'):
+        if coding in codings:
+            return codings[coding] > 0
+    return False
@@ -0,0 +1,240 @@
+import cv2
+import os
+import numpy as np
+from typing import Dict, List, Optional
+
+from .accurate import OMRProcessor
+from .fast import FastOMRProcessor
+from .quality import QualityGate, QUALITY_MODES
+from .rawio import RawImageError, is_raw_image, map_pages
+from .templates import compile_template
+from .tiling import encoded_image_size
+from .tracing import span
+
+ENGINE_MODES = ('fast', 'accurate', 'auto')
+
+# Decode flags by downscale factor; JPEG is scaled during the IDCT, so the
+# full-resolution image is never allocated
+REDUCED_DECODES = (
+    (1, cv2.IMREAD_GRAYSCALE),
+    (2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+    (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    (8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+)
+
+class OMREngine:
+    """Tiered OMR engine shared by the Flask backend and the serverless API
+    
+    Modes:
+        fast: reduced grayscale decode, global threshold, contour crop
+        accurate: adaptive threshold, sheet detection and perspective warp
+        auto: run the fast tier and escalate to the accurate tier only when
+              the fast result fails, has low confidence or too many bubbles
+              sit close to the fill threshold; the accurate result replaces
+              the fast one only when it is clearly better (see _is_better)
+    
+    Every image first goes through a pre-flight QualityGate on a downscaled
+    copy. quality_mode "reject" (default) fails blurry, badly exposed or
+    badly framed captures before any tier runs, "flag" only reports the
+    findings in the result's 'quality' entry and "off" skips the check.
+    
+    `max_sheet_mb` (default from OMR_MAX_SHEET_MB, 0 = no cap) bounds the
+    memory one sheet may use. Encoded images whose full-resolution
+    processing would exceed it are decoded at 1/2, 1/4 or 1/8 scale, the
+    smallest reduction that fits; the accurate tier additionally
+    thresholds tall images in bands (see OMRProcessor). Sizes come from
+    the PNG, JPEG, TIFF, BMP or PNM header; other formats are rejected
+    while the cap is set.
+    """
+    
+    def __init__(self, mode: Optional[str] = None, min_confidence: float = 0.9,
+                 max_ambiguity: float = 0.05, ambiguity_band: float = 0.1,
+                 quality_mode: Optional[str] = None, quality_gate: Optional[QualityGate] = None,
+                 max_sheet_mb: Optional[float] = None):
+        self.mode = self._check_mode(mode or os.environ.get('OMR_ENGINE_MODE', 'auto'))
+        self.quality_mode = quality_mode or os.environ.get('OMR_QUALITY_GATE', 'reject')
+        if self.quality_mode not in QUALITY_MODES:
+            raise ValueError(f"Unknown quality gate mode: {self.quality_mode} (expected one of {', '.join(QUALITY_MODES)})")
+        self.quality_gate = quality_gate or QualityGate()
+        self.min_confidence = min_confidence
+        self.max_ambiguity = max_ambiguity
+        self.ambiguity_band = ambiguity_band
+        self.max_sheet_bytes = int(float(max_sheet_mb if max_sheet_mb is not None
+                                         else os.environ.get('OMR_MAX_SHEET_MB', 0)) * 1024 * 1024)
+        
+        self.fast = FastOMRProcessor()
+        self.accurate = OMRProcessor()
+    
+    def process_image(self, image_path: str, template: Dict, mode: Optional[str] = None) -> Dict:
+        """Process an image file
+        
+        PGM and raw page files (see rawio) are memory-mapped instead of
+        decoded; use process_pages for files holding more than one page.
+        """
+        if is_raw_image(image_path):
+            try:
+                pages = map_pages(image_path)
+            except (OSError, RawImageError) as e:
+                return {'success': False, 'error': f'Could not load image: {e}'}
+            if len(pages) != 1:
+                return {'success': False, 'error': f'Image file holds {len(pages)} pages'}
+            return self.process_array(pages[0], template, image_path, mode)
+        
+        try:
+            data = np.fromfile(image_path, dtype=np.uint8)
+        except OSError:
+            return {'success': False, 'error': 'Could not load image'}
+        
+        return self.process_bytes(data, template, image_path, mode)
+    
+    def process_pages(self, image_path: str, template: Dict, mode: Optional[str] = None) -> List[Dict]:
+        """Process every page of a memory-mapped PGM or raw page stack
+        
+        Pages are zero-copy views of the mapping, so only the rows a tier
+        actually reads are paged in. Each result carries its 0-based 'page'.
+        """
+        try:
+            pages = map_pages(image_path)
+        except (OSError, RawImageError) as e:
+            return [{'success': False, 'error': f'Could not load image: {e}', 'page': 0}]
+        
+        root, ext = os.path.splitext(image_path)
+        results = []
+        for index, page in enumerate(pages):
+            page_path = image_path if len(pages) == 1 else f"{root}_page{index + 1}{ext}"
+            result = self.process_array(page, template, page_path, mode)
+            result['page'] = index
+            results.append(result)
+        return results
+    
+    def process_bytes(self, data, template: Dict, image_path: Optional[str] = None,
+                      mode: Optional[str] = None) -> Dict:
+        """Process an encoded image (bytes, memoryview or uint8 array)
+        
+        The image is decoded once, to grayscale, and shared by the quality
+        gate and both tiers.
+        """
+        buffer = np.frombuffer(data, np.uint8)
+        with span('decode', bytes=int(buffer.size)) as decode_span:
+            flag = self._decode_flag(buffer)
+            if flag is None:
+                return {'success': False, 'error': 'Unknown image size: the sheet memory cap '
+                                                   'accepts PNG, JPEG, TIFF, BMP or PNM images'}
+            image = cv2.imdecode(buffer, flag) if buffer.size else None
+            if image is None:
+                return {'success': False, 'error': 'Could not decode image'}
+            decode_span.set(height=image.shape[0], width=image.shape[1])
+        
+        return self.process_array(image, template, image_path, mode)
+    
+    def process_array(self, image: np.ndarray, template: Dict, image_path: Optional[str] = None,
+                      mode: Optional[str] = None) -> Dict:
+        """Process an already decoded image"""
+        quality = None
+        if self.quality_mode != 'off':
+            with span('quality_gate') as gate_span:
+                quality = self.quality_gate.check(image)
+                gate_span.set(ok=quality['ok'], reason=quality['reason'])
+            if not quality['ok'] and self.quality_mode == 'reject':
+                return {'success': False, 'error': quality['reason'], 'quality': quality, 'tier': 'preflight'}
+        
+        result = self._run(image, template, image_path, mode)
+        if quality is not None:
+            result['quality'] = quality
+        return result
+    
+    def _run(self, image: np.ndarray, template: Dict, image_path: Optional[str], mode: Optional[str]) -> Dict:
+        mode = self._check_mode(mode or self.mode)
+        template = compile_template(template)
+        
+        if mode == 'fast':
+            return self._run_tier(self.fast, image, template, image_path)
+        if mode == 'accurate':
+            return self._run_tier(self.accurate, image, template, image_path)
+        
+        fast_result = self._run_tier(self.fast, image, template, image_path)
+        if self._is_confident(fast_result, template):
+            fast_result['escalated'] = False
+            return fast_result
+        
+        accurate_result = self._run_tier(self.accurate, image, template, image_path)
+        if not self._is_better(accurate_result, fast_result, template):
+            # The full pipeline could not do better (e.g. no sheet border found)
+            fast_result['escalated'] = True
+            return fast_result
+        
+        accurate_result['escalated'] = True
+        return accurate_result
+    
+    @staticmethod
+    def _run_tier(tier, image: np.ndarray, template, image_path: Optional[str]) -> Dict:
+        with span(f'tier.{tier.tier}') as tier_span:
+            result = tier.process_array(image, template, image_path)
+            tier_span.set(success=result['success'], confidence=result.get('confidence'),
+                          warp_path=result.get('warp_path'), error=result.get('error'))
+            return result
+    
+    def _decode_flag(self, buffer: np.ndarray) -> Optional[int]:
+        """Grayscale decode flag, reduced as far as needed to respect the memory cap
+        
+        None if the cap is set but the header gives no size (the image is
+        rejected rather than decoded at full resolution).
+        """
+        if self.max_sheet_bytes <= 0:
+            return cv2.IMREAD_GRAYSCALE
+        
+        size = encoded_image_size(buffer)
+        if size is None:
+            return None if buffer.size else cv2.IMREAD_GRAYSCALE
+        
+        height, width = size
+        for factor, flag in REDUCED_DECODES:
+            peak = buffer.nbytes + self.accurate.peak_bytes(-(-height // factor), -(-width // factor))
+            if peak <= self.max_sheet_bytes:
+                return flag
+        return REDUCED_DECODES[-1][1]
+    
+    def warp_path_counts(self) -> Dict[str, int]:
+        """How often the accurate tier cropped, affine-warped or fully warped"""
+        with self.accurate._warp_paths_lock:
+            return dict(self.accurate.warp_paths)
+    
+    def _is_confident(self, result: Dict, template) -> bool:
+        """Whether a fast-tier result is good enough to skip the accurate tier"""
+        if not result['success'] or result['confidence'] < self.min_confidence:
+            return False
+        
+        return self._ambiguity(result, template) <= self.max_ambiguity
+    
+    def _is_better(self, candidate: Dict, result: Dict, template) -> bool:
+        """Whether an escalated result should replace the fast-tier one
+        
+        The fast tier is the stronger reader on well-framed sheets, so the
+        accurate result has to win on confidence without being more
+        ambiguous, or match the confidence and be clearly less ambiguous.
+        """
+        if not candidate['success']:
+            return False
+        if not result['success']:
+            return True
+        
+        confidence_gain = candidate['confidence'] - result['confidence']
+        ambiguity_gain = self._ambiguity(result, template) - self._ambiguity(candidate, template)
+        if confidence_gain < 0 or ambiguity_gain < 0:
+            return False
+        return confidence_gain > 0 or ambiguity_gain > self.max_ambiguity
+    
+    def _ambiguity(self, result: Dict, template) -> float:
+        """Share of answer bubbles whose fill ratio sits close to the threshold"""
+        ratios = np.asarray(result['fill_ratios'], dtype=np.float32)
+        if ratios.size == 0:
+            return 1.0
+        
+        ambiguous = np.abs(ratios - template.fill_threshold) < self.ambiguity_band
+        return float(ambiguous.mean())
+    
+    @staticmethod
+    def _check_mode(mode: str) -> str:
+        if mode not in ENGINE_MODES:
+            raise ValueError(f"Unknown engine mode: {mode} (expected one of {', '.join(ENGINE_MODES)})")
+        return mode
@@ -0,0 +1,94 @@
+import cv2
+import numpy as np
+import os
+from typing import Dict, Optional
+
+from .accurate import OMRProcessor
+from .templates import compile_template
+from .tracing import record_error, span
+
+class FastOMRProcessor(OMRProcessor):
+    """Fast tier: grayscale decode at reduced size, global threshold
+    
+    The sheet is located as the largest paper-coloured region of the Otsu
+    threshold (one contour pass, no adaptive threshold or blur) and only its
+    answer region is cropped or warped out, so sheets photographed on a
+    background work as well as flatbed scans. Bubble geometry and
+    fill-ratio extraction are shared with the accurate tier so both tiers
+    report comparable results.
+    """
+    
+    tier = 'fast'
+    
+    def __init__(self, max_dimension: int = 1200):
+        super().__init__()
+        self.max_dimension = max_dimension
+    
+    def process_bytes(self, data, template: Dict, image_path: Optional[str] = None) -> Dict:
+        """Decode straight to grayscale (no colour conversion) and process"""
+        buffer = np.frombuffer(data, np.uint8)
+        image = cv2.imdecode(buffer, cv2.IMREAD_GRAYSCALE) if buffer.size else None
+        if image is None:
+            return {'success': False, 'error': 'Could not decode image'}
+        
+        return self.process_array(image, template, image_path)
+    
+    def process_array(self, image: np.ndarray, template: Dict, image_path: Optional[str] = None) -> Dict:
+        """Process an already decoded image with a cheap sheet crop"""
+        try:
+            gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            with span('threshold'):
+                gray = self._downscale(gray)
+                
+                # Global (Otsu) threshold: one histogram pass instead of per-pixel windows
+                _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+            
+            # Paper is below the threshold, so the sheet is the largest region
+            # of the inverted image; a frame-filling scan yields the whole frame
+            with span('detect_sheet'):
+                sheet_contour = self._detect_sheet_boundaries(cv2.bitwise_not(thresh))
+            if sheet_contour is None:
+                return {'success': False, 'error': 'Could not detect OMR sheet boundaries'}
+            
+            template = compile_template(template)
+            with span('warp') as warp_span:
+                thresh, warp_path = self._warp_answer_region(thresh, sheet_contour, template)
+                warp_span.set(warp_path=warp_path)
+            with self._warp_paths_lock:
+                self.warp_paths[warp_path] += 1
+            
+            with span('read_sheet'):
+                answers, fill_ratios, fields = self._read_sheet(thresh, template, boxes=template.region_boxes)
+            
+            processed_image_path = None
+            if image_path:
+                root, ext = os.path.splitext(image_path)
+                if not cv2.haveImageWriter(ext or '.png'):
+                    ext = '.png'  # e.g. raw scanner dumps
+                processed_image_path = f"{root}_processed{ext or '.png'}"
+                cv2.imwrite(processed_image_path, thresh)
+            
+            return {
+                'success': True,
+                'answers': answers,
+                'fill_ratios': fill_ratios,
+                'fields': fields,
+                'processed_image_path': processed_image_path,
+                'confidence': self._calculate_confidence(answers),
+                'tier': self.tier,
+                'warp_path': warp_path
+            }
+        
+        except Exception as e:
+            record_error(e)
+            return {'success': False, 'error': str(e)}
+    
+    def _downscale(self, gray: np.ndarray) -> np.ndarray:
+        """Shrink so the longest side is at most max_dimension pixels"""
+        height, width = gray.shape
+        scale = self.max_dimension / max(height, width)
+        if scale >= 1:
+            return gray
+        
+        size = (max(1, int(width * scale)), max(1, int(height * scale)))
+        return cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
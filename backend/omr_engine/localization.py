@@ -0,0 +1,170 @@
+"""
+Contour-driven bubble localization.
+
+Bubble candidates are the connected components of the binary sheet whose
+size matches the template's ``detection`` block (``min_contour_area`` /
+``max_contour_area``, in the template's ``layout.bubble_size`` pixel units).
+Their centroids are matched to the nominal template grid and a per-axis
+scale and offset is fitted by least squares, so a sheet that is slightly
+shifted or scaled after warping is still read at the right places.
+
+Fits can be reused for a whole batch of sheets from the same scanner:
+    
+    with batch_grid_cache():
+        for path in paths:
+            engine.process_image(path, template)
+"""
+
+import contextlib
+import contextvars
+import cv2
+import numpy as np
+from typing import Optional, Tuple
+
+# Largest correction accepted from a fit; anything beyond is treated as a
+# mismatch and the nominal grid is used instead
+MAX_SCALE_ERROR = 0.1
+MAX_OFFSET_BUBBLES = 1.5
+
+_grid_cache = contextvars.ContextVar('omr_grid_cache', default=None)
+
+
+@contextlib.contextmanager
+def batch_grid_cache():
+    """Reuse grid fits for every sheet processed inside this block
+    
+    The cache lives in a context variable, so concurrent requests on other
+    threads never see each other's fits.
+    """
+    token = _grid_cache.set({})
+    try:
+        yield
+    finally:
+        _grid_cache.reset(token)
+
+
+class GridFit:
+    """Per-axis scale and offset mapping nominal bubble centers to observed ones"""
+    
+    __slots__ = ('scale_x', 'offset_x', 'scale_y', 'offset_y', 'matched')
+    
+    def __init__(self, scale_x=1.0, offset_x=0.0, scale_y=1.0, offset_y=0.0, matched=0):
+        self.scale_x = scale_x
+        self.offset_x = offset_x
+        self.scale_y = scale_y
+        self.offset_y = offset_y
+        self.matched = matched
+    
+    def apply(self, pixel_boxes: np.ndarray) -> np.ndarray:
+        """Map (..., 4) [x, y, w, h] pixel boxes through the fit"""
+        fitted = pixel_boxes.astype(np.float32)
+        fitted[..., 0] = pixel_boxes[..., 0] * self.scale_x + self.offset_x
+        fitted[..., 1] = pixel_boxes[..., 1] * self.scale_y + self.offset_y
+        fitted[..., 2] = pixel_boxes[..., 2] * self.scale_x
+        fitted[..., 3] = pixel_boxes[..., 3] * self.scale_y
+        return fitted
+
+
+def find_bubble_candidates(binary: np.ndarray, template, bubble_width: float,
+                           bubble_height: float) -> np.ndarray:
+    """Centroids (N, 2) of connected components sized like a bubble
+    
+    A component's area is estimated from its bounding box as an ellipse, so
+    unfilled (ring) bubbles and filled ones are sized alike, like a contour
+    area would be.
+    """
+    _, _, stats, centroids = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    widths = stats[1:, cv2.CC_STAT_WIDTH].astype(np.float32)
+    heights = stats[1:, cv2.CC_STAT_HEIGHT].astype(np.float32)
+    areas = np.pi / 4 * widths * heights
+    
+    # Template areas are in layout.bubble_size pixels; rescale to this image
+    scale = 1.0
+    if template.bubble_pixels is not None:
+        design_width, design_height = template.bubble_pixels
+        scale = (bubble_width * bubble_height) / float(design_width * design_height)
+    
+    min_area = float(template.detection.get('min_contour_area', 0)) * scale
+    max_area = float(template.detection.get('max_contour_area', np.inf)) * scale
+    
+    expected_aspect = bubble_width / max(bubble_height, 1e-6)
+    aspect = widths / np.maximum(heights, 1)
+    
+    keep = ((areas >= min_area) & (areas <= max_area)
+            & (aspect >= expected_aspect / 2) & (aspect <= expected_aspect * 2))
+    return centroids[1:][keep]
+
+
+def fit_grid(candidates: np.ndarray, pixel_boxes: np.ndarray) -> Optional[GridFit]:
+    """Least-squares per-axis fit of candidate centroids to the nominal grid
+    
+    Each candidate is matched to its nearest nominal bubble center within
+    half a bubble. Returns None when too few bubbles match or the fit is
+    implausible.
+    """
+    boxes = pixel_boxes.reshape(-1, 4)
+    if len(candidates) == 0 or len(boxes) == 0:
+        return None
+    
+    centers = boxes[:, :2] + boxes[:, 2:] / 2
+    bubble_width = float(np.median(boxes[:, 2]))
+    bubble_height = float(np.median(boxes[:, 3]))
+    tolerance = min(bubble_width, bubble_height) / 2
+    
+    # (candidates, bubbles) squared distances in one broadcast
+    deltas = candidates[:, None, :] - centers[None, :, :]
+    distances = np.einsum('ijk,ijk->ij', deltas, deltas)
+    nearest = distances.argmin(axis=1)
+    close = distances[np.arange(len(candidates)), nearest] <= tolerance ** 2
+    
+    observed = candidates[close]
+    expected = centers[nearest[close]]
+    min_matches = max(4, len(centers) // 10)
+    if len(observed) < min_matches:
+        return None
+    
+    fit = GridFit(matched=len(observed))
+    for axis, size in ((0, bubble_width), (1, bubble_height)):
+        if np.ptp(expected[:, axis]) < size:
+            # All matches on one row/column: only the offset is observable
+            scale, offset = 1.0, float(np.mean(observed[:, axis] - expected[:, axis]))
+        else:
+            design = np.stack([expected[:, axis], np.ones(len(expected))], axis=1)
+            (scale, offset), *_ = np.linalg.lstsq(design, observed[:, axis], rcond=None)
+        
+        # Shift at the grid center must stay within a bubble or two
+        center = float(np.mean(expected[:, axis]))
+        if (abs(scale - 1) > MAX_SCALE_ERROR
+                or abs(center * (scale - 1) + offset) > MAX_OFFSET_BUBBLES * size):
+            return None
+        
+        if axis == 0:
+            fit.scale_x, fit.offset_x = float(scale), float(offset)
+        else:
+            fit.scale_y, fit.offset_y = float(scale), float(offset)
+    
+    return fit
+
+
+def localize_grid(binary: np.ndarray, template, pixel_boxes: np.ndarray,
+                  cache_key=None) -> Tuple[np.ndarray, Optional[GridFit]]:
+    """Snap nominal pixel boxes to the bubbles found in `binary`
+    
+    Returns the (possibly corrected) boxes and the fit used, or the nominal
+    boxes and None when no reliable fit was found. Inside
+    batch_grid_cache(), a fit found for `cache_key` is reused.
+    """
+    cache = _grid_cache.get()
+    if cache is not None and cache_key in cache:
+        fit = cache[cache_key]
+    else:
+        bubble_width = float(np.median(pixel_boxes[..., 2]))
+        bubble_height = float(np.median(pixel_boxes[..., 3]))
+        candidates = find_bubble_candidates(binary, template, bubble_width, bubble_height)
+        fit = fit_grid(candidates.astype(np.float32), pixel_boxes)
+        if cache is not None and fit is not None:
+            cache[cache_key] = fit
+    
+    if fit is None:
+        return pixel_boxes, None
+    return fit.apply(pixel_boxes), fit
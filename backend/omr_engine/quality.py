@@ -0,0 +1,116 @@
+"""
+Pre-flight capture quality gate.
+
+Runs on a small downscaled copy of the image (a few milliseconds) before any
+tier of the engine, so blurry, badly exposed or badly framed captures are
+turned away with an actionable reason instead of going through sheet
+detection, warping and extraction first.
+"""
+
+import cv2
+import numpy as np
+from typing import Dict, List
+
+QUALITY_MODES = ('reject', 'flag', 'off')
+
+
+class QualityGate:
+    """Sharpness, exposure and sheet-coverage checks on a downscaled image
+    
+    Each check has a reject threshold and a softer warning threshold.
+    Sharpness is the variance of the Laplacian, rescaled as if the paper
+    were exposed at full white so dim captures are not mistaken for blur.
+    """
+    
+    def __init__(self, size: int = 400, min_sharpness: float = 15.0, warn_sharpness: float = 50.0,
+                 min_paper_level: int = 60, max_ink_level: int = 200, min_contrast: int = 40,
+                 min_coverage: float = 0.2, warn_coverage: float = 0.85):
+        self.size = size
+        self.min_sharpness = min_sharpness
+        self.warn_sharpness = warn_sharpness
+        self.min_paper_level = min_paper_level
+        self.max_ink_level = max_ink_level
+        self.min_contrast = min_contrast
+        self.min_coverage = min_coverage
+        self.warn_coverage = warn_coverage
+    
+    def check(self, image: np.ndarray) -> Dict:
+        """
+        Assess a decoded (grayscale or BGR) image
+        
+        Returns:
+            Dict with 'ok', 'reason' (first failed check, or None),
+            'warnings' and the raw 'metrics'
+        """
+        small = self._downscale(image)
+        
+        # Exposure from the histogram: paper level (99th percentile) and ink
+        # level (1st percentile)
+        hist = cv2.calcHist([small], [0], None, [256], [0, 256]).ravel()
+        cdf = np.cumsum(hist) / small.size
+        ink_level = int(np.searchsorted(cdf, 0.01))
+        paper_level = int(np.searchsorted(cdf, 0.99))
+        
+        contrast = paper_level - ink_level
+        exposure_gain = 255.0 / max(paper_level, 1)
+        sharpness = float(cv2.Laplacian(small, cv2.CV_64F).var()) * exposure_gain ** 2
+        
+        coverage, touches_edge = self._sheet_coverage(small)
+        
+        metrics = {
+            'sharpness': round(sharpness, 1),
+            'paper_level': paper_level,
+            'ink_level': ink_level,
+            'coverage': round(coverage, 3)
+        }
+        
+        reasons: List[str] = []
+        warnings: List[str] = []
+        
+        if paper_level < self.min_paper_level:
+            reasons.append('Image is too dark: add light or avoid shadows on the sheet')
+        elif ink_level > self.max_ink_level:
+            reasons.append('Image is overexposed: marks are washed out, avoid glare or direct light')
+        elif contrast < self.min_contrast:
+            reasons.append('Image has too little contrast: retake in even lighting')
+        
+        if sharpness < self.min_sharpness:
+            reasons.append('Image is blurry: hold the camera steady and let it focus')
+        elif sharpness < self.warn_sharpness:
+            warnings.append('Image is slightly blurry')
+        
+        if coverage < self.min_coverage:
+            reasons.append('Sheet is too small in the frame: move the camera closer')
+        elif touches_edge and coverage < self.warn_coverage:
+            warnings.append('Sheet may be cut off at the edge of the frame')
+        
+        return {
+            'ok': not reasons,
+            'reason': reasons[0] if reasons else None,
+            'warnings': reasons[1:] + warnings,
+            'metrics': metrics
+        }
+    
+    def _downscale(self, image: np.ndarray) -> np.ndarray:
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        height, width = gray.shape
+        scale = self.size / max(height, width)
+        if scale >= 1:
+            return gray
+        
+        size = (max(1, int(width * scale)), max(1, int(height * scale)))
+        return cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+    
+    @staticmethod
+    def _sheet_coverage(small: np.ndarray):
+        """Fraction of the frame covered by the largest bright (paper) region"""
+        _, paper = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+        contours, _ = cv2.findContours(paper, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if not contours:
+            return 0.0, False
+        
+        largest = max(contours, key=cv2.contourArea)
+        x, y, w, h = cv2.boundingRect(largest)
+        height, width = small.shape
+        touches_edge = x <= 0 or y <= 0 or x + w >= width or y + h >= height
+        return cv2.contourArea(largest) / float(small.size), touches_edge
@@ -0,0 +1,150 @@
+"""
+Memory-mapped ingestion of uncompressed 8-bit grayscale scanner output.
+
+Production scanners can write pages as binary PGM (P5, one page or several
+concatenated in one file) or as headerless raw dumps described by a JSON
+sidecar. Both are mapped with ``np.memmap`` and every page is returned as a
+read-only ndarray view of the mapping: nothing is decoded or copied, and
+repeated runs over the same files are served from the OS page cache.
+
+Raw sidecar (``<file>.json`` or ``<file stem>.json``)::
+
+    {"width": 4960, "height": 7016, "offset": 0, "pages": 3}
+
+``offset`` (bytes before the first page) defaults to 0 and ``pages`` to
+however many whole pages fit in the file.
+"""
+
+import json
+import os
+from typing import List
+
+import numpy as np
+
+RAW_EXTENSIONS = ('.pgm', '.raw', '.gray')
+
+
+class RawImageError(ValueError):
+    """Malformed PGM header, missing or invalid raw sidecar"""
+
+
+def is_raw_image(path: str) -> bool:
+    """Whether `path` is a PGM or raw page file handled by map_pages"""
+    return os.path.splitext(path)[1].lower() in RAW_EXTENSIONS
+
+
+def map_pages(path: str) -> List[np.ndarray]:
+    """
+    Memory-map a PGM or raw page file
+    
+    Args:
+        path: .pgm file (one or more concatenated P5 images) or .raw/.gray
+            file with a JSON sidecar
+    
+    Returns:
+        One read-only (height, width) uint8 view per page
+    """
+    if os.path.getsize(path) == 0:
+        raise RawImageError(f"{os.path.basename(path)}: empty file")
+    
+    data = np.memmap(path, dtype=np.uint8, mode='r')
+    if os.path.splitext(path)[1].lower() == '.pgm':
+        return _pgm_pages(path, data)
+    return _raw_pages(path, data)
+
+
+def _pgm_pages(path: str, data: np.memmap) -> List[np.ndarray]:
+    pages = []
+    pos = 0
+    while pos < data.size:
+        # Whitespace (and nothing else) may pad concatenated images
+        if data[pos] in b' \t\r\n':
+            pos += 1
+            continue
+        
+        width, height, pos = _parse_pgm_header(path, data, pos)
+        end = pos + width * height
+        if end > data.size:
+            raise RawImageError(f"{os.path.basename(path)}: page {len(pages) + 1} is truncated")
+        
+        pages.append(data[pos:end].reshape(height, width))
+        pos = end
+    
+    if not pages:
+        raise RawImageError(f"{os.path.basename(path)}: no PGM pages found")
+    return pages
+
+
+def _parse_pgm_header(path: str, data: np.memmap, pos: int):
+    """Return (width, height, offset of the pixel data) for the P5 header at `pos`"""
+    name = os.path.basename(path)
+    if bytes(data[pos:pos + 2]) != b'P5':
+        raise RawImageError(f"{name}: not a binary (P5) PGM file")
+    pos += 2
+    
+    values = []
+    while len(values) < 3:
+        # Skip whitespace and comments between header fields
+        while pos < data.size and (data[pos] in b' \t\r\n' or data[pos] == ord('#')):
+            if data[pos] == ord('#'):
+                while pos < data.size and data[pos] not in b'\r\n':
+                    pos += 1
+            else:
+                pos += 1
+        
+        start = pos
+        while pos < data.size and ord('0') <= data[pos] <= ord('9'):
+            pos += 1
+        if start == pos:
+            raise RawImageError(f"{name}: malformed PGM header")
+        values.append(int(bytes(data[start:pos])))
+    
+    width, height, maxval = values
+    if maxval > 255:
+        raise RawImageError(f"{name}: only 8-bit PGM is supported (maxval {maxval})")
+    if width <= 0 or height <= 0:
+        raise RawImageError(f"{name}: invalid PGM size {width}x{height}")
+    
+    # Exactly one whitespace byte separates the header from the pixels
+    return width, height, pos + 1
+
+
+def _raw_pages(path: str, data: np.memmap) -> List[np.ndarray]:
+    name = os.path.basename(path)
+    header = _read_sidecar(path)
+    
+    try:
+        width = int(header['width'])
+        height = int(header['height'])
+        offset = int(header.get('offset', 0))
+        pages = header.get('pages')
+        pages = None if pages is None else int(pages)
+    except (KeyError, TypeError, ValueError):
+        raise RawImageError(f"{name}: sidecar needs integer width and height")
+    if width <= 0 or height <= 0 or offset < 0:
+        raise RawImageError(f"{name}: invalid raw geometry {width}x{height}+{offset}")
+    
+    page_size = width * height
+    available = (data.size - offset) // page_size
+    count = available if pages is None else pages
+    if count <= 0 or count > available:
+        raise RawImageError(f"{name}: file holds {max(available, 0)} page(s) of {width}x{height}, "
+                            f"sidecar declares {count}")
+    
+    stack = data[offset:offset + count * page_size].reshape(count, height, width)
+    return list(stack)
+
+
+def _read_sidecar(path: str) -> dict:
+    for candidate in (path + '.json', os.path.splitext(path)[0] + '.json'):
+        if os.path.isfile(candidate):
+            try:
+                with open(candidate) as f:
+                    header = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                raise RawImageError(f"{os.path.basename(candidate)}: {e}")
+            if not isinstance(header, dict):
+                raise RawImageError(f"{os.path.basename(candidate)}: sidecar must be a JSON object")
+            return header
+    
+    raise RawImageError(f"{os.path.basename(path)}: missing sidecar {os.path.basename(path)}.json")
@@ -0,0 +1,197 @@
+"""
+Content-hash cache of scan results for de-duplicating re-uploads.
+
+Exact duplicates (client retries, the same file uploaded twice) are found by
+SHA-256 of the image bytes together with the answer key, the template
+version and ENGINE_VERSION, and are answered from the cache without
+processing. The answer key is part of the key because the stored scan row
+carries the score it produced; the same image graded against another key
+is a new scan.
+
+Optionally a 256-bit difference hash (dHash) of the image finds
+near-duplicates (the same photo re-encoded or resized by a messaging app).
+Different sheets of one template look almost identical at that scale (two
+students with the same answers can match), so a perceptual match never
+merges scans: the sheet is still processed and stored as a scan of its own,
+and a match whose answers and fields agree is only reported as similar.
+
+Configuration (environment variables):
+    OMR_RESULT_CACHE_ENTRIES       Max cached results (default 1000, 0 disables)
+    OMR_RESULT_CACHE_PERCEPTUAL    "1" to enable near-duplicate detection
+    OMR_RESULT_CACHE_MAX_DISTANCE  Max dHash bit difference for a near match (default 6)
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from . import ENGINE_VERSION
+
+# dHash grid: HASH_SIZE x HASH_SIZE bits
+HASH_SIZE = 16
+
+
+class CacheLookup:
+    """Outcome of ResultCache.lookup for one upload"""
+    
+    __slots__ = ('key', 'scope', 'entry', 'similar', 'phash')
+    
+    def __init__(self, key, scope, entry=None, similar=None, phash=None):
+        self.key = key
+        self.scope = scope
+        self.entry = entry        # Exact duplicate: {'result', 'scan_id'}
+        self.similar = similar    # Perceptual match, to be confirmed by answers and fields
+        self.phash = phash
+
+
+class ResultCache:
+    """Bounded LRU of engine results keyed by image content"""
+    
+    def __init__(self, max_entries: int = 1000, perceptual: bool = False, max_distance: int = 6):
+        self.max_entries = max_entries
+        self.perceptual = perceptual
+        self.max_distance = max_distance
+        
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        
+        self._entries = OrderedDict()  # key -> {'result', 'scan_id', 'scope', 'phash'}
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_env(cls) -> 'ResultCache':
+        return cls(
+            max_entries=int(os.environ.get('OMR_RESULT_CACHE_ENTRIES', 1000)),
+            perceptual=os.environ.get('OMR_RESULT_CACHE_PERCEPTUAL', '').lower() in ('1', 'true', 'yes'),
+            max_distance=int(os.environ.get('OMR_RESULT_CACHE_MAX_DISTANCE', 6))
+        )
+    
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def lookup(self, data, template, answer_key: Optional[List] = None) -> CacheLookup:
+        """Find a cached result for the encoded image `data` graded with `answer_key`"""
+        scope = f"{template.version}:{ENGINE_VERSION}"
+        digest = hashlib.sha256(data).hexdigest()
+        key_digest = hashlib.sha256(json.dumps(answer_key or []).encode('utf-8')).hexdigest()[:16]
+        key = f"{digest}:{key_digest}:{scope}"
+        
+        if not self.enabled:
+            return CacheLookup(key, scope)
+        
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return CacheLookup(key, scope, entry=entry)
+        
+        phash = similar = None
+        if self.perceptual:
+            phash = perceptual_hash(data)
+            if phash is not None:
+                similar = self._find_similar(phash, scope)
+        
+        return CacheLookup(key, scope, similar=similar, phash=phash)
+    
+    def confirm(self, lookup: CacheLookup, result: Dict) -> Optional[Dict]:
+        """After processing, the similar entry if answers and fields match (else None)
+        
+        Counts the lookup as a near hit or a miss. The caller still stores the
+        upload as a new scan (and put()s it): a near match may be a different
+        student with the same answers.
+        """
+        similar = lookup.similar
+        if (similar is not None and result.get('success')
+                and similar['result'].get('answers') == result.get('answers')
+                and (similar['result'].get('fields') or {}) == (result.get('fields') or {})):
+            with self._lock:
+                self.near_hits += 1
+            return similar
+        
+        with self._lock:
+            self.misses += 1
+        return None
+    
+    def put(self, lookup: CacheLookup, result: Dict, scan_id) -> None:
+        """Remember the result of a newly processed upload"""
+        if not self.enabled or not result.get('success'):
+            return
+        with self._lock:
+            self._store(lookup.key, result, scan_id, lookup.scope, lookup.phash)
+    
+    def discard(self, lookup: CacheLookup) -> None:
+        """Forget an exact hit whose scan no longer exists (e.g. evicted from storage)
+        
+        The caller looks the upload up again and processes it as a miss.
+        """
+        with self._lock:
+            if self._entries.pop(lookup.key, None) is not None:
+                self.hits -= 1
+    
+    def stats(self) -> Dict:
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'near_hits': self.near_hits,
+            'misses': self.misses,
+            'hit_rate': round((self.hits + self.near_hits) / lookups, 4) if lookups else 0.0
+        }
+    
+    def _store(self, key, result, scan_id, scope, phash):
+        self._entries[key] = {'result': result, 'scan_id': scan_id, 'scope': scope, 'phash': phash}
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def _find_similar(self, phash: np.ndarray, scope: str) -> Optional[Dict]:
+        with self._lock:
+            candidates = [entry for entry in self._entries.values()
+                          if entry['scope'] == scope and entry['phash'] is not None]
+        if not candidates:
+            return None
+        
+        # Hamming distance to every candidate in one pass
+        hashes = np.stack([entry['phash'] for entry in candidates])
+        distances = np.unpackbits(hashes ^ phash, axis=1).sum(axis=1)
+        best = int(distances.argmin())
+        return candidates[best] if distances[best] <= self.max_distance else None
+
+
+def perceptual_hash(data) -> Optional[np.ndarray]:
+    """dHash of an encoded image as packed bytes, or None if it cannot be decoded"""
+    import cv2
+    
+    buffer = np.frombuffer(data, np.uint8)
+    image = cv2.imdecode(buffer, cv2.IMREAD_REDUCED_GRAYSCALE_4) if buffer.size else None
+    if image is None:
+        return None
+    
+    small = cv2.resize(image, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA)
+    return np.packbits(small[:, 1:] > small[:, :-1])
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """Process-wide cache"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache.from_env()
+    return _cache
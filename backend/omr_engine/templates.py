@@ -0,0 +1,421 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import numpy as np
+from typing import Dict, List, Optional
+
+# Used when no templates directory can be found (e.g. a bare serverless bundle)
+BUILTIN_TEMPLATES = {
+    'default': {'display_name': 'Standard 20 Questions (A-D)', 'questions': 20, 'options': ['A', 'B', 'C', 'D']},
+    'extended': {'display_name': 'Extended 50 Questions (A-E)', 'questions': 50, 'options': ['A', 'B', 'C', 'D', 'E']},
+    'short': {'display_name': 'Short 10 Questions (A-C)', 'questions': 10, 'options': ['A', 'B', 'C']},
+    'medium': {'display_name': 'Medium 30 Questions (A-D)', 'questions': 30, 'options': ['A', 'B', 'C', 'D']},
+    'large': {'display_name': 'Large 100 Questions (A-E)', 'questions': 100, 'options': ['A', 'B', 'C', 'D', 'E']}
+}
+
+# Bubble grid layout as fractions of the corrected sheet
+GRID_START_X = 0.10
+GRID_START_Y = 0.15
+GRID_END_Y = 0.85
+BUBBLE_WIDTH = 0.03
+BUBBLE_HEIGHT = 0.02
+OPTION_SPACING = 0.08
+
+DEFAULT_FILL_THRESHOLD = 0.3
+
+# Extra bubble fields (roll number, booklet code): digits unless told otherwise
+DEFAULT_FIELD_VALUES = [str(digit) for digit in range(10)]
+FIELD_COLUMN_SPACING = 0.045
+FIELD_ROW_SPACING = 0.03
+FIELD_BLANK = '?'
+FIELD_MULTIPLE = '*'
+# How far the darkest bubble of a field column must out-fill the runner-up
+DEFAULT_FIELD_MARGIN = 0.1
+
+
+class TemplateError(ValueError):
+    """Template file failed validation"""
+
+
+def validate_template(name: str, template: Dict) -> None:
+    """Raise TemplateError if `template` is not a usable OMR template"""
+    if not isinstance(template, dict):
+        raise TemplateError(f"{name}: template must be a JSON object")
+    
+    questions = template.get('questions')
+    if not isinstance(questions, int) or isinstance(questions, bool) or questions <= 0:
+        raise TemplateError(f"{name}: 'questions' must be a positive integer")
+    
+    options = template.get('options')
+    if (not isinstance(options, list) or not options
+            or not all(isinstance(o, str) and o for o in options)
+            or len(set(options)) != len(options)):
+        raise TemplateError(f"{name}: 'options' must be a list of unique non-empty strings")
+    
+    for section in ('layout', 'detection'):
+        if section in template and not isinstance(template[section], dict):
+            raise TemplateError(f"{name}: '{section}' must be an object")
+    
+    bubble_size = template.get('layout', {}).get('bubble_size', {})
+    if (not isinstance(bubble_size, dict)
+            or not all(isinstance(bubble_size.get(k, 1), (int, float)) and bubble_size.get(k, 1) > 0
+                       for k in ('width', 'height'))):
+        raise TemplateError(f"{name}: 'layout.bubble_size' must have positive width and height")
+    
+    fields = template.get('fields', {})
+    if not isinstance(fields, dict):
+        raise TemplateError(f"{name}: 'fields' must be an object")
+    for field_name, field in fields.items():
+        validate_field(name, field_name, field)
+    
+    threshold = template.get('detection', {}).get('fill_threshold', DEFAULT_FILL_THRESHOLD)
+    if not isinstance(threshold, (int, float)) or not 0 < threshold < 1:
+        raise TemplateError(f"{name}: 'detection.fill_threshold' must be between 0 and 1")
+    
+    margin = template.get('detection', {}).get('field_margin', DEFAULT_FIELD_MARGIN)
+    if not isinstance(margin, (int, float)) or not 0 < margin < 1:
+        raise TemplateError(f"{name}: 'detection.field_margin' must be between 0 and 1")
+
+
+def validate_field(name: str, field_name: str, field: Dict) -> None:
+    """Raise TemplateError if a `fields` entry is not a usable bubble grid"""
+    prefix = f"{name}: field '{field_name}'"
+    if not field_name.isidentifier() or not isinstance(field, dict):
+        raise TemplateError(f"{prefix} must be an object with an identifier name")
+    
+    length = field.get('length')
+    if not isinstance(length, int) or isinstance(length, bool) or length <= 0:
+        raise TemplateError(f"{prefix}: 'length' must be a positive integer")
+    
+    values = field.get('values', DEFAULT_FIELD_VALUES)
+    if (not isinstance(values, list) or not values
+            or not all(isinstance(v, str) and len(v) == 1 for v in values)
+            or len(set(values)) != len(values)):
+        raise TemplateError(f"{prefix}: 'values' must be a list of unique single characters")
+    
+    for key in ('x', 'y', 'column_spacing', 'row_spacing'):
+        if key in ('x', 'y') and key not in field:
+            raise TemplateError(f"{prefix}: '{key}' is required")
+        value = field.get(key, 0.5)
+        if not isinstance(value, (int, float)) or isinstance(value, bool) or not 0 < value < 1:
+            raise TemplateError(f"{prefix}: '{key}' must be a fraction of the sheet between 0 and 1")
+    
+    right = field['x'] + (length - 1) * field.get('column_spacing', FIELD_COLUMN_SPACING) + BUBBLE_WIDTH
+    bottom = field['y'] + (len(values) - 1) * field.get('row_spacing', FIELD_ROW_SPACING) + BUBBLE_HEIGHT
+    if right > 1 or bottom > 1:
+        raise TemplateError(f"{prefix} does not fit on the sheet")
+
+
+class TemplateField:
+    """A compiled extra bubble grid: one column per character, one row per value"""
+    
+    def __init__(self, name: str, spec: Dict, start: int):
+        self.name = name
+        self.values = list(spec.get('values', DEFAULT_FIELD_VALUES))
+        self.length = spec['length']
+        
+        column_spacing = spec.get('column_spacing', FIELD_COLUMN_SPACING)
+        row_spacing = spec.get('row_spacing', FIELD_ROW_SPACING)
+        
+        # (length, values, 4) array of [x, y, w, h] as fractions of the sheet
+        self.boxes = np.empty((self.length, len(self.values), 4), dtype=np.float32)
+        self.boxes[:, :, 0] = spec['x'] + np.arange(self.length)[:, None] * column_spacing
+        self.boxes[:, :, 1] = spec['y'] + np.arange(len(self.values))[None, :] * row_spacing
+        self.boxes[:, :, 2] = BUBBLE_WIDTH
+        self.boxes[:, :, 3] = BUBBLE_HEIGHT
+        
+        # Position of this field's boxes in CompiledTemplate.sheet_boxes
+        self.start = start
+        self.stop = start + self.boxes.shape[0] * self.boxes.shape[1]
+    
+    def decode(self, ratios: np.ndarray, threshold: float, margin: float = DEFAULT_FIELD_MARGIN) -> str:
+        """Field value from a (length, values) fill ratio matrix
+        
+        Each column is read relative to its own bubbles: the darkest one wins
+        when it out-fills the runner-up by `margin`, so printed outlines or a
+        uniformly dark scan do not mark the whole column. Otherwise the column
+        reads as '?' when nothing exceeds `threshold` and as '*' when more than
+        one bubble does.
+        """
+        order = np.argsort(ratios, axis=1)
+        darkest = np.take_along_axis(ratios, order[:, -1:], axis=1)[:, 0]
+        if ratios.shape[1] > 1:
+            runner_up = np.take_along_axis(ratios, order[:, -2:-1], axis=1)[:, 0]
+        else:
+            runner_up = np.zeros_like(darkest)
+        
+        return ''.join(
+            self.values[index] if top - second >= margin
+            else (FIELD_BLANK if top <= threshold else FIELD_MULTIPLE)
+            for index, top, second in zip(order[:, -1].tolist(), darkest.tolist(), runner_up.tolist())
+        )
+
+
+class CompiledTemplate:
+    """A validated template plus everything derived from it once per load
+    
+    Behaves like the template dict for reading (``get``/``[]``), so code that
+    accepts plain template dicts keeps working when given a compiled one.
+    """
+    
+    def __init__(self, name: str, template: Dict):
+        validate_template(name, template)
+        
+        self.name = name
+        self.template = template
+        self.num_questions = template['questions']
+        self.options = list(template['options'])
+        self.detection = template.get('detection', {})
+        self.fill_threshold = float(self.detection.get('fill_threshold', DEFAULT_FILL_THRESHOLD))
+        self.field_margin = float(self.detection.get('field_margin', DEFAULT_FIELD_MARGIN))
+        
+        # Content hash: changes whenever the template file does
+        canonical = json.dumps(template, sort_keys=True, separators=(',', ':'))
+        self.version = hashlib.sha1(canonical.encode('utf-8')).hexdigest()[:12]
+        
+        # (questions, options, 4) array of [x, y, w, h] as fractions of the sheet
+        self.bubble_boxes = self._bubble_grid(self.num_questions, len(self.options))
+        
+        # Extra bubble fields, then every box (answers first) as one flat
+        # (N, 4) array so all fill ratios are read in a single pass
+        self.fields: Dict[str, TemplateField] = {}
+        start = self.bubble_boxes.shape[0] * self.bubble_boxes.shape[1]
+        for field_name, spec in template.get('fields', {}).items():
+            field = TemplateField(field_name, spec, start)
+            self.fields[field_name] = field
+            start = field.stop
+        self.sheet_boxes = np.concatenate(
+            [self.bubble_boxes.reshape(-1, 4)] + [field.boxes.reshape(-1, 4) for field in self.fields.values()]
+        )
+        
+        # Rectangle enclosing every bubble (x0, y0, x1, y1 as fractions of the
+        # sheet, padded by one bubble) and the boxes relative to it, so only
+        # this region needs to be warped
+        self.answer_region = self._answer_region(self.sheet_boxes)
+        x0, y0, x1, y1 = self.answer_region
+        self.region_boxes = (
+            (self.sheet_boxes - np.array([x0, y0, 0, 0], dtype=np.float32))
+            / np.array([x1 - x0, y1 - y0, x1 - x0, y1 - y0], dtype=np.float32)
+        ).astype(np.float32)
+        
+        # Design size of one bubble in pixels (layout.bubble_size), if given
+        bubble_size = template.get('layout', {}).get('bubble_size', {})
+        if bubble_size.get('width') and bubble_size.get('height'):
+            self.bubble_pixels = (int(bubble_size['width']), int(bubble_size['height']))
+        else:
+            self.bubble_pixels = None
+    
+    def get(self, key, default=None):
+        return self.template.get(key, default)
+    
+    def __getitem__(self, key):
+        return self.template[key]
+    
+    def __contains__(self, key):
+        return key in self.template
+    
+    def summary(self) -> Dict:
+        """Public description served by /api/templates"""
+        return {
+            'name': self.name,
+            'display_name': self.template.get('display_name', self.name),
+            'questions': self.num_questions,
+            'options': self.options,
+            'fields': {name: field.length for name, field in self.fields.items()}
+        }
+    
+    @staticmethod
+    def _bubble_grid(num_questions: int, num_options: int) -> np.ndarray:
+        question_spacing = (GRID_END_Y - GRID_START_Y) / num_questions
+        
+        boxes = np.empty((num_questions, num_options, 4), dtype=np.float32)
+        boxes[:, :, 0] = GRID_START_X + np.arange(num_options)[None, :] * OPTION_SPACING
+        boxes[:, :, 1] = GRID_START_Y + np.arange(num_questions)[:, None] * question_spacing
+        boxes[:, :, 2] = BUBBLE_WIDTH
+        boxes[:, :, 3] = BUBBLE_HEIGHT
+        return boxes
+    
+    @staticmethod
+    def _answer_region(boxes: np.ndarray) -> tuple:
+        # One bubble of padding leaves room for localization to snap a
+        # slightly shifted grid
+        pad_x = BUBBLE_WIDTH
+        pad_y = BUBBLE_HEIGHT
+        x0 = max(0.0, float(boxes[..., 0].min()) - pad_x)
+        y0 = max(0.0, float(boxes[..., 1].min()) - pad_y)
+        x1 = min(1.0, float((boxes[..., 0] + boxes[..., 2]).max()) + pad_x)
+        y1 = min(1.0, float((boxes[..., 1] + boxes[..., 3]).max()) + pad_y)
+        return x0, y0, x1, y1
+
+
+def compile_template(template, name: str = 'custom') -> CompiledTemplate:
+    """Return `template` compiled; already compiled templates pass through"""
+    if isinstance(template, CompiledTemplate):
+        return template
+    return CompiledTemplate(name, template)
+
+
+def find_templates_dir() -> Optional[str]:
+    """Locate the templates directory
+    
+    OMR_TEMPLATES_DIR wins; otherwise ./templates (Docker images copy it next
+    to app.py), ../templates (running from backend/) and the repository root.
+    """
+    candidates = [
+        os.environ.get('OMR_TEMPLATES_DIR'),
+        os.path.join(os.getcwd(), 'templates'),
+        os.path.join(os.getcwd(), '..', 'templates'),
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'templates')
+    ]
+    for candidate in candidates:
+        if candidate and os.path.isdir(candidate):
+            return os.path.abspath(candidate)
+    return None
+
+
+class TemplateRegistry:
+    """Loads, validates and compiles every template once, then hot-reloads
+    
+    The directory is re-checked at most every `check_interval` seconds; only
+    files whose mtime or size changed are re-parsed. A file that becomes
+    invalid keeps serving its last good version.
+    """
+    
+    def __init__(self, templates_dir: Optional[str] = None, check_interval: float = 2.0):
+        self.templates_dir = templates_dir or find_templates_dir()
+        self.check_interval = check_interval
+        
+        self._templates: Dict[str, CompiledTemplate] = {}
+        self._signatures: Dict[str, tuple] = {}
+        self._last_check = 0.0
+        self._etag = None
+        self._listing = None
+        self._lock = threading.RLock()
+        
+        self.refresh(force=True)
+    
+    def get(self, name: str) -> Optional[CompiledTemplate]:
+        """Compiled template by name, or None"""
+        self.refresh()
+        return self._templates.get(name)
+    
+    def names(self) -> List[str]:
+        self.refresh()
+        return sorted(self._templates)
+    
+    def list(self) -> List[Dict]:
+        """Summaries of every template (name, display_name, questions, options)"""
+        self.refresh()
+        return [self._templates[name].summary() for name in sorted(self._templates)]
+    
+    @property
+    def etag(self) -> str:
+        self.refresh()
+        return self._etag
+    
+    def listing_json(self) -> bytes:
+        """Pre-encoded ``{"templates": [...]}`` body, rebuilt only on change"""
+        self.refresh()
+        with self._lock:
+            if self._listing is None:
+                self._listing = json.dumps({'templates': self.list()}).encode('utf-8')
+            return self._listing
+    
+    def refresh(self, force: bool = False) -> bool:
+        """Reload changed template files; returns True if anything changed"""
+        now = time.monotonic()
+        if not force and now - self._last_check < self.check_interval:
+            return False
+        
+        with self._lock:
+            if not force and now - self._last_check < self.check_interval:
+                return False
+            self._last_check = now
+            
+            if self.templates_dir is None or not os.path.isdir(self.templates_dir):
+                changed = not self._templates
+                if changed:
+                    self._templates = {name: CompiledTemplate(name, t) for name, t in BUILTIN_TEMPLATES.items()}
+                    self._update_etag()
+                return changed
+            
+            changed = False
+            seen = set()
+            
+            for entry in os.scandir(self.templates_dir):
+                if not entry.name.endswith('.json') or not entry.is_file():
+                    continue
+                
+                name = entry.name[:-len('.json')]
+                seen.add(name)
+                stat = entry.stat()
+                signature = (stat.st_mtime_ns, stat.st_size)
+                if self._signatures.get(name) == signature:
+                    continue
+                
+                self._signatures[name] = signature
+                try:
+                    with open(entry.path, 'r') as f:
+                        self._templates[name] = CompiledTemplate(name, json.load(f))
+                    changed = True
+                except (OSError, ValueError) as e:
+                    print(f"Error loading template {entry.name}: {e}")
+            
+            for name in set(self._signatures) - seen:
+                del self._signatures[name]
+                self._templates.pop(name, None)
+                changed = True
+            
+            if self._signatures:
+                # Drop builtin fallbacks once real template files exist
+                for name in set(self._templates) - set(self._signatures):
+                    del self._templates[name]
+                    changed = True
+            elif not self._templates:
+                self._templates = {name: CompiledTemplate(name, t) for name, t in BUILTIN_TEMPLATES.items()}
+                changed = True
+            
+            if changed or self._etag is None:
+                self._update_etag()
+            return changed
+    
+    def _update_etag(self):
+        digest = hashlib.sha1()
+        for name in sorted(self._templates):
+            digest.update(f"{name}:{self._templates[name].version};".encode('utf-8'))
+        self._etag = f'"{digest.hexdigest()[:16]}"'
+        self._listing = None
+
+
+# Entity tags in an If-None-Match list: "tag", W/"tag" or *
+_ETAG_LIST = re.compile(r'(?:W/)?"[^"]*"|\*')
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an If-None-Match header matches `etag`
+    
+    Each listed tag is compared exactly, ignoring W/ prefixes (the weak
+    comparison RFC 7232 prescribes for If-None-Match); * matches any tag.
+    """
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for tag in _ETAG_LIST.findall(if_none_match or ''):
+        if tag == '*' or (tag[2:] if tag.startswith('W/') else tag) == opaque:
+            return True
+    return False
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_template_registry() -> TemplateRegistry:
+    """Process-wide registry"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = TemplateRegistry()
+    return _registry
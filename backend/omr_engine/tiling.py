@@ -0,0 +1,142 @@
+"""
+Strip-based processing helpers for very high-resolution scans.
+
+A 600 dpi A3 scan is about 70 MB as 8-bit grayscale, and every full-frame
+filter allocates another image of that size. Neighbourhood filters only need
+`margin` rows of context around each output row, so they can be run on
+overlapping horizontal bands and written into a single output: the result is
+identical to the full-frame filter while the temporaries are bounded by the
+band height.
+
+`encoded_image_size` reads the dimensions from a PNG, JPEG, TIFF, BMP or
+PNM header without decoding, so the engine can pick a reduced decode before
+allocating anything.
+"""
+
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+
+# JPEG start-of-frame markers (SOF0-SOF15 without DHT, JPG and DAC)
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# TIFF ImageWidth / ImageLength tags and the byte size of their value types
+_TIFF_WIDTH = 256
+_TIFF_LENGTH = 257
+_TIFF_SHORT = 3
+_TIFF_LONG = 4
+
+
+def process_in_bands(image: np.ndarray, band_rows: int, margin: int,
+                     func: Callable[[np.ndarray], np.ndarray]) -> np.ndarray:
+    """
+    Apply a row-local filter to `image` one horizontal band at a time
+    
+    Args:
+        image: 2-D input image
+        band_rows: Output rows produced per band
+        margin: Rows of context the filter needs above and below each output
+            row (the sum of the kernel radii of every step in `func`)
+        func: Filter returning an image the same shape and dtype as its input
+    
+    Returns:
+        The filtered image, identical to func(image) for filters whose
+        borders are handled within `margin` rows of the image edge
+    """
+    height = image.shape[0]
+    if band_rows <= 0 or height <= band_rows + 2 * margin:
+        return func(image)
+    
+    output = np.empty_like(image)
+    for top in range(0, height, band_rows):
+        bottom = min(height, top + band_rows)
+        src_top = max(0, top - margin)
+        src_bottom = min(height, bottom + margin)
+        
+        band = func(image[src_top:src_bottom])
+        output[top:bottom] = band[top - src_top:bottom - src_top]
+    
+    return output
+
+
+def encoded_image_size(data) -> Optional[Tuple[int, int]]:
+    """(height, width) of an encoded PNG, JPEG, TIFF, BMP or PNM image, or None if unknown"""
+    view = memoryview(data).cast('B')
+    
+    if bytes(view[:8]) == b'\x89PNG\r\n\x1a\n' and len(view) >= 24:
+        width = int.from_bytes(view[16:20], 'big')
+        height = int.from_bytes(view[20:24], 'big')
+        return height, width
+    
+    if bytes(view[:4]) in (b'II*\x00', b'MM\x00*'):
+        return _tiff_size(view)
+    
+    if bytes(view[:2]) == b'BM' and len(view) >= 26:
+        if int.from_bytes(view[14:18], 'little') == 12:
+            # OS/2 BITMAPCOREHEADER: 16-bit dimensions
+            return int.from_bytes(view[20:22], 'little'), int.from_bytes(view[18:20], 'little')
+        width = int.from_bytes(view[18:22], 'little', signed=True)
+        height = int.from_bytes(view[22:26], 'little', signed=True)
+        return abs(height), abs(width)
+    
+    if len(view) >= 2 and view[0] == ord('P') and ord('1') <= view[1] <= ord('6'):
+        return _pnm_size(view)
+    
+    if bytes(view[:2]) != b'\xff\xd8':
+        return None
+    
+    pos = 2
+    while pos + 9 <= len(view):
+        if view[pos] != 0xFF:
+            return None
+        marker = view[pos + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            pos += 1
+            continue
+        if marker in _JPEG_SOF:
+            height = int.from_bytes(view[pos + 5:pos + 7], 'big')
+            width = int.from_bytes(view[pos + 7:pos + 9], 'big')
+            return height, width
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            # Standalone markers carry no length
+            pos += 2
+            continue
+        pos += 2 + int.from_bytes(view[pos + 2:pos + 4], 'big')
+    
+    return None
+
+
+def _tiff_size(view: memoryview) -> Optional[Tuple[int, int]]:
+    """Dimensions from the first IFD of a (classic, not Big-) TIFF"""
+    order = 'little' if view[0] == ord('I') else 'big'
+    ifd = int.from_bytes(view[4:8], order)
+    if ifd + 2 > len(view):
+        return None
+    
+    entries = int.from_bytes(view[ifd:ifd + 2], order)
+    size = {}
+    for pos in range(ifd + 2, min(ifd + 2 + 12 * entries, len(view) - 11), 12):
+        tag = int.from_bytes(view[pos:pos + 2], order)
+        kind = int.from_bytes(view[pos + 2:pos + 4], order)
+        if tag in (_TIFF_WIDTH, _TIFF_LENGTH) and kind in (_TIFF_SHORT, _TIFF_LONG):
+            width = 2 if kind == _TIFF_SHORT else 4
+            size[tag] = int.from_bytes(view[pos + 8:pos + 8 + width], order)
+    
+    if _TIFF_WIDTH not in size or _TIFF_LENGTH not in size:
+        return None
+    return size[_TIFF_LENGTH], size[_TIFF_WIDTH]
+
+
+def _pnm_size(view: memoryview) -> Optional[Tuple[int, int]]:
+    """Dimensions from a PBM/PGM/PPM header (whitespace-separated, # comments)"""
+    header = bytes(view[2:512])
+    tokens = []
+    for line in header.split(b'\n'):
+        tokens.extend(line.split(b'#', 1)[0].split())
+        if len(tokens) >= 2:
+            break
+    
+    if len(tokens) < 2 or not (tokens[0].isdigit() and tokens[1].isdigit()):
+        return None
+    return int(tokens[1]), int(tokens[0])
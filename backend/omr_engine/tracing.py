@@ -0,0 +1,316 @@
+"""
+Lightweight request tracing for the scan path.
+
+A request opens a trace with ``start_trace``; code below it (route handlers,
+OMREngine, the tiers) wraps its stages in ``span``. Spans nest through a
+context variable, so they follow the request across SheetPool threads and
+need no explicit parent argument. When a trace finishes, all of its spans
+are exported at once.
+
+Tracing is off unless a request is sampled. Outside a sampled trace
+``span`` returns a shared no-op context manager after a single context
+variable lookup, so instrumented code costs about half a microsecond per
+stage when tracing is disabled. A stage observer (``set_stage_observer``,
+used by the metrics endpoint) instead receives the duration of every stage
+of every request, sampled or not.
+
+Configuration (environment variables):
+    OMR_TRACE_SAMPLE_RATE  Fraction of requests traced, 0 (default) to 1
+    OMR_TRACE_EXPORTER     "log" (default): one JSON line per span on stderr;
+                           "otlp-file": one OTLP/JSON ExportTraceServiceRequest
+                           per trace appended to OMR_TRACE_FILE
+    OMR_TRACE_FILE         Path for the otlp-file exporter (default traces.jsonl)
+"""
+
+import contextvars
+import json
+import os
+import random
+import sys
+import threading
+import time
+import traceback
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+EXPORTERS = ('log', 'otlp-file')
+
+_current = contextvars.ContextVar('omr_trace_span', default=None)
+
+# Called with (stage name, seconds) for every finished span, if set
+_stage_observer = None
+
+
+class Span:
+    """One timed stage of a trace"""
+    
+    __slots__ = ('trace', 'name', 'span_id', 'parent_id', 'start_ns', 'end_ns', 'attributes', 'error')
+    
+    def __init__(self, trace: 'Trace', name: str, parent_id: Optional[str], attributes: Dict):
+        self.trace = trace
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.error = None
+    
+    def set(self, **attributes):
+        """Attach attributes (e.g. image size, tier, row count) to the span"""
+        self.attributes.update(attributes)
+    
+    def record_error(self, error: BaseException):
+        """Mark the span as failed with the exception's type, message and stack"""
+        self.error = {
+            'type': type(error).__name__,
+            'message': str(error),
+            'stacktrace': ''.join(traceback.format_exception(type(error), error, error.__traceback__))
+        }
+    
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+    
+    def to_dict(self) -> Dict:
+        data = {
+            'trace_id': self.trace.trace_id,
+            'request_id': self.trace.request_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': self.start_ns / 1e9,
+            'duration_ms': round(self.duration_ms, 3),
+            'attributes': self.attributes
+        }
+        if self.error:
+            data['error'] = self.error
+        return data
+
+
+class _NoopSpan:
+    """Returned when the current request is not traced"""
+    
+    __slots__ = ()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        return False
+    
+    def set(self, **attributes):
+        pass
+    
+    def record_error(self, error: BaseException):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    """All spans recorded for one request"""
+    
+    def __init__(self, request_id: str):
+        self.trace_id = uuid.uuid4().hex
+        self.request_id = request_id
+        self.spans: List[Span] = []
+
+
+class _SpanScope:
+    """Context manager making a span current for the code inside it"""
+    
+    __slots__ = ('span', 'token')
+    
+    def __init__(self, span: Span):
+        self.span = span
+        self.token = None
+    
+    def __enter__(self):
+        self.token = _current.set(self.span)
+        return self.span
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.span.end_ns = time.time_ns()
+        if exc is not None and self.span.error is None:
+            self.span.record_error(exc)
+        _current.reset(self.token)
+        if _stage_observer is not None and self.span.parent_id is not None:
+            _stage_observer(self.span.name, (self.span.end_ns - self.span.start_ns) / 1e9)
+        return False
+
+
+class _StageTimer:
+    """Times a stage for the stage observer outside a sampled trace"""
+    
+    __slots__ = ('name', 'started')
+    
+    def __init__(self, name: str):
+        self.name = name
+    
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return NOOP_SPAN
+    
+    def __exit__(self, *exc_info):
+        observer = _stage_observer
+        if observer is not None:
+            observer(self.name, time.perf_counter() - self.started)
+        return False
+
+
+def span(name: str, **attributes):
+    """Time a stage as a child of the current span; a no-op outside a sampled trace"""
+    parent = _current.get()
+    if parent is None:
+        return NOOP_SPAN if _stage_observer is None else _StageTimer(name)
+    
+    child = Span(parent.trace, name, parent.span_id, attributes)
+    parent.trace.spans.append(child)
+    return _SpanScope(child)
+
+
+def set_stage_observer(observer):
+    """Report (stage name, seconds) of every span to `observer`; None to stop"""
+    global _stage_observer
+    _stage_observer = observer
+
+
+def current_span():
+    """The innermost active span, or the no-op span"""
+    return _current.get() or NOOP_SPAN
+
+
+def record_error(error: BaseException):
+    """Attach an exception that is handled (e.g. turned into an error response) to the current span"""
+    current_span().record_error(error)
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+
+class Tracer:
+    """Sampling decision and export for root spans"""
+    
+    def __init__(self, sample_rate: float = 0.0, exporter: str = 'log', path: str = 'traces.jsonl'):
+        if exporter not in EXPORTERS:
+            raise ValueError(f"Unknown trace exporter: {exporter} (expected one of {', '.join(EXPORTERS)})")
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+        self.path = path
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_env(cls) -> 'Tracer':
+        return cls(
+            sample_rate=float(os.environ.get('OMR_TRACE_SAMPLE_RATE', 0)),
+            exporter=os.environ.get('OMR_TRACE_EXPORTER', 'log'),
+            path=os.environ.get('OMR_TRACE_FILE', 'traces.jsonl')
+        )
+    
+    @contextmanager
+    def start_trace(self, name: str, request_id: Optional[str] = None, sampled: Optional[bool] = None,
+                    **attributes):
+        """Open the root span of a request; yields the span (or the no-op span if not sampled)"""
+        if sampled is None:
+            sampled = self.sample_rate > 0 and (self.sample_rate >= 1 or random.random() < self.sample_rate)
+        if _current.get() is not None:
+            # Already inside a trace: nest as a normal span
+            with span(name, **attributes) as root:
+                yield root
+            return
+        if not sampled:
+            yield NOOP_SPAN
+            return
+        
+        trace = Trace(request_id or new_request_id())
+        root = Span(trace, name, None, attributes)
+        trace.spans.append(root)
+        try:
+            with _SpanScope(root):
+                yield root
+        finally:
+            self.export(trace)
+    
+    def export(self, trace: Trace):
+        try:
+            if self.exporter == 'log':
+                lines = [json.dumps(s.to_dict(), default=str) for s in trace.spans]
+                with self._lock:
+                    for line in lines:
+                        print(line, file=sys.stderr)
+                    sys.stderr.flush()
+            else:
+                line = json.dumps(_otlp_request(trace), default=str)
+                with self._lock, open(self.path, 'a') as f:
+                    f.write(line + '\n')
+        except Exception as e:
+            # Tracing must never fail a request
+            print(f"Error exporting trace {trace.trace_id}: {e}")
+
+
+def _otlp_value(value) -> Dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': value if isinstance(value, str) else json.dumps(value, default=str)}
+
+
+def _otlp_attributes(attributes: Dict) -> List[Dict]:
+    return [{'key': key, 'value': _otlp_value(value)} for key, value in attributes.items()]
+
+
+def _otlp_request(trace: Trace) -> Dict:
+    """OTLP/JSON ExportTraceServiceRequest holding every span of the trace"""
+    spans = []
+    for s in trace.spans:
+        otlp_span = {
+            'traceId': trace.trace_id,
+            'spanId': s.span_id,
+            'name': s.name,
+            'kind': 2 if s.parent_id is None else 1,  # SERVER for the root, INTERNAL below it
+            'startTimeUnixNano': str(s.start_ns),
+            'endTimeUnixNano': str(s.end_ns or s.start_ns),
+            'attributes': _otlp_attributes(dict(s.attributes, **{'omr.request_id': trace.request_id})),
+            'status': {'code': 2, 'message': s.error['message']} if s.error else {'code': 1}
+        }
+        if s.parent_id:
+            otlp_span['parentSpanId'] = s.parent_id
+        if s.error:
+            otlp_span['events'] = [{
+                'name': 'exception',
+                'timeUnixNano': str(s.end_ns or s.start_ns),
+                'attributes': _otlp_attributes({
+                    'exception.type': s.error['type'],
+                    'exception.message': s.error['message'],
+                    'exception.stacktrace': s.error['stacktrace']
+                })
+            }]
+        spans.append(otlp_span)
+    
+    return {
+        'resourceSpans': [{
+            'resource': {'attributes': _otlp_attributes({'service.name': 'omr-scanner'})},
+            'scopeSpans': [{'scope': {'name': 'omr_engine.tracing'}, 'spans': spans}]
+        }]
+    }
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    """Process-wide tracer configured from the environment"""
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                _tracer = Tracer.from_env()
+    return _tracer
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Accuracy-and-speed regression corpus for the OMR engine.
+
+Renders synthetic sheets for every readable template with known answers
+(and field values) with the SheetRenderer of samples/generate_sheets.py
+(the load-test generator), applies controlled distortions, grades them with OMREngine and
+reports detection accuracy next to per-sheet processing time, so an
+optimization of the tiers can be checked for accuracy loss in the same run
+that shows its speed-up.
+
+Distortions:
+    clean         the sheet as rendered
+    rotation      rotated 1-4 degrees
+    perspective   corners moved by 1-3% of the sheet (photo taken at an angle)
+    blur          Gaussian blur, sigma 1-2.5
+    jpeg          JPEG at quality 20-40
+    light_pencil  marks in light, streaky graphite instead of dark ink
+    erasure       a faint smudge left on a second option of some questions
+
+About 5% of questions are left blank. The corpus is generated from a seed
+into a cache directory with a manifest.json holding the ground truth, and
+is reused until the seed, size or CORPUS_VERSION changes.
+
+Templates whose answer bubbles overlap are left out by default. The answer
+grid spans a fixed share of the sheet height, so above 35 questions
+(extended, large) rows sit closer than a bubble is tall and no tier can
+read them; their accuracy would only measure the layout. They can still be
+selected with --templates.
+
+Field values (roll number, booklet code) are checked on their own: a sheet
+whose answers all read correctly but whose fields do not points at field
+decoding rather than sheet detection, and always fails the run.
+
+Usage:
+    python regression.py                               # every readable template and distortion
+    python regression.py --templates default,short --sheets 3 --mode accurate
+    python regression.py --save baseline.json          # record a baseline
+    python regression.py --baseline baseline.json      # exit 1 on accuracy loss
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+import cv2
+import numpy as np
+
+from omr_engine import OMREngine, get_template_registry
+
+# Bump when rendering or distortions change so cached corpora are rebuilt
+CORPUS_VERSION = 2
+
+DISTORTIONS = ('clean', 'rotation', 'perspective', 'blur', 'jpeg', 'light_pencil', 'erasure')
+DEFAULT_CORPUS_DIR = os.path.join(tempfile.gettempdir(), 'omr_regression_corpus')
+GENERATOR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'samples', 'generate_sheets.py')
+
+BLANK_RATE = 0.05
+ERASURE_RATE = 0.2
+
+# Accuracy drop (percentage points) tolerated against a baseline
+DEFAULT_TOLERANCE = 0.5
+
+
+def load_generator():
+    """samples/generate_sheets.py, whose SheetRenderer draws the corpus"""
+    spec = importlib.util.spec_from_file_location('generate_sheets', GENERATOR_PATH)
+    generator = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(generator)
+    return generator
+
+
+def distort(draw: Dict, distortion: str, rng: np.random.Generator) -> Dict:
+    """Set the geometric distortion or blur of a renderer draw; returns its parameters"""
+    params = {}
+    
+    if distortion == 'rotation':
+        draw['angle'] = float(rng.uniform(1, 4) * rng.choice([-1, 1]))
+        params['angle'] = round(draw['angle'], 2)
+    elif distortion == 'perspective':
+        amount = float(rng.uniform(0.01, 0.03))
+        draw['corner_shift'] = rng.uniform(-amount, amount, (4, 2))
+        params['corner_shift'] = round(amount, 4)
+    elif distortion == 'blur':
+        draw['blur'] = float(rng.uniform(1.0, 2.5))
+        params['sigma'] = round(draw['blur'], 2)
+    return params
+
+
+def encode(image: np.ndarray, distortion: str, rng: np.random.Generator, params: Dict) -> Tuple[bytes, str]:
+    """PNG, or JPEG at quality 20-40 for the jpeg distortion"""
+    if distortion == 'jpeg':
+        params['quality'] = int(rng.integers(20, 41))
+        ok, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, params['quality']])
+        return encoded.tobytes(), '.jpg'
+    
+    ok, encoded = cv2.imencode('.png', image)
+    return encoded.tobytes(), '.png'
+
+
+def generate_corpus(corpus_dir: str, templates: List[str], distortions: List[str], sheets: int,
+                    seed: int) -> Dict:
+    """Render sheets x distortions for every template; returns the manifest"""
+    generator = load_generator()
+    manifest = {'version': CORPUS_VERSION, 'seed': seed, 'sheets_per_case': sheets,
+                'templates': templates, 'distortions': distortions, 'sheets': []}
+    
+    for name in templates:
+        renderer = generator.SheetRenderer(name)  # ValueError for an unknown template
+        os.makedirs(os.path.join(corpus_dir, name), exist_ok=True)
+        
+        for distortion in distortions:
+            for index in range(sheets):
+                # One stream per sheet, keyed by names: selecting other templates or
+                # distortions leaves these sheets unchanged
+                rng = np.random.default_rng([seed, zlib.crc32(name.encode()), zlib.crc32(distortion.encode()), index])
+                draw = renderer.draw(index, seed, BLANK_RATE, rotation=0, perspective=0, noise=0, blur=0,
+                                     pencil=distortion == 'light_pencil',
+                                     erasure_rate=ERASURE_RATE if distortion == 'erasure' else 0.0, rng=rng)
+                params = distort(draw, distortion, rng)
+                data, ext = encode(renderer.render_batch([draw])[0], distortion, rng, params)
+                truth = renderer.ground_truth(draw)
+                
+                filename = os.path.join(name, f"{distortion}_{index:03d}{ext}")
+                with open(os.path.join(corpus_dir, filename), 'wb') as f:
+                    f.write(data)
+                if 'erased_questions' in truth:
+                    params['erased_questions'] = truth['erased_questions']
+                manifest['sheets'].append({
+                    'file': filename, 'template': name, 'distortion': distortion,
+                    'answers': truth['answers'], 'fields': truth['fields'], 'params': params
+                })
+    
+    with open(os.path.join(corpus_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+def load_corpus(corpus_dir: str, templates: List[str], distortions: List[str], sheets: int, seed: int,
+                regenerate: bool = False) -> Dict:
+    """The cached corpus if it matches the request, else a freshly generated one"""
+    path = os.path.join(corpus_dir, 'manifest.json')
+    if not regenerate and os.path.exists(path):
+        with open(path) as f:
+            manifest = json.load(f)
+        if (manifest.get('version') == CORPUS_VERSION and manifest.get('seed') == seed
+                and manifest.get('sheets_per_case') == sheets
+                and sorted(manifest.get('templates', [])) == sorted(templates)
+                and sorted(manifest.get('distortions', [])) == sorted(distortions)):
+            return manifest
+    
+    print(f"Generating {len(templates) * len(distortions) * sheets} sheet(s) in {corpus_dir}")
+    return generate_corpus(corpus_dir, templates, distortions, sheets, seed)
+
+
+def readable_templates(registry) -> List[str]:
+    """Templates whose answer bubbles do not overlap on the sheet"""
+    names = []
+    for name in registry.names():
+        boxes = registry.get(name).bubble_boxes
+        if len(boxes) < 2 or float(np.diff(boxes[:, 0, 1]).min()) >= float(boxes[:, :, 3].max()):
+            names.append(name)
+    return names
+
+
+def grade_corpus(engine: OMREngine, manifest: Dict, corpus_dir: str) -> List[Dict]:
+    """Grade every sheet; one record per sheet with correctness and time"""
+    registry = get_template_registry()
+    records = []
+    
+    for index, sheet in enumerate(manifest['sheets']):
+        template = registry.get(sheet['template'])
+        with open(os.path.join(corpus_dir, sheet['file']), 'rb') as f:
+            data = f.read()
+        
+        if index == 0:
+            # Warm-up: first calls allocate OpenCV buffers and thread pools
+            engine.process_bytes(data, template)
+        
+        started = time.perf_counter()
+        result = engine.process_bytes(data, template)
+        seconds = time.perf_counter() - started
+        
+        truth = sheet['answers']
+        detected = (result.get('answers') or []) if result['success'] else []
+        correct = sum(1 for expected, found in zip(truth, detected) if expected == found)
+        
+        field_total = sum(len(value) for value in sheet['fields'].values())
+        field_correct = 0
+        for name, value in sheet['fields'].items():
+            found = (result.get('fields') or {}).get(name, '') if result['success'] else ''
+            field_correct += sum(1 for expected, got in zip(value, found) if expected == got)
+        
+        records.append({
+            'file': sheet['file'],
+            'template': sheet['template'],
+            'distortion': sheet['distortion'],
+            'success': result['success'],
+            'error': result.get('error'),
+            'tier': result.get('tier'),
+            'questions': len(truth),
+            'correct': correct,
+            'field_marks': field_total,
+            'field_correct': field_correct,
+            'fields_misread': correct == len(truth) and field_correct < field_total,
+            'ms': round(seconds * 1000, 2)
+        })
+    return records
+
+
+def summarize(records: List[Dict]) -> Dict:
+    """Accuracy and timing of a group of sheets (failed sheets count as all wrong)"""
+    questions = sum(r['questions'] for r in records)
+    field_marks = sum(r['field_marks'] for r in records)
+    latency_ms = np.array([r['ms'] for r in records])
+    summary = {
+        'sheets': len(records),
+        'failures': sum(1 for r in records if not r['success']),
+        'accuracy': round(100.0 * sum(r['correct'] for r in records) / questions, 2) if questions else None,
+        'sheet_accuracy': round(100.0 * sum(1 for r in records if r['success'] and r['correct'] == r['questions'])
+                                / len(records), 2),
+        'p50_ms': round(float(np.percentile(latency_ms, 50)), 1),
+        'p95_ms': round(float(np.percentile(latency_ms, 95)), 1),
+        'mean_ms': round(float(latency_ms.mean()), 1)
+    }
+    if field_marks:
+        summary['field_accuracy'] = round(100.0 * sum(r['field_correct'] for r in records) / field_marks, 2)
+        summary['field_errors'] = sum(1 for r in records if r['fields_misread'])
+    return summary
+
+
+def build_report(records: List[Dict], manifest: Dict, mode: str, quality: str) -> Dict:
+    groups = {}
+    for record in records:
+        groups.setdefault(f"{record['template']}/{record['distortion']}", []).append(record)
+    
+    return {
+        'engine': {'mode': mode, 'quality_gate': quality},
+        'corpus': {'version': manifest['version'], 'seed': manifest['seed'],
+                   'sheets_per_case': manifest['sheets_per_case']},
+        'overall': summarize(records),
+        'by_template': {name: summarize([r for r in records if r['template'] == name])
+                        for name in manifest['templates']},
+        'by_distortion': {name: summarize([r for r in records if r['distortion'] == name])
+                          for name in manifest['distortions']},
+        'by_case': {key: summarize(group) for key, group in groups.items()},
+        'sheets': records
+    }
+
+
+def compare(report: Dict, baseline: Dict, tolerance: float, max_slowdown: Optional[float]) -> List[str]:
+    """Regressions of `report` against `baseline`: accuracy drops, new failures, slowdowns"""
+    regressions = []
+    current = dict(report['by_case'], overall=report['overall'])
+    previous = dict(baseline.get('by_case', {}), overall=baseline.get('overall', {}))
+    
+    for key, before in previous.items():
+        after = current.get(key)
+        if after is None:
+            continue
+        for metric in ('accuracy', 'field_accuracy'):
+            if before.get(metric) is not None and after.get(metric) is not None:
+                drop = before[metric] - after[metric]
+                if drop > tolerance:
+                    regressions.append(f"{key}: {metric} {before[metric]}% -> {after[metric]}% ({-drop:+.2f})")
+        if after['failures'] > before.get('failures', 0):
+            regressions.append(f"{key}: failures {before.get('failures', 0)} -> {after['failures']}")
+    
+    if max_slowdown and previous['overall'].get('p50_ms'):
+        ratio = report['overall']['p50_ms'] / previous['overall']['p50_ms']
+        if ratio > max_slowdown:
+            regressions.append(f"overall: p50 {previous['overall']['p50_ms']} ms -> "
+                               f"{report['overall']['p50_ms']} ms (x{ratio:.2f})")
+    return regressions
+
+
+def print_table(title: str, rows: Dict[str, Dict], baseline_rows: Optional[Dict] = None):
+    print(f"\n{title:<16} {'sheets':>6} {'failed':>6} {'accuracy':>9} {'sheets ok':>9} "
+          f"{'p50 ms':>8} {'p95 ms':>8}{'  vs baseline' if baseline_rows else ''}")
+    for name, s in rows.items():
+        accuracy = '-' if s['accuracy'] is None else f"{s['accuracy']:.2f}%"
+        line = (f"{name:<16} {s['sheets']:>6} {s['failures']:>6} {accuracy:>9} "
+                f"{s['sheet_accuracy']:>8.1f}% {s['p50_ms']:>8} {s['p95_ms']:>8}")
+        before = (baseline_rows or {}).get(name)
+        if before and before.get('accuracy') is not None and s['accuracy'] is not None:
+            line += f"  {s['accuracy'] - before['accuracy']:+.2f} pts, p50 {s['p50_ms'] - before['p50_ms']:+.1f} ms"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Grade the synthetic regression corpus: accuracy and time')
+    parser.add_argument('--templates', default='',
+                        help='Comma-separated templates (default: all whose bubbles do not overlap)')
+    parser.add_argument('--distortions', default=','.join(DISTORTIONS),
+                        help=f"Comma-separated distortions (default: {','.join(DISTORTIONS)})")
+    parser.add_argument('--sheets', type=int, default=5, help='Sheets per template and distortion (default: 5)')
+    parser.add_argument('--seed', type=int, default=7, help='Corpus seed (default: 7)')
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS_DIR, help='Corpus cache directory')
+    parser.add_argument('--regenerate', action='store_true', help='Rebuild the corpus even if cached')
+    parser.add_argument('--mode', default='auto', help='Engine mode: fast, accurate or auto')
+    parser.add_argument('--quality', default='flag',
+                        help='Quality gate: flag (default; grade every sheet), reject or off')
+    parser.add_argument('--save', help='Write the full report (baseline format) to this JSON file')
+    parser.add_argument('--baseline', help='Compare against a saved report; exit 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help=f'Accuracy drop in percentage points allowed per case (default: {DEFAULT_TOLERANCE})')
+    parser.add_argument('--max-slowdown', type=float, default=None,
+                        help='Also fail if overall p50 time exceeds the baseline by this factor (e.g. 1.2)')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+    
+    registry = get_template_registry()
+    templates = [t for t in args.templates.split(',') if t] or readable_templates(registry)
+    distortions = [d for d in args.distortions.split(',') if d]
+    unknown = [d for d in distortions if d not in DISTORTIONS]
+    if unknown:
+        print(f"Unknown distortion(s): {', '.join(unknown)}")
+        sys.exit(1)
+    
+    try:
+        manifest = load_corpus(args.corpus, templates, distortions, args.sheets, args.seed, args.regenerate)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    
+    engine = OMREngine(mode=args.mode, quality_mode=args.quality)
+    records = grade_corpus(engine, manifest, args.corpus)
+    report = build_report(records, manifest, args.mode, args.quality)
+    
+    baseline = None
+    regressions = [f"{r['file']}: fields misread although every answer is correct"
+                   for r in records if r['fields_misread']]
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions += compare(report, baseline, args.tolerance, args.max_slowdown)
+    report['regressions'] = regressions
+    
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+    
+    if args.json:
+        print(json.dumps({k: v for k, v in report.items() if k != 'sheets'}, indent=2))
+    else:
+        overall = report['overall']
+        print(f"{overall['sheets']} sheets, mode {args.mode}: accuracy {overall['accuracy']}%, "
+              f"{overall['failures']} failed, p50 {overall['p50_ms']} ms, p95 {overall['p95_ms']} ms"
+              + (f", fields {overall['field_accuracy']}%" if 'field_accuracy' in overall else ''))
+        print_table('template', report['by_template'], baseline and baseline.get('by_template'))
+        print_table('distortion', report['by_distortion'], baseline and baseline.get('by_distortion'))
+        if baseline is not None or regressions:
+            print(f"\n{len(regressions)} regression(s)" + (f" against {args.baseline}" if baseline else ''))
+            for regression in regressions:
+                print(f"  {regression}")
+    
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
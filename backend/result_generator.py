@@ -1,20 +1,26 @@
+import csv
 import json
 import os
-import pandas as pd
 from datetime import datetime
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib import colors
-from reportlab.lib.units import inch
+
+# pandas and ReportLab are heavy to import, so each export back-end pulls in
+# its own dependencies on first use instead of at module load. Workers that
+# only ever serve /api/scan never pay for them.
 
 class ResultGenerator:
     """Generate export files for OMR scan results"""
     
-    def __init__(self):
+    def __init__(self, artifact_store=None):
         self.results_folder = 'results'
+        self.artifact_store = artifact_store
         os.makedirs(self.results_folder, exist_ok=True)
     
+    def _output_path(self, group, filename):
+        """Where to write an export; managed by the artifact store when one is set"""
+        if self.artifact_store is not None:
+            return self.artifact_store.path_for(group, filename)
+        return os.path.join(self.results_folder, filename)
+    
     def generate_export(self, scan_data, format_type):
         """Generate export file in specified format"""
         try:
@@ -36,11 +42,102 @@ class ResultGenerator:
             print(f"Error generating export: {str(e)}")
             return None
     
+    def generate_bulk_export(self, scans, format_type, include_fill_ratios=False):
+        """
+        Write many scans as one columnar file (Parquet or Arrow IPC)
+        
+        Args:
+            scans: Rows of (id, filename, template_name, answers_json, score,
+                   total_questions, timestamp, fill_ratios_json, roll_number,
+                   booklet_code)
+            format_type: 'parquet' or 'arrow'
+            include_fill_ratios: Add the per-bubble fill ratio matrix column
+            
+        Returns:
+            Path to the generated file, or None on failure
+        """
+        try:
+            format_type = format_type.lower()
+            if format_type not in ('parquet', 'arrow'):
+                raise ValueError(f"Unsupported bulk format: {format_type}")
+            
+            table = self._build_scans_table(scans, include_fill_ratios)
+            base_filename = f"omr_results_bulk_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            
+            if format_type == 'parquet':
+                import pyarrow.parquet as pq
+                
+                path = self._output_path('bulk', f"{base_filename}.parquet")
+                pq.write_table(table, path, compression='zstd')
+            else:
+                import pyarrow as pa
+                
+                path = self._output_path('bulk', f"{base_filename}.arrow")
+                with pa.OSFile(path, 'wb') as sink:
+                    with pa.ipc.new_file(sink, table.schema) as writer:
+                        writer.write_table(table)
+            
+            return path
+            
+        except Exception as e:
+            print(f"Error generating bulk export: {str(e)}")
+            return None
+    
+    def _build_scans_table(self, scans, include_fill_ratios):
+        """Build a typed Arrow table with one row per scan and one column per question"""
+        import pyarrow as pa
+        
+        scan_ids, filenames, templates, scores, totals, timestamps = [], [], [], [], [], []
+        roll_numbers, booklet_codes = [], []
+        answers_rows, ratio_rows = [], []
+        
+        for (scan_id, filename, template_name, answers_json, score, total_questions, timestamp,
+             fill_ratios_json, roll_number, booklet_code) in scans:
+            scan_ids.append(scan_id)
+            filenames.append(filename)
+            templates.append(template_name)
+            scores.append(score)
+            totals.append(total_questions)
+            roll_numbers.append(roll_number)
+            booklet_codes.append(booklet_code)
+            timestamps.append(datetime.fromisoformat(timestamp) if isinstance(timestamp, str) else timestamp)
+            answers_rows.append(json.loads(answers_json))
+            ratio_rows.append(json.loads(fill_ratios_json) if fill_ratios_json else None)
+        
+        columns = {
+            'scan_id': pa.array(scan_ids, type=pa.int64()),
+            'filename': pa.array(filenames, type=pa.string()),
+            'template': pa.array(templates, type=pa.string()).dictionary_encode(),
+            'timestamp': pa.array(timestamps, type=pa.timestamp('s')),
+            'score': pa.array(scores, type=pa.int32()),
+            'total_questions': pa.array(totals, type=pa.int32()),
+            'roll_number': pa.array(roll_numbers, type=pa.string()),
+            'booklet_code': pa.array(booklet_codes, type=pa.string()).dictionary_encode(),
+        }
+        
+        # One dictionary-encoded column per question; shorter templates are null-padded
+        num_questions = max((len(answers) for answers in answers_rows), default=0)
+        width = len(str(num_questions))
+        for q in range(num_questions):
+            values = [answers[q] if q < len(answers) else None for answers in answers_rows]
+            columns[f"q{q + 1:0{width}d}"] = pa.array(values, type=pa.string()).dictionary_encode()
+        
+        if include_fill_ratios:
+            columns['fill_ratios'] = pa.array(ratio_rows, type=pa.list_(pa.list_(pa.float32())))
+        
+        return pa.table(columns)
+    
     def _generate_pdf(self, base_filename, scan_data, answers):
         """Generate PDF report"""
+        from reportlab.lib.pagesizes import letter
+        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        from reportlab.lib import colors
+        from reportlab.lib.units import inch
+        
         scan_id, filename, template_name, answers_json, score, total_questions, timestamp = scan_data
         
-        pdf_path = os.path.join(self.results_folder, f"{base_filename}.pdf")
+        pdf_path = self._output_path(f"scan_{scan_id}", f"{base_filename}.pdf")
         doc = SimpleDocTemplate(pdf_path, pagesize=letter)
         
         # Styles
@@ -116,9 +213,11 @@ class ResultGenerator:
     
     def _generate_excel(self, base_filename, scan_data, answers):
         """Generate Excel report"""
+        import pandas as pd
+        
         scan_id, filename, template_name, answers_json, score, total_questions, timestamp = scan_data
         
-        excel_path = os.path.join(self.results_folder, f"{base_filename}.xlsx")
+        excel_path = self._output_path(f"scan_{scan_id}", f"{base_filename}.xlsx")
         
         # Create summary data
         summary_df = pd.DataFrame({
@@ -146,7 +245,7 @@ class ResultGenerator:
         """Generate CSV report"""
         scan_id, filename, template_name, answers_json, score, total_questions, timestamp = scan_data
         
-        csv_path = os.path.join(self.results_folder, f"{base_filename}.csv")
+        csv_path = self._output_path(f"scan_{scan_id}", f"{base_filename}.csv")
         
         # Create comprehensive data
         data = []
@@ -165,8 +264,8 @@ class ResultGenerator:
                 display_answer = 'Multiple Answers'
             data.append([f"Q{i}", display_answer])
         
-        # Write to CSV
-        df = pd.DataFrame(data)
-        df.to_csv(csv_path, index=False, header=False)
+        # Write to CSV (plain csv module; no need to load pandas for this)
+        with open(csv_path, 'w', newline='') as f:
+            csv.writer(f).writerows(data)
         
         return csv_path
\ No newline at end of file
@@ -0,0 +1,330 @@
+"""
+Shared-memory image transport for grading sheets in worker processes.
+
+Handing images to a process pool through its pipes pickles each one in the
+parent and unpickles it in the worker, copying every byte through the pipe.
+Here the parent copies each image once into a segment of a recycled pool of ``multiprocessing.shared_memory`` blocks and
+sends the worker only a small ImageDescriptor (segment name, size, shape,
+dtype); the worker maps the segment and runs the engine on a zero-copy view.
+Results are small dicts and travel back the usual way.
+
+Lifetime:
+    * The parent creates, owns and unlinks every segment. A segment returns
+      to the free list when its future completes, whether the worker
+      succeeded, raised or died, so a crashed worker never leaks one.
+    * A pool whose worker died is replaced on the next submit.
+    * Segment names carry the parent's pid; segments left behind by a parent
+      that was killed are unlinked by cleanup_stale_segments(), which every
+      new pool runs first.
+
+Usage:
+    with ProcessSheetPool(workers=4) as pool:
+        results = pool.map(encoded_images, 'default')
+
+backend/app.py grades /api/scan uploads through a pool when OMR_PROCESS_POOL=1
+(pool.process_bytes has the OMREngine.process_bytes signature).
+
+Templates may be given by registry name (resolved in the worker, nothing to
+pickle) or as a template dict / CompiledTemplate.
+
+Workers are started by a forkserver (spawn where that is unavailable), never
+forked from the caller: the web process is multithreaded (request threads,
+the janitor, OpenCV's pool) and a forked child could inherit a lock another
+thread was holding and deadlock on it. As with spawn, each worker imports the
+caller's main module first, so scripts must keep their work under
+``if __name__ == '__main__'``.
+"""
+
+import atexit
+import multiprocessing
+import os
+import queue
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+SEGMENT_PREFIX = 'omr_shm_'
+SHM_DIR = '/dev/shm'
+# Worker start method; see the module docstring
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+class ImageDescriptor(NamedTuple):
+    """What a worker needs to find an image in shared memory"""
+    segment: str
+    nbytes: int
+    shape: Optional[Tuple[int, ...]]  # None: encoded bytes to decode
+    dtype: str = 'uint8'
+
+
+class SegmentPool:
+    """Fixed set of equally sized shared-memory segments, recycled between images
+    
+    acquire() blocks while every segment is in use, which bounds both memory
+    and the number of images in flight. Images larger than `segment_size`
+    get a one-off segment that is unlinked on release.
+    """
+    
+    def __init__(self, segment_size: int, count: int):
+        self.segment_size = segment_size
+        self._prefix = f"{SEGMENT_PREFIX}{os.getpid()}_{uuid.uuid4().hex[:8]}_"
+        self._segments = {}
+        self._free = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        
+        for index in range(count):
+            segment = shared_memory.SharedMemory(name=f"{self._prefix}{index}", create=True, size=segment_size)
+            self._segments[segment.name] = segment
+            self._free.put(segment)
+        
+        # Unlink even if the owner forgets to close the pool
+        atexit.register(self.close)
+    
+    def acquire(self, nbytes: int, timeout: Optional[float] = None) -> shared_memory.SharedMemory:
+        if nbytes > self.segment_size:
+            segment = shared_memory.SharedMemory(name=f"{self._prefix}x{uuid.uuid4().hex[:8]}",
+                                                 create=True, size=nbytes)
+            with self._lock:
+                self._segments[segment.name] = segment
+            return segment
+        return self._free.get(timeout=timeout)
+    
+    def release(self, segment: shared_memory.SharedMemory):
+        if segment.size > self.segment_size or self._closed:
+            with self._lock:
+                self._segments.pop(segment.name, None)
+            _unlink(segment)
+            return
+        self._free.put(segment)
+    
+    def close(self):
+        """Unlink every segment; views handed out earlier must be gone"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            segments = list(self._segments.values())
+            self._segments.clear()
+        
+        for segment in segments:
+            _unlink(segment)
+        atexit.unregister(self.close)
+
+
+def _unlink(segment: shared_memory.SharedMemory):
+    try:
+        segment.close()
+    except BufferError:
+        pass  # A view is still alive in this process; unlinking is still safe
+    try:
+        segment.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def cleanup_stale_segments() -> int:
+    """Unlink segments left by processes that no longer exist; returns how many"""
+    if not os.path.isdir(SHM_DIR):
+        return 0  # Only POSIX systems expose shared memory as files
+    
+    removed = 0
+    for name in os.listdir(SHM_DIR):
+        if not name.startswith(SEGMENT_PREFIX):
+            continue
+        pid = name[len(SEGMENT_PREFIX):].split('_', 1)[0]
+        if not pid.isdigit() or _pid_alive(int(pid)):
+            continue
+        try:
+            os.unlink(os.path.join(SHM_DIR, name))
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# Worker process state
+
+_worker_engine = None
+_worker_segments = {}
+
+
+def _init_worker(engine_options: Dict, opencv_threads: int):
+    global _worker_engine
+    import cv2
+    from omr_engine import OMREngine
+    
+    cv2.setNumThreads(opencv_threads)
+    _worker_engine = OMREngine(**engine_options)
+
+
+def _grade(descriptor: ImageDescriptor, template, mode: Optional[str],
+           image_path: Optional[str] = None) -> Dict:
+    """Run the engine on a zero-copy view of one shared segment"""
+    if isinstance(template, str):
+        from omr_engine import get_template_registry
+        name, template = template, get_template_registry().get(template)
+        if template is None:
+            return {'success': False, 'error': f'Template {name} not found'}
+    
+    # Pool segments are recycled, so each worker maps them once and keeps them
+    pooled = descriptor.segment.rsplit('_', 1)[-1].isdigit()
+    segment = _worker_segments.get(descriptor.segment)
+    if segment is None:
+        segment = shared_memory.SharedMemory(name=descriptor.segment)
+        if pooled:
+            _worker_segments[descriptor.segment] = segment
+    
+    buffer = segment.buf[:descriptor.nbytes]
+    try:
+        if descriptor.shape is None:
+            return _worker_engine.process_bytes(buffer, template, image_path, mode=mode)
+        
+        image = np.ndarray(descriptor.shape, dtype=descriptor.dtype, buffer=buffer)
+        try:
+            return _worker_engine.process_array(image, template, image_path, mode=mode)
+        finally:
+            del image
+    finally:
+        buffer.release()
+        if not pooled:
+            segment.close()
+
+
+class ProcessSheetPool:
+    """Grade sheets in worker processes, passing images through shared memory
+    
+    Args:
+        workers: Worker processes (default: OMR_WORKERS / the concurrency policy)
+        opencv_threads: OpenCV threads per worker (default: the concurrency policy)
+        segment_size: Bytes per shared segment (default OMR_SHM_SEGMENT_MB, 32 MiB)
+        segments: Segments in the pool, i.e. images in flight at most
+            (default: two per worker)
+        **engine_options: Passed to OMREngine in every worker (mode, quality_mode, ...)
+    """
+    
+    def __init__(self, workers: Optional[int] = None, opencv_threads: Optional[int] = None,
+                 segment_size: Optional[int] = None, segments: Optional[int] = None, **engine_options):
+        from concurrency import get_concurrency_config
+        config = get_concurrency_config()
+        
+        self.workers = workers or config.workers
+        self.opencv_threads = opencv_threads or config.opencv_threads
+        self.engine_options = engine_options
+        if segment_size is None:
+            segment_size = int(float(os.environ.get('OMR_SHM_SEGMENT_MB', 32)) * 1024 * 1024)
+        
+        removed = cleanup_stale_segments()
+        if removed:
+            print(f"Removed {removed} shared memory segment(s) left by a dead process")
+        
+        self.segments = SegmentPool(segment_size, segments or 2 * self.workers)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self.restarts = 0
+    
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, initializer=_init_worker,
+                    initargs=(self.engine_options, self.opencv_threads),
+                    mp_context=multiprocessing.get_context(START_METHOD)
+                )
+            return self._executor
+    
+    def _replace_broken(self, executor: ProcessPoolExecutor):
+        """A worker died: start a fresh pool for the next submissions"""
+        with self._executor_lock:
+            if self._executor is executor:
+                self._executor = None
+                self.restarts += 1
+        executor.shutdown(wait=False)
+    
+    def submit(self, image, template, mode: Optional[str] = None, image_path: Optional[str] = None):
+        """Queue one image (encoded bytes or decoded ndarray); returns a Future
+        
+        Blocks while every shared segment is in flight. The worker saves the
+        processed image next to `image_path` when given.
+        """
+        if isinstance(image, np.ndarray) and image.dtype == np.uint8 and image.ndim == 1:
+            image = memoryview(image)  # Encoded bytes read with np.fromfile
+        
+        if isinstance(image, np.ndarray):
+            source = np.ascontiguousarray(image)
+            shape, dtype = source.shape, source.dtype.str
+            data = memoryview(source).cast('B')
+        else:
+            data = memoryview(image).cast('B')
+            shape, dtype = None, 'uint8'
+        
+        segment = self.segments.acquire(data.nbytes)
+        try:
+            segment.buf[:data.nbytes] = data
+            descriptor = ImageDescriptor(segment.name, data.nbytes, shape, dtype)
+            
+            executor = self._get_executor()
+            try:
+                future = executor.submit(_grade, descriptor, template, mode, image_path)
+            except BrokenProcessPool:
+                self._replace_broken(executor)
+                executor = self._get_executor()
+                future = executor.submit(_grade, descriptor, template, mode, image_path)
+        except BaseException:
+            self.segments.release(segment)
+            raise
+        
+        def done(finished):
+            # Runs on success, error and worker crash alike
+            self.segments.release(segment)
+            if not finished.cancelled() and isinstance(finished.exception(), BrokenProcessPool):
+                self._replace_broken(executor)
+        
+        future.add_done_callback(done)
+        return future
+    
+    def map(self, images: Iterable, template, mode: Optional[str] = None) -> List[Dict]:
+        """Grade images concurrently; results in input order"""
+        futures = [self.submit(image, template, mode) for image in images]
+        return [self._result(future) for future in futures]
+    
+    def process_bytes(self, data, template, image_path: Optional[str] = None,
+                      mode: Optional[str] = None) -> Dict:
+        """Grade one encoded image in a worker and wait for it (as OMREngine.process_bytes)"""
+        return self._result(self.submit(data, template, mode, image_path))
+    
+    @staticmethod
+    def _result(future) -> Dict:
+        """A sheet whose worker died is reported as a failed result"""
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            return {'success': False, 'error': 'Grading worker terminated unexpectedly'}
+    
+    def close(self):
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        self.segments.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
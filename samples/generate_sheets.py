@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""
+High-volume synthetic OMR sheet generator.
+
+sample-omr-generator.py draws every bubble and label with PIL calls in
+Python loops, one sheet at a time. This generator instead renders each
+template once into a base image (outlines, title, question numbers) and
+produces sheets in batches:
+
+    * marks are stamped into a whole batch with one fancy-indexing
+      assignment, using the pixel offsets of a precomputed filled bubble
+      (every bubble of a compiled template has the same size)
+    * rotation and perspective are combined into one homography per sheet;
+      exposure is a 256-entry lookup table and sensor noise a window of one
+      pre-drawn noise field, both applied in place without float copies
+    * chunks of sheets are rendered, encoded and written by worker processes
+
+Every random choice for sheet N comes from a generator seeded with
+(seed, N), so output is identical for any number of workers or batch size.
+Ground truth (answers, field values, distortion parameters) is written to
+answers.jsonl, one line per sheet.
+
+SheetRenderer is also what backend/regression.py builds its ground-truth
+corpus with (including the light pencil and erasure marks), so load-test
+and regression sheets share one rendering model.
+
+Usage:
+    python samples/generate_sheets.py --count 10000 --out /tmp/sheets
+    python samples/generate_sheets.py --template roll_20 --count 500 --format jpg --workers 4
+    python samples/generate_sheets.py --rotation 0 --perspective 0 --noise 0 --margin 0   # clean flatbed scans
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+import cv2
+import numpy as np
+
+SAMPLES_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SAMPLES_DIR, '..', 'backend'))
+from omr_engine import get_template_registry
+
+# Sheet size in pixels (roughly A4 at 120 dpi) and the desk around it
+SHEET_WIDTH = 1000
+SHEET_HEIGHT = 1414
+DEFAULT_MARGIN = 60
+BACKGROUND = 70
+
+# Sheets rendered per array operation inside a worker
+BATCH_SIZE = 16
+
+# Most sheets handed to a worker at once (fewer when there are few per worker)
+MAX_CHUNK_SIZE = 64
+
+# Question number labels end this far left of the first bubble (fraction of width)
+LABEL_GAP = 0.01
+
+# Sensor noise is cut from one pre-drawn field at a random offset per sheet;
+# drawing fresh Gaussian noise for every sheet would cost more than the rest
+NOISE_PAD = 64
+
+# Light pencil marks: lighter graphite covering most of the bubble, with grain
+PENCIL_SCALE = 0.85
+PENCIL_GRAIN = 12
+
+
+class SheetRenderer:
+    """A template rendered once, plus the pixel offsets needed to mark it"""
+    
+    def __init__(self, template_name: str, width: int = SHEET_WIDTH, height: int = SHEET_HEIGHT,
+                 margin: int = DEFAULT_MARGIN):
+        template = get_template_registry().get(template_name)
+        if template is None:
+            raise ValueError(f"Template {template_name} not found")
+        
+        self.template = template
+        self.options = list(template.options)
+        self.fields = list(template.fields.items())
+        self.margin = margin
+        self.shape = (height + 2 * margin, width + 2 * margin)
+        self._noise_bank = {}
+        
+        scale = np.array([width, height, width, height], dtype=np.float32)
+        boxes = template.sheet_boxes * scale  # Answers, then every field, as pixels
+        
+        # One filled bubble, as flat offsets into the canvas from its top-left corner
+        _, _, w, h = boxes[0]
+        axes = (max(1, int(w / 2) - 1), max(1, int(h / 2) - 1))
+        mask = np.zeros((2 * axes[1] + 1, 2 * axes[0] + 1), np.uint8)
+        cv2.ellipse(mask, axes, axes, 0, 0, 360, 1, -1)
+        dy, dx = np.nonzero(mask)
+        self.offsets = (dy * self.shape[1] + dx).astype(np.int64)
+        
+        # The same, for a pencil mark that leaves a rim of the bubble unfilled
+        mask[:] = 0
+        pencil_axes = (max(1, int(axes[0] * PENCIL_SCALE)), max(1, int(axes[1] * PENCIL_SCALE)))
+        cv2.ellipse(mask, axes, pencil_axes, 0, 0, 360, 1, -1)
+        dy, dx = np.nonzero(mask)
+        self.pencil_offsets = (dy * self.shape[1] + dx).astype(np.int64)
+        
+        centers = np.rint(boxes[:, :2] + boxes[:, 2:] / 2).astype(np.int64)
+        top_left = centers - np.array(axes) + margin
+        self.origins = top_left[:, 1] * self.shape[1] + top_left[:, 0]
+        
+        sheet = np.full((height, width), 255, np.uint8)
+        for (cx, cy) in centers:
+            cv2.ellipse(sheet, (int(cx), int(cy)), axes, 0, 0, 360, 0, 1)
+        
+        font_scale = max(0.35, min(0.6, template.bubble_boxes[0, 0, 3] * height / 30))
+        cv2.putText(sheet, 'OMR ANSWER SHEET', (int(width * 0.35), int(height * 0.06)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.9, 0, 2, cv2.LINE_AA)
+        for question in range(template.num_questions):
+            x, y, _, h = template.bubble_boxes[question, 0] * scale
+            label = f"{question + 1}."
+            (text_width, text_height), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, 1)
+            origin = (int(x - LABEL_GAP * width - text_width), int(y + h / 2 + text_height / 2))
+            cv2.putText(sheet, label, origin, cv2.FONT_HERSHEY_SIMPLEX, font_scale, 0, 1, cv2.LINE_AA)
+        
+        self.base = np.full(self.shape, BACKGROUND, np.uint8)
+        self.base[margin:margin + height, margin:margin + width] = sheet
+        
+        # Bubble index of (question, option) and of (field, column, value) in `origins`
+        num_options = len(self.options)
+        self.answer_index = np.arange(template.num_questions * num_options).reshape(-1, num_options)
+        self.field_index = {}
+        for name, field in self.fields:
+            self.field_index[name] = np.arange(field.start, field.stop).reshape(field.boxes.shape[:2])
+    
+    def draw(self, index: int, seed: int, blank_rate: float, rotation: float, perspective: float,
+             noise: float, blur: float, pencil: bool = False, erasure_rate: float = 0.0,
+             rng: Optional[np.random.Generator] = None) -> Dict:
+        """Random choices for sheet `index` (everything that makes the sheet)
+        
+        `pencil` marks in light graphite instead of ink; `erasure_rate` is
+        the share of questions with a faint erased mark on another option.
+        `rng` replaces the (seed, index) generator; `seed` still selects the
+        noise field.
+        """
+        if rng is None:
+            rng = np.random.default_rng([seed, index])
+        num_questions, num_options = self.answer_index.shape
+        
+        choices = rng.integers(0, num_options, num_questions)
+        choices[rng.random(num_questions) < blank_rate] = -1
+        field_choices = {name: rng.integers(0, len(field.values), field.length) for name, field in self.fields}
+        ink = rng.integers(115, 150, num_questions) if pencil else rng.integers(10, 60, num_questions)
+        
+        return {
+            'choices': choices,
+            'field_choices': field_choices,
+            'ink': ink.astype(np.uint8),
+            'angle': float(rng.uniform(-rotation, rotation)) if rotation else 0.0,
+            'corner_shift': rng.uniform(-perspective, perspective, (4, 2)) if perspective else None,
+            'gain': float(rng.uniform(0.9, 1.05)),
+            'offset': float(rng.uniform(-10, 10)),
+            'noise': noise,
+            'noise_window': tuple(rng.integers(0, NOISE_PAD, 2)),
+            'seed': seed,
+            'blur': float(rng.uniform(0, blur)) if blur else 0.0,
+            'pencil': pencil,
+            'erasures': self._draw_erasures(choices, erasure_rate, rng) if erasure_rate else None
+        }
+    
+    def _draw_erasures(self, choices: np.ndarray, rate: float, rng: np.random.Generator) -> np.ndarray:
+        """Per question, an option (not the answer) with an erased mark, or -1"""
+        num_options = self.answer_index.shape[1]
+        erasures = np.full(len(choices), -1)
+        if num_options > 1:
+            erased = np.nonzero(rng.random(len(choices)) < rate)[0]
+            shift = rng.integers(1, num_options, len(erased))
+            erasures[erased] = (np.maximum(choices[erased], 0) + shift) % num_options
+        return erasures
+    
+    def render_batch(self, draws: List[Dict]) -> np.ndarray:
+        """Stamp the marks of every draw into copies of the base image and distort them"""
+        count = len(draws)
+        pixels = self.shape[0] * self.shape[1]
+        batch = np.broadcast_to(self.base, (count,) + self.shape).copy()
+        flat = batch.reshape(-1)
+        
+        # Erased marks: a faint full bubble under whatever is marked later
+        for sheet_index, draw in enumerate(draws):
+            if draw['erasures'] is not None:
+                question = np.nonzero(draw['erasures'] >= 0)[0]
+                bubbles = self.answer_index[question, draw['erasures'][question]]
+                shade = 195 + question % 31  # 195-225, varying per question
+                flat[(sheet_index * pixels + self.origins[bubbles])[:, None] + self.offsets] = shade[:, None]
+        
+        # Answer marks: (sheet, question) -> bubble origin, + stamp offsets
+        choices = np.stack([draw['choices'] for draw in draws])
+        ink = np.stack([draw['ink'] for draw in draws])
+        pencil = np.array([draw['pencil'] for draw in draws])
+        sheet_index, question = np.nonzero(choices >= 0)
+        bubbles = self.answer_index[question, choices[sheet_index, question]]
+        for offsets, selected in ((self.offsets, ~pencil[sheet_index]), (self.pencil_offsets, pencil[sheet_index])):
+            if selected.any():
+                targets = (sheet_index[selected] * pixels + self.origins[bubbles[selected]])[:, None] + offsets
+                flat[targets] = ink[sheet_index[selected], question[selected]][:, None]
+        
+        # Field marks (always filled, in the darkest ink of the sheet)
+        for name, field in self.fields:
+            columns = np.stack([draw['field_choices'][name] for draw in draws])
+            bubbles = self.field_index[name][np.arange(field.length), columns]
+            origins = np.arange(count)[:, None] * pixels + self.origins[bubbles]
+            flat[(origins.reshape(-1, 1) + self.offsets)] = ink.min(axis=1).repeat(field.length)[:, None]
+        
+        # Geometry (one homography per sheet), blur, exposure and noise
+        height, width = self.shape
+        levels = np.arange(256, dtype=np.float32)
+        corners = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+        for sheet, draw in zip(batch, draws):
+            if draw['pencil']:
+                # Graphite grain over the marks and printing
+                dy, dx = draw['noise_window']
+                grain = self.noise_bank(draw['seed'], PENCIL_GRAIN)[dy:dy + height, dx:dx + width]
+                marked = sheet < 200
+                sheet[marked] = np.clip(sheet[marked] + grain[marked], 0, 255)
+            
+            if draw['angle'] or draw['corner_shift'] is not None:
+                rotation = cv2.getRotationMatrix2D((width / 2, height / 2), draw['angle'], 1.0)
+                moved = cv2.transform(corners[None], rotation)[0]
+                if draw['corner_shift'] is not None:
+                    moved = moved + draw['corner_shift'] * np.float32([width, height])
+                matrix = cv2.getPerspectiveTransform(corners, moved.astype(np.float32))
+                sheet[:] = cv2.warpPerspective(sheet, matrix, (width, height),
+                                               borderMode=cv2.BORDER_CONSTANT, borderValue=BACKGROUND)
+            if draw['blur']:
+                sheet[:] = cv2.GaussianBlur(sheet, (0, 0), draw['blur'])
+            
+            # Exposure (a lookup table) and sensor noise, saturating in uint8
+            lut = np.clip(levels * draw['gain'] + draw['offset'], 0, 255).astype(np.uint8)
+            cv2.LUT(sheet, lut, dst=sheet)
+            if draw['noise']:
+                dy, dx = draw['noise_window']
+                noise = self.noise_bank(draw['seed'], draw['noise'])[dy:dy + height, dx:dx + width]
+                cv2.add(sheet, noise, dst=sheet, dtype=cv2.CV_8U)
+        return batch
+    
+    def noise_bank(self, seed: int, sigma: float) -> np.ndarray:
+        """Gaussian noise slightly larger than a sheet, the same in every process"""
+        bank = self._noise_bank.get((seed, sigma))
+        if bank is None:
+            rng = np.random.default_rng([seed, 0x6e6f697365])
+            shape = (self.shape[0] + NOISE_PAD, self.shape[1] + NOISE_PAD)
+            noise = rng.standard_normal(shape, dtype=np.float32) * np.float32(sigma)
+            bank = self._noise_bank[(seed, sigma)] = np.rint(noise).astype(np.int16)
+        return bank
+    
+    def ground_truth(self, draw: Dict) -> Dict:
+        answers = [self.options[c] if c >= 0 else '' for c in draw['choices'].tolist()]
+        fields = {
+            name: ''.join(field.values[c] for c in draw['field_choices'][name].tolist())
+            for name, field in self.fields
+        }
+        truth = {'template': self.template.name, 'answers': answers, 'fields': fields,
+                 'rotation': round(draw['angle'], 3)}
+        if draw['corner_shift'] is not None:
+            truth['corner_shift'] = np.round(draw['corner_shift'], 4).tolist()
+        if draw['blur']:
+            truth['blur'] = round(draw['blur'], 3)
+        if draw['pencil']:
+            truth['pencil'] = True
+        if draw['erasures'] is not None:
+            truth['erased_questions'] = int((draw['erasures'] >= 0).sum())
+        return truth
+
+
+# Worker process state: the renderer is built once per process
+_renderer: Optional[SheetRenderer] = None
+_settings: Dict = {}
+
+
+def _init_worker(template_name: str, margin: int, settings: Dict):
+    cv2.setNumThreads(1)  # Parallelism comes from the processes
+    _use_renderer(SheetRenderer(template_name, margin=margin), settings)
+
+
+def _use_renderer(renderer: SheetRenderer, settings: Dict):
+    global _renderer, _settings
+    _renderer = renderer
+    _settings = settings
+
+
+def _render_chunk(indices: List[int]) -> List[Dict]:
+    """Render, encode and write sheets `indices`; returns their ground truth"""
+    settings = _settings
+    extension = '.jpg' if settings['format'] == 'jpg' else '.png'
+    params = ([cv2.IMWRITE_JPEG_QUALITY, settings['quality']] if extension == '.jpg'
+              else [cv2.IMWRITE_PNG_COMPRESSION, 1])
+    
+    records = []
+    for start in range(0, len(indices), BATCH_SIZE):
+        batch_indices = indices[start:start + BATCH_SIZE]
+        draws = [
+            _renderer.draw(index, settings['seed'], settings['blank_rate'], settings['rotation'],
+                           settings['perspective'], settings['noise'], settings['blur'])
+            for index in batch_indices
+        ]
+        for index, draw, image in zip(batch_indices, draws, _renderer.render_batch(draws)):
+            filename = f"sheet_{index:06d}{extension}"
+            if not cv2.imwrite(os.path.join(settings['out'], filename), image, params):
+                raise OSError(f"Could not write {filename}")
+            records.append(dict(_renderer.ground_truth(draw), file=filename))
+    return records
+
+
+def generate(template_name: str, count: int, out_dir: str, seed: int = 0, workers: Optional[int] = None,
+             image_format: str = 'jpg', quality: int = 90, margin: int = DEFAULT_MARGIN,
+             blank_rate: float = 0.05, rotation: float = 2.0, perspective: float = 0.01,
+             noise: float = 4.0, blur: float = 0.0, chunk_size: Optional[int] = None) -> List[Dict]:
+    """
+    Write `count` sheets and answers.jsonl to `out_dir`
+    
+    Args:
+        rotation: Largest rotation in degrees (uniform in +-rotation)
+        perspective: Largest corner shift as a fraction of the image
+        noise: Standard deviation of the Gaussian sensor noise
+        blur: Largest Gaussian blur sigma (0: no blur)
+        chunk_size: Sheets per worker task (default: count / workers, at
+            most MAX_CHUNK_SIZE)
+    
+    Returns:
+        Ground truth per sheet, in index order
+    """
+    if image_format not in ('png', 'jpg'):
+        raise ValueError(f"Unknown image format: {image_format}")
+    os.makedirs(out_dir, exist_ok=True)
+    settings = {
+        'out': out_dir, 'seed': seed, 'format': image_format, 'quality': quality,
+        'blank_rate': blank_rate, 'rotation': rotation, 'perspective': perspective,
+        'noise': noise, 'blur': blur
+    }
+    
+    # Fails on an unknown template here rather than in every worker
+    renderer = SheetRenderer(template_name, margin=margin)
+    
+    workers = workers or os.cpu_count() or 1
+    chunk_size = chunk_size or max(1, min(MAX_CHUNK_SIZE, -(-count // workers)))
+    chunks = [list(range(start, min(start + chunk_size, count))) for start in range(0, count, chunk_size)]
+    if workers == 1 or len(chunks) == 1:
+        _use_renderer(renderer, settings)
+        results = [_render_chunk(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(template_name, margin, settings)) as pool:
+            results = list(pool.map(_render_chunk, chunks))
+    
+    records = [record for chunk in results for record in chunk]
+    with open(os.path.join(out_dir, 'answers.jsonl'), 'w') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic OMR sheets in bulk')
+    parser.add_argument('--template', default='default', help='Template name (default: default)')
+    parser.add_argument('--count', type=int, default=1000, help='Number of sheets (default: 1000)')
+    parser.add_argument('--out', default='generated', help='Output directory (default: ./generated)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+    parser.add_argument('--format', choices=('png', 'jpg'), default='jpg',
+                        help='Image format (default: jpg; png is lossless but several times slower to write)')
+    parser.add_argument('--quality', type=int, default=90, help='JPEG quality (default: 90)')
+    parser.add_argument('--margin', type=int, default=DEFAULT_MARGIN,
+                        help=f'Background pixels around the sheet; 0 for flatbed scans (default: {DEFAULT_MARGIN})')
+    parser.add_argument('--blank-rate', type=float, default=0.05, help='Share of unanswered questions')
+    parser.add_argument('--rotation', type=float, default=2.0, help='Largest rotation in degrees (default: 2)')
+    parser.add_argument('--perspective', type=float, default=0.01,
+                        help='Largest corner shift as a fraction of the image (default: 0.01)')
+    parser.add_argument('--noise', type=float, default=4.0, help='Sensor noise standard deviation (default: 4)')
+    parser.add_argument('--blur', type=float, default=0.0, help='Largest blur sigma (default: 0, off)')
+    args = parser.parse_args()
+    
+    started = time.perf_counter()
+    try:
+        generate(args.template, args.count, args.out, seed=args.seed, workers=args.workers,
+                 image_format=args.format, quality=args.quality, margin=args.margin,
+                 blank_rate=args.blank_rate, rotation=args.rotation, perspective=args.perspective,
+                 noise=args.noise, blur=args.blur)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    elapsed = time.perf_counter() - started
+    
+    print(f"{args.count} sheet(s) for template {args.template} in {args.out} "
+          f"({elapsed:.1f}s, {args.count / elapsed * 60:.0f} sheets/min)")
+    print(f"Ground truth: {os.path.join(args.out, 'answers.jsonl')}")
+
+
+if __name__ == '__main__':
+    main()